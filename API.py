@@ -1,69 +1,330 @@
-import curl_cffi
 from curl_cffi import requests
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from concurrent.futures import Future
 import secrets
+import time
 import string
+import re
+import asyncio
+from urllib.parse import urlencode
 from datetime import datetime, timedelta, timezone
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 from utils.logger_utils import logger
-from utils.wallet import EthereumAccountManager
+from utils.wallet import Signer
 from utils.captcha import capsolver
+from utils.captcha_pool import CaptchaPool
+from utils.signing_service import SigningService
+from utils.session_pool import SessionPool, get_session_pool
+from utils.proxy_pool import ProxyPool
+from utils.rate_limiter import AdaptiveRateLimiter, THROTTLE_STATUS
+from utils.concurrency_limiter import GradientLimiter
+from utils.circuit_breaker import BreakerRegistry, CircuitOpenError
+from utils.server_clock import ServerClock
+from utils.retry import HumanityAPIError, AuthExpiredError, CaptchaError
+from utils.JWT_utils import get_token_exp, parse_next_daily_award
 from database import AccountDatabase
+from config import CAPTCHA_POOL_WAIT, CAPSOLVER_API_URL
+
+# token剩余有效期小于该秒数时视为过期
+TOKEN_EXPIRY_MARGIN = 180
+
+# 默认请求头（同步与异步客户端共用）
+DEFAULT_HEADERS = {
+    'accept': '*/*',
+    'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
+    'access-control-allow-origin': 'https://terminal3.humanity.org/api',
+    'cache-control': 'no-cache',
+    'content-type': 'application/json',
+    'origin': 'https://testnet.humanity.org',
+    'pragma': 'no-cache',
+    'priority': 'u=1, i',
+    'referer': 'https://testnet.humanity.org/',
+    'sec-ch-ua': '"Chromium";v="136", "Microsoft Edge";v="136", "Not.A/Brand";v="99"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'same-site',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36 Edg/136.0.0.0',
+}
+
+# 授权跳转请求头
+AUTH_HEADERS = {
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
+    'cache-control': 'no-cache',
+    'pragma': 'no-cache',
+    'sec-ch-ua': '"Chromium";v="136", "Microsoft Edge";v="136", "Not.A/Brand";v="99"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'same-site',
+    'upgrade-insecure-requests': '1',
+    'referer': 'https://testnet.humanity.org/'
+}
+
+CLIENT_ID = '8Lr7zhdHSPWqLcEZaVDLeq7xYP4qAfyT'
+CONNECT_URL = 'https://terminal3.humanity.org/api/user/v3/connect'
+AUTHORIZE_URL = 'https://terminal3.humanity.org/v1/openidc/authorize'
+TOKEN_URL = 'https://terminal3.humanity.org/v1/openidc/token'
+LOGIN_URL = 'https://testnet.humanity.org/api/user/loginAndRegister'
+CHECK_URL = 'https://testnet.humanity.org/api/rewards/daily/check'
+CLAIM_URL = 'https://testnet.humanity.org/api/rewards/daily/claim'
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+# 签名登录依赖的上游：terminal3、testnet 接口和打码服务，任一熔断时不再开始打码
+LOGIN_DEPENDENCIES = (CONNECT_URL, LOGIN_URL, CAPSOLVER_API_URL)
+
+
+def build_sign_in_message(address: str, nonce: str, timestamp: str) -> Tuple[str, str]:
+    """
+    构建SIWE登录签名原文及connect接口所需的message字段
+
+    Args:
+        address: 钱包地址
+        nonce: 随机nonce
+        timestamp: ISO格式的签发时间
+
+    Returns:
+        (待签名原文, JSON格式的message)
+    """
+    sign_message = f"testnet.humanity.org wants you to sign in with your Ethereum account:\n{address}\n\nConnect to Humanity\n\nURI: https://testnet.humanity.org\nVersion: 1\nChain ID: 7080969\nNonce: {nonce}\nIssued At: {timestamp}"
+    message = json.dumps({
+        "domain": "testnet.humanity.org",
+        "address": address,
+        "statement": "Connect to Humanity",
+        "uri": "https://testnet.humanity.org",
+        "version": "1",
+        "chainId": 7080969,
+        "nonce": nonce,
+        "issuedAt": timestamp
+    })
+    return sign_message, message
+
+
+def build_authorize_url(token: str) -> str:
+    """构建terminal3授权地址"""
+    params = {
+        'client_id': CLIENT_ID,
+        'redirect_uri': 'https://testnet.humanity.org/dashboard',
+        'response_type': 'code',
+        'scope': 'openid',
+        'state': 't3',
+        'token': token
+    }
+    return f'{AUTHORIZE_URL}?{urlencode(params)}'
+
+
+def can_reuse_token(token: Optional[str]) -> bool:
+    """
+    判断数据库中保存的terminal3 token是否值得直接复用
+
+    只复用能解析出exp且离过期还有余量的token；解析不出exp的token无法判断是否仍有效，不复用
+    """
+    if not token:
+        return False
+    exp = get_token_exp(token)
+    if exp is None:
+        return False
+    return exp - int(time.time()) > TOKEN_EXPIRY_MARGIN
+
+
+def extract_code_from_location(location: Optional[str]) -> Optional[str]:
+    """从重定向地址中提取授权码"""
+    if location and 'code=' in location:
+        return location.split('code=')[1].split('&')[0]
+    return None
+
+
+class _WalletMixin:
+    """同步/异步客户端共用的账号初始化逻辑，钱包对象在首次签名时才创建"""
+
+    def _init_wallet(self, private_key: Optional[str], address: Optional[str], register: bool = True):
+        """
+        Args:
+            register: 推导出地址后是否立即添加到数据库；异步客户端在首次请求前放到线程中添加
+        """
+        self.private_key = private_key
+        self._wallet = None
+        self._register_pending = False
+        if private_key and not address:
+            # 未提供地址时才从私钥推导，并尝试添加账号到数据库
+            self._wallet = Signer(private_key)
+            address = self._wallet.address
+            if register:
+                self.db.add_account(address, private_key)
+            else:
+                self._register_pending = True
+        self.address = address
+
+    def _record_response(self, url: str, response, latency: float, proxy: Optional[str]):
+        """把响应计入代理评分、接口限速和并发上限，Date 头用于校准服务端时钟"""
+        if self.server_clock is not None:
+            received_at = time.time()
+            self.server_clock.observe(response.headers.get('date'), received_at - latency, received_at, url)
+        # 407 表示代理认证失败，同样算作代理的问题
+        self._record_proxy(proxy, response.status_code != 407, latency)
+        if self.breakers is not None and response.status_code != 407:
+            self.breakers.record(url, response.status_code < 500)
+        if self.rate_limiter is not None:
+            self.rate_limiter.feedback(url, response.status_code, latency, response.headers.get('retry-after'))
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.sample(latency, response.status_code not in THROTTLE_STATUS)
+
+    def _record_error(self, url: str, latency: float, proxy: Optional[str]):
+        self._record_proxy(proxy, False)
+        if self.breakers is not None:
+            self.breakers.record(url, False)
+        if self.rate_limiter is not None:
+            self.rate_limiter.feedback(url, error=True)
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.sample(latency, False)
+
+    def _record_proxy(self, proxy: Optional[str], ok: bool, latency: Optional[float] = None):
+        """把请求结果计入代理评分"""
+        if self.proxy_pool is not None and proxy:
+            self.proxy_pool.record(proxy, ok, latency)
+
+    def _raise_for_status(self, response, client_error: Optional[type] = None):
+        """
+        把错误状态码转换为可分类的异常，供调度方决定是否重试
+
+        Args:
+            response: 接口响应
+            client_error: 4xx（429除外）时抛出的异常类型，默认 401/403 为 AuthExpiredError，其余为 HumanityAPIError
+        """
+        status = response.status_code
+        if status < 400:
+            return
+        message = f"API请求失败: {status} - {response.text[:200]}"
+        if status in THROTTLE_STATUS or status >= 500:
+            raise HumanityAPIError(message, status, response.headers.get('retry-after'))
+        if client_error is None:
+            client_error = AuthExpiredError if status in (401, 403) else HumanityAPIError
+        raise client_error(message, status)
+
+    def _preflight(self):
+        """签名登录前检查上游依赖，任一熔断时抛出 CircuitOpenError，不浪费打码"""
+        if self.breakers is not None:
+            self.breakers.ensure_available(*LOGIN_DEPENDENCIES)
+
+    def _sign(self, message: str) -> Future:
+        """签名服务可用时交给进程池签名，否则在当前线程签名"""
+        if self.signing_service is not None:
+            return self.signing_service.submit(self.address, message)
+        future = Future()
+        future.set_result(self.wallet.sign_message(message))
+        return future
+
+    @property
+    def wallet(self) -> Optional[Signer]:
+        if self._wallet is None:
+            private_key = self.private_key
+            if not private_key and self.address:
+                # 从数据库获取账号信息
+                account_data = self.db.get_account(self.address)
+                private_key = account_data['private_key'] if account_data else None
+            if private_key:
+                self._wallet = Signer(private_key)
+        return self._wallet
 
-class HumanityBotAPI:
+    def _record_next_claim(self, response_data: dict):
+        """记录接口返回的下次可领取时间，账号在此之前不会再被调度"""
+        next_claim_at = parse_next_daily_award(response_data.get('next_daily_award'))
+        if next_claim_at and next_claim_at > time.time():
+            self.db.update_next_claim_at(self.address, next_claim_at)
+        return next_claim_at
+
+
+class HumanityBotAPI(_WalletMixin):
     def __init__(
         self,
         base_url: str = "https://api.example.com",
         timeout: int = 30,
         private_key: Optional[str] = None,
-        db: Optional[AccountDatabase] = None
+        db: Optional[AccountDatabase] = None,
+        captcha_pool: Optional[CaptchaPool] = None,
+        address: Optional[str] = None,
+        signing_service: Optional[SigningService] = None,
+        session_pool: Optional[SessionPool] = None,
+        proxy: Optional[str] = None,
+        proxy_pool: Optional[ProxyPool] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        concurrency_limiter: Optional[GradientLimiter] = None,
+        breakers: Optional[BreakerRegistry] = None,
+        server_clock: Optional[ServerClock] = None
     ):
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
-        
-        # 设置默认请求头
-        self.headers = {
-            'accept': '*/*',
-            'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
-            'access-control-allow-origin': 'https://terminal3.humanity.org/api',
-            'cache-control': 'no-cache',
-            'content-type': 'application/json',
-            'origin': 'https://testnet.humanity.org',
-            'pragma': 'no-cache',
-            'priority': 'u=1, i',
-            'referer': 'https://testnet.humanity.org/',
-            'sec-ch-ua': '"Chromium";v="136", "Microsoft Edge";v="136", "Not.A/Brand";v="99"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'sec-fetch-dest': 'empty',
-            'sec-fetch-mode': 'cors',
-            'sec-fetch-site': 'same-site',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36 Edg/136.0.0.0',
-        }
-            
-        # 初始化HTTP客户端
-        self.http_client = requests.Session()
-        self.http_client.headers.update(self.headers)
-        
-        # 初始化数据库
+        self.captcha_pool = captcha_pool
+        self.signing_service = signing_service
+        self.proxy_pool = proxy_pool
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.breakers = breakers
+        self.server_clock = server_clock
+
+        # HTTP会话从会话池借用，复用已建立的连接
+        self.session_pool = session_pool or get_session_pool()
+        self.http_client = None
+
+        # 初始化数据库，外部传入的实例由调用方负责关闭
+        self._owns_db = db is None
         self.db = db or AccountDatabase()
-        
-        # 初始化钱包
-        if private_key:
-            self.wallet = EthereumAccountManager(private_key=private_key)
-            self.address = self.wallet.address
-            # 尝试添加账号到数据库
-            self.db.add_account(self.address, private_key)
-        else:
-            self.wallet = None
-            self.address = None
-            
+
+        self._bind_account(private_key, address, proxy)
+
+    def _bind_account(self, private_key: Optional[str], address: Optional[str], proxy: Optional[str]):
+        # 每个账号使用独立的请求头，会话中的cookie在归还时清空
+        self.headers = dict(DEFAULT_HEADERS)
+        self.proxy = proxy
+        self.http_client = self.session_pool.acquire(proxy)
+
+        # 初始化钱包；已知地址时（来自数据库）不再推导地址
+        self._init_wallet(private_key, address)
+
         self.token = None
         self.code = None
         self.hpToken = None
 
+    def reset(self, private_key: Optional[str] = None, address: Optional[str] = None, proxy: Optional[str] = None):
+        """复用客户端对象处理下一个账号：归还当前会话，重新绑定账号"""
+        self.release()
+        self._bind_account(private_key, address, proxy)
+        return self
+
+    def release(self, discard: bool = False):
+        """把会话归还会话池"""
+        if self.http_client is not None:
+            self.session_pool.release(self.http_client, self.proxy, discard=discard)
+            self.http_client = None
+
+    def _request(self, method: str, url: str, headers: Optional[dict] = None, **kwargs):
+        """所有请求的统一出口：按接口限速，带上当前账号的请求头，并把结果计入代理评分和限速"""
+        kwargs.setdefault('timeout', self.timeout)
+        headers = headers or self.headers
+        return self._send(self.http_client, self.proxy, method, url, headers, kwargs)
+
+    def _send(self, session, proxy: Optional[str], method: str, url: str, headers: dict, kwargs: dict):
+        if self.breakers is not None:
+            self.breakers.guard(url)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        start = time.time()
+        try:
+            response = session.request(method, url, headers=headers, **kwargs)
+        except requests.RequestsError:
+            self._record_error(url, time.time() - start, proxy)
+            raise
+        self._record_response(url, response, time.time() - start, proxy)
+        return response
+
+    def set_hp_token(self, hp_token: str):
+        """使用已有的hp_token，跳过登录"""
+        self.hpToken = hp_token
+        self.headers.update({'authorization': f'Bearer {hp_token}', 'token': hp_token})
+
     def _make_url(self, endpoint: str) -> str:
         """
         构建完整的API URL
@@ -111,34 +372,36 @@ class HumanityBotAPI:
         charset = string.ascii_letters + string.digits  # 等同于 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
         return ''.join(secrets.choice(charset) for _ in range(length))
 
+    def solve_captcha(self) -> Optional[str]:
+        """
+        获取reCAPTCHA token：优先从预打码池取，池不可用或等待超时时直接打码
+
+        Returns:
+            token 字符串，失败时返回 None
+        """
+        if self.captcha_pool is not None:
+            cap_res = self.captcha_pool.get(timeout=CAPTCHA_POOL_WAIT)
+            if cap_res:
+                return cap_res
+            logger.info(f"[{self.address}] 预打码池等待超时，改为直接打码")
+        return capsolver()
+
 
     def collect(self):
+        res = None
         try:
-            # 从数据库获取账号信息
-            if not self.wallet and self.address:
-                account_data = self.db.get_account(self.address)
-                if account_data:
-                    self.wallet = EthereumAccountManager(private_key=account_data['private_key'])
-            
             nonce = self.get_nonce()
             timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
 
-            sign_message = f"testnet.humanity.org wants you to sign in with your Ethereum account:\n{self.address}\n\nConnect to Humanity\n\nURI: https://testnet.humanity.org\nVersion: 1\nChain ID: 7080969\nNonce: {nonce}\nIssued At: {timestamp}"
-            signature = self.wallet.sign_message(sign_message)
-            
-            cap_res = capsolver()
+            sign_message, message = build_sign_in_message(self.address, nonce, timestamp)
+            # 签名在进程池中进行，与打码同时等待
+            signature_future = self._sign(sign_message)
+
+            cap_res = self.solve_captcha()
+            signature = signature_future.result()
             if cap_res is None:
                 logger.info("打码失败，请检查config.py的CAPTCHA_SOLVER_API_KEY是否正确")
-            message = json.dumps({
-                "domain": "testnet.humanity.org",
-                "address": self.address,
-                "statement": "Connect to Humanity",
-                "uri": "https://testnet.humanity.org",
-                "version": "1",
-                "chainId": 7080969,
-                "nonce": nonce,
-                "issuedAt": timestamp
-            })
+                raise CaptchaError("打码失败")
             json_data = {
                 'message': message,
                 'signature': signature,
@@ -148,11 +411,13 @@ class HumanityBotAPI:
                 'method': 'wallet',
                 'recaptcha_token': cap_res,
             }
-            res = self.http_client.post(url='https://terminal3.humanity.org/api/user/v3/connect', json=json_data)
+            res = self._request('POST', CONNECT_URL, json=json_data)
+            # connect 被拒绝时按验证码失败处理，重试时重新打码
+            self._raise_for_status(res, CaptchaError)
             response_data = res.json()
             self.token = response_data.get('data', {}).get('token')
             if not self.token:
-                raise Exception("Failed to get token from response")
+                raise HumanityAPIError("Failed to get token from response")
                 
             # 更新数据库中的token
             self.db.update_tokens(self.address, token=self.token)
@@ -160,72 +425,68 @@ class HumanityBotAPI:
             return True
         except Exception as e:
             logger.error(f"收集过程中出错: {str(e)}")
-            logger.error(f"响应状态码: {res.status_code}")
-            logger.error(f"响应内容: {res.text[:500]}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+                logger.error(f"响应内容: {res.text[:500]}")
             raise
 
 
-    def auth(self):
-        # 设置请求头，包含所有必要的信息
-        headers = {
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
-            'cache-control': 'no-cache',
-            'pragma': 'no-cache',
-            'sec-ch-ua': '"Chromium";v="136", "Microsoft Edge";v="136", "Not.A/Brand";v="99"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'sec-fetch-dest': 'document',
-            'sec-fetch-mode': 'navigate',
-            'sec-fetch-site': 'same-site',
-            'upgrade-insecure-requests': '1',
-            'referer': 'https://testnet.humanity.org/'
-        }
-
-
-        # 构造请求参数
-        params = {
-            'client_id': '8Lr7zhdHSPWqLcEZaVDLeq7xYP4qAfyT',
-            'redirect_uri': 'https://testnet.humanity.org/dashboard',
-            'response_type': 'code',
-            'scope': 'openid',
-            'state': 't3',
-            'token': self.token
-        }
+    def login(self, stored_token: Optional[str] = None):
+        """
+        登录并获取hp_token
 
-        # 构造完整的URL
-        from urllib.parse import urlencode
-        url = f'https://terminal3.humanity.org/v1/openidc/authorize?{urlencode(params)}'
+        优先复用数据库中未过期的terminal3 token，直接走 auth() -> loginAndRegister()，
+        省去签名和打码；复用失败时再走完整的 collect() 流程
+
+        Args:
+            stored_token: 已读取的terminal3 token，为空时从数据库读取
+        """
+        if stored_token is None:
+            account_data = self.db.get_account(self.address)
+            stored_token = account_data.get('token') if account_data else None
+
+        if can_reuse_token(stored_token):
+            self.token = stored_token
+            try:
+                self.auth()
+                self.loginAndRegister()
+                logger.info(f"[{self.address}] 复用terminal3 token登录成功")
+                return True
+            except Exception as e:
+                logger.info(f"[{self.address}] 复用terminal3 token失败，重新签名登录: {str(e)}")
 
-        # # 创建新的请求会话，禁用自动重定向
-        # import curl_cffi.requests as requests
-        new_session = requests.Session()
-        new_session.headers.update(headers)
+        self._preflight()
+        self.collect()
+        self.auth()
+        self.loginAndRegister()
+        return True
+
+    def auth(self):
+        # 构造完整的URL
+        url = build_authorize_url(self.token)
 
         # 尝试两种方式获取授权码
         try:
-            # 首先尝试直接获取重定向URL
-            new_session.curl.setopt(curl_cffi.CurlOpt.FOLLOWLOCATION, 0)
-            response = new_session.get(url, allow_redirects=False)
+            # 首先尝试直接获取重定向URL（与其他请求共用会话，禁用自动重定向）
+            response = self._request('GET', url, headers=AUTH_HEADERS, allow_redirects=False)
 
             # 检查是否有重定向
-            if response.status_code in [301, 302, 303, 307, 308]:
-                location = response.headers.get('location')
-                if location and 'code=' in location:
-                    code = location.split('code=')[1].split('&')[0]
+            if response.status_code in REDIRECT_STATUS:
+                code = extract_code_from_location(response.headers.get('location'))
+                if code:
                     # print("从重定向获取到 Authorization Code:", code)
                     self.code = code
                     return code
 
             # 如果没有重定向，尝试发送带有token的POST请求
-            post_url = 'https://terminal3.humanity.org/v1/openidc/token'
+            post_url = TOKEN_URL
             post_data = {
                 'grant_type': 'authorization_code',
-                'client_id': '8Lr7zhdHSPWqLcEZaVDLeq7xYP4qAfyT',
+                'client_id': CLIENT_ID,
                 'token': self.token
             }
             
-            token_response = new_session.post(post_url, json=post_data)
+            token_response = self._request('POST', post_url, headers=AUTH_HEADERS, json=post_data)
             if token_response.status_code == 200:
                 token_data = token_response.json()
                 if 'access_token' in token_data:
@@ -233,18 +494,19 @@ class HumanityBotAPI:
                     return token_data['access_token']
             
             # 如果以上方法都失败，尝试从URL参数中获取code
-            import re
             html_content = response.text
             code_match = re.search(r'code=([^&"\']+)', html_content)
             if code_match:
                 code = code_match.group(1)
                 print("从HTML内容中获取到 Authorization Code:", code)
-                self.http_client.headers.update({'referer': f'https://testnet.humanity.org/dashboard?code={code}&state=t3'})
+                self.headers.update({'referer': f'https://testnet.humanity.org/dashboard?code={code}&state=t3'})
                 self.code = code
                 return code
             
-            raise Exception("无法获取授权码或访问令牌")
-            
+            raise HumanityAPIError("无法获取授权码或访问令牌")
+
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"认证过程中出错: {str(e)}")
             print("响应状态码:", response.status_code if 'response' in locals() else 'N/A')
@@ -253,15 +515,18 @@ class HumanityBotAPI:
             raise Exception("认证失败") from e
 
     def loginAndRegister(self):
+        res = None
         try:
             json_data = {
                 'code': self.code,
             }
-            res = self.http_client.post(url='https://testnet.humanity.org/api/user/loginAndRegister', json=json_data)
+            res = self._request('POST', LOGIN_URL, json=json_data)
+            self._raise_for_status(res, AuthExpiredError)
             response_data = res.json()
-            self.hpToken = response_data.get('data', {}).get('token')
-            self.http_client.headers.update({'authorization': f'Bearer {self.hpToken}'})
-            self.http_client.headers.update({'token': self.hpToken})
+            hp_token = response_data.get('data', {}).get('token')
+            if not hp_token:
+                raise HumanityAPIError("Failed to get hp_token from response")
+            self.set_hp_token(hp_token)
             
             # 更新数据库中的hp_token
             self.db.update_tokens(self.address, hp_token=self.hpToken)
@@ -269,14 +534,18 @@ class HumanityBotAPI:
             return True
         except Exception as e:
             logger.error(f"登录失败: {str(e)}")
-            logger.error(f"响应状态码: {res.status_code}")
-            logger.error(f"响应内容: {res.text[:500]}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+                logger.error(f"响应内容: {res.text[:500]}")
             raise 
 
     def check(self):
+        res = None
         try:
             json_data = {}
-            res = self.http_client.post('https://testnet.humanity.org/api/rewards/daily/check', json=json_data)
+            # check 是只读查询，可以对冲
+            res = self._request('POST', CHECK_URL, json=json_data)
+            self._raise_for_status(res)
             response_data = res.json()
             message = response_data.get('message')
             available = response_data.get('available')
@@ -284,40 +553,41 @@ class HumanityBotAPI:
             amount = response_data.get('amount')
             next_daily_award = response_data.get('next_daily_award')
             print(message, available, amount, next_daily_award)
+            if not available:
+                self._record_next_claim(response_data)
             return available
         except Exception as e:
             logger.error(f"检查失败: {str(e)}")
-            logger.error(f"响应状态码: {res.status_code}")
-            logger.error(f"响应内容: {res.text[:500]}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+                logger.error(f"响应内容: {res.text[:500]}")
             raise
 
-    @retry(
-        stop=stop_after_attempt(3),  # 最多重试3次
-        wait=wait_exponential(multiplier=1, min=4, max=10)  # 指数退避，等待时间在4-10秒之间
-    )
     def claim(self):
+        """领取奖励；失败时直接抛出，由调度方按失败分类决定是否延迟重试"""
+        res = None
         try:
             json_data = {}
-            res = self.http_client.post(
-                'https://testnet.humanity.org/api/rewards/daily/claim',
-                json=json_data,
-                timeout=30  # 添加超时设置
-            )
+            res = self._request('POST', CLAIM_URL, json=json_data)
+            self._raise_for_status(res)
             response_data = res.json()
             message = response_data.get('message')
             daily_claimed = response_data.get('daily_claimed')
             amount = response_data.get('amount')
             available = response_data.get('available')
             if not available:
-                # 更新数据库中的领取时间
+                # 更新数据库中的领取时间和下次可领取时间
+                next_claim_at = parse_next_daily_award(response_data.get('next_daily_award'))
                 if daily_claimed:
-                    self.db.update_claim_time(self.address)
+                    self.db.update_claim_time(self.address, next_claim_at=next_claim_at)
+                else:
+                    self._record_next_claim(response_data)
 
                 logger.info(f"[{self.address}] 领取成功: {message}, {daily_claimed}, {amount}")
                 return True
             else:
                 logger.info(f"[{self.address}] 领取失败: {message}")
-        except (requests.RequestTimeout, requests.ConnectionError) as e:
+        except requests.RequestsError as e:
             logger.error(f"网络请求错误: {str(e)}")
             raise
         except json.JSONDecodeError as e:
@@ -325,15 +595,294 @@ class HumanityBotAPI:
             raise
         except Exception as e:
             logger.error(f"领取过程中出错: {str(e)}")
-            logger.error(f"响应状态码: {res.status_code}")
-            logger.error(f"响应内容: {res.text[:500]}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+                logger.error(f"响应内容: {res.text[:500]}")
             raise
 
     def __del__(self):
-        if hasattr(self, 'db'):
+        if getattr(self, 'http_client', None) is not None:
+            self.release()
+        if getattr(self, '_owns_db', False):
             self.db.close()
 
 
+class AsyncHumanityBotAPI(_WalletMixin):
+    """
+    基于curl_cffi AsyncSession的异步客户端，流程与HumanityBotAPI一致，
+    供main_thread.py的asyncio模式使用，单进程可同时挂起大量账号流程
+    """
+
+    def __init__(
+        self,
+        timeout: int = 30,
+        private_key: Optional[str] = None,
+        db: Optional[AccountDatabase] = None,
+        session: Optional[requests.AsyncSession] = None,
+        captcha_pool: Optional[CaptchaPool] = None,
+        address: Optional[str] = None,
+        signing_service: Optional[SigningService] = None,
+        session_pool: Optional[SessionPool] = None,
+        proxy: Optional[str] = None,
+        proxy_pool: Optional[ProxyPool] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        concurrency_limiter: Optional[GradientLimiter] = None,
+        breakers: Optional[BreakerRegistry] = None,
+        server_clock: Optional[ServerClock] = None
+    ):
+        self.timeout = timeout
+        self.captcha_pool = captcha_pool
+        self.signing_service = signing_service
+        self.headers = dict(DEFAULT_HEADERS)
+        self.proxy = proxy
+        self.proxy_pool = proxy_pool
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.breakers = breakers
+        self.server_clock = server_clock
+
+        # 外部传入的AsyncSession由调用方负责关闭；从会话池借用的会话在aclose()时归还
+        self.session_pool = session_pool if session is None else None
+        self._owns_session = session is None and session_pool is None
+        if session is not None:
+            self.http_client = session
+        elif session_pool is not None:
+            self.http_client = session_pool.acquire(proxy)
+        else:
+            self.http_client = requests.AsyncSession(timeout=timeout, proxy=proxy)
+
+        self.db = db or AccountDatabase()
+        self._init_wallet(private_key, address, register=False)
+
+        self.token = None
+        self.code = None
+        self.hpToken = None
+
+    get_nonce = HumanityBotAPI.get_nonce
+
+    async def _db_call(self, func, *args, **kwargs):
+        """数据库读写放到线程中执行，等待写锁时不阻塞事件循环"""
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def _ensure_registered(self):
+        if self._register_pending:
+            await self._db_call(self.db.add_account, self.address, self.private_key)
+            self._register_pending = False
+
+    async def solve_captcha(self) -> Optional[str]:
+        """solve_captcha()的异步版本，等待期间不占用线程"""
+        if self.captcha_pool is not None:
+            future = self.captcha_pool.acquire()
+            try:
+                cap_res = await asyncio.wait_for(asyncio.wrap_future(future), CAPTCHA_POOL_WAIT)
+            except asyncio.TimeoutError:
+                # 超时的同时 token 可能恰好送达，放回池中留给其他账号
+                self.captcha_pool.abandon(future)
+                cap_res = None
+            except asyncio.CancelledError:
+                self.captcha_pool.abandon(future)
+                raise
+            if cap_res:
+                return cap_res
+            logger.info(f"[{self.address}] 预打码池等待超时，改为直接打码")
+        # 打码接口是阻塞实现，放到线程中等待，避免卡住事件循环
+        return await asyncio.to_thread(capsolver)
+
+    def set_hp_token(self, hp_token: str):
+        """使用已有的hp_token，跳过登录"""
+        self.hpToken = hp_token
+        self.headers.update({'authorization': f'Bearer {hp_token}', 'token': hp_token})
+
+    async def _request(self, method: str, url: str, headers: Optional[dict] = None, **kwargs):
+        """_request()的异步版本"""
+        kwargs.setdefault('timeout', self.timeout)
+        headers = headers or self.headers
+        return await self._send(self.http_client, self.proxy, method, url, headers, kwargs)
+
+    async def _send(self, session, proxy: Optional[str], method: str, url: str, headers: dict, kwargs: dict):
+        if self.breakers is not None:
+            self.breakers.guard(url)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(url)
+        start = time.time()
+        try:
+            response = await session.request(method, url, headers=headers, **kwargs)
+        except requests.RequestsError:
+            self._record_error(url, time.time() - start, proxy)
+            raise
+        self._record_response(url, response, time.time() - start, proxy)
+        return response
+
+    async def _post(self, url: str, json_data: dict, **kwargs):
+        return await self._request('POST', url, json=json_data, **kwargs)
+
+    async def collect(self):
+        res = None
+        try:
+            nonce = self.get_nonce()
+            timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+            sign_message, message = build_sign_in_message(self.address, nonce, timestamp)
+            signature_future = self._sign(sign_message)
+
+            cap_res = await self.solve_captcha()
+            signature = await asyncio.wrap_future(signature_future)
+            if cap_res is None:
+                logger.info("打码失败，请检查config.py的CAPTCHA_SOLVER_API_KEY是否正确")
+                raise CaptchaError("打码失败")
+            json_data = {
+                'message': message,
+                'signature': signature,
+                'wallet': self.address,
+                'chain_id': '7080969',
+                'attributed_client_id': 1,
+                'method': 'wallet',
+                'recaptcha_token': cap_res,
+            }
+            res = await self._post(CONNECT_URL, json_data)
+            self._raise_for_status(res, CaptchaError)
+            self.token = res.json().get('data', {}).get('token')
+            if not self.token:
+                raise HumanityAPIError("Failed to get token from response")
+
+            await self._db_call(self.db.update_tokens, self.address, token=self.token)
+            logger.info(f"[{self.address}] 钱包sign成功")
+            return True
+        except Exception as e:
+            logger.error(f"收集过程中出错: {str(e)}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+                logger.error(f"响应内容: {res.text[:500]}")
+            raise
+
+    async def login(self, stored_token: Optional[str] = None):
+        """login()的异步版本"""
+        await self._ensure_registered()
+        if stored_token is None:
+            account_data = await self._db_call(self.db.get_account, self.address)
+            stored_token = account_data.get('token') if account_data else None
+
+        if can_reuse_token(stored_token):
+            self.token = stored_token
+            try:
+                await self.auth()
+                await self.loginAndRegister()
+                logger.info(f"[{self.address}] 复用terminal3 token登录成功")
+                return True
+            except Exception as e:
+                logger.info(f"[{self.address}] 复用terminal3 token失败，重新签名登录: {str(e)}")
+
+        self._preflight()
+        await self.collect()
+        await self.auth()
+        await self.loginAndRegister()
+        return True
+
+    async def auth(self):
+        response = None
+        try:
+            response = await self._request(
+                'GET',
+                build_authorize_url(self.token),
+                headers=AUTH_HEADERS,
+                allow_redirects=False
+            )
+            if response.status_code in REDIRECT_STATUS:
+                code = extract_code_from_location(response.headers.get('location'))
+                if code:
+                    self.code = code
+                    return code
+
+            # 与同步版一致：没有重定向时尝试用token换取访问令牌
+            token_response = await self._request('POST', TOKEN_URL, headers=AUTH_HEADERS, json={
+                'grant_type': 'authorization_code',
+                'client_id': CLIENT_ID,
+                'token': self.token
+            })
+            if token_response.status_code == 200:
+                token_data = token_response.json()
+                if 'access_token' in token_data:
+                    logger.info(f"[{self.address}] 成功获取访问令牌")
+                    return token_data['access_token']
+
+            code_match = re.search(r'code=([^&"\']+)', response.text)
+            if code_match:
+                code = code_match.group(1)
+                self.headers.update({'referer': f'https://testnet.humanity.org/dashboard?code={code}&state=t3'})
+                self.code = code
+                return code
+
+            raise HumanityAPIError("无法获取授权码或访问令牌")
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"认证过程中出错: {str(e)}")
+            if response is not None:
+                logger.error(f"响应状态码: {response.status_code}")
+                logger.error(f"响应内容: {response.text[:500]}")
+            raise Exception("认证失败") from e
+
+    async def loginAndRegister(self):
+        res = None
+        try:
+            res = await self._post(LOGIN_URL, {'code': self.code})
+            self._raise_for_status(res, AuthExpiredError)
+            hp_token = res.json().get('data', {}).get('token')
+            if not hp_token:
+                raise HumanityAPIError("Failed to get hp_token from response")
+            self.set_hp_token(hp_token)
+            await self._db_call(self.db.update_tokens, self.address, hp_token=self.hpToken)
+            logger.info(f"[{self.address}] 登录成功")
+            return True
+        except Exception as e:
+            logger.error(f"登录失败: {str(e)}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+                logger.error(f"响应内容: {res.text[:500]}")
+            raise
+
+    async def check(self):
+        res = await self._post(CHECK_URL, {})
+        self._raise_for_status(res)
+        response_data = res.json()
+        logger.info(f"[{self.address}] {response_data.get('message')}, {response_data.get('available')}, "
+                    f"{response_data.get('amount')}, {response_data.get('next_daily_award')}")
+        if not response_data.get('available'):
+            await self._db_call(self._record_next_claim, response_data)
+        return response_data.get('available')
+
+    async def claim(self):
+        """claim()的异步版本，失败时由调度方延迟重试"""
+        await self._ensure_registered()
+        res = None
+        try:
+            res = await self._post(CLAIM_URL, {})
+            self._raise_for_status(res)
+            response_data = res.json()
+            message = response_data.get('message')
+            daily_claimed = response_data.get('daily_claimed')
+            if not response_data.get('available'):
+                if daily_claimed:
+                    next_claim_at = parse_next_daily_award(response_data.get('next_daily_award'))
+                    await self._db_call(self.db.update_claim_time, self.address, next_claim_at=next_claim_at)
+                else:
+                    await self._db_call(self._record_next_claim, response_data)
+                logger.info(f"[{self.address}] 领取成功: {message}, {daily_claimed}, {response_data.get('amount')}")
+                return True
+            logger.info(f"[{self.address}] 领取失败: {message}")
+            return None
+        except Exception as e:
+            logger.error(f"领取过程中出错: {str(e)}")
+            if res is not None:
+                logger.error(f"响应状态码: {res.status_code}")
+            raise
+
+    async def aclose(self):
+        if self.session_pool is not None:
+            self.session_pool.release(self.http_client, self.proxy)
+        elif self._owns_session:
+            await self.http_client.close()
+
+
 if __name__ == "__main__":
     # 创建数据库实例
     db = AccountDatabase()
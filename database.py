@@ -1,122 +1,948 @@
+import atexit
+import os
+import queue
 import sqlite3
 import threading
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+import time
+from typing import Optional, Callable, Dict, Any, Iterable, Iterator, Tuple
+from datetime import datetime
 import pytz
+from eth_hash.auto import keccak
+
+from utils.JWT_utils import get_token_exp, parse_claim_time, next_claim_timestamp
+from utils.logger_utils import logger
 
 # 设置上海时区
 SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
 
+# 当前表结构版本（PRAGMA user_version）
+# 0: 旧版 TEXT 地址/私钥 + rowid 表
+# 2: WITHOUT ROWID 紧凑表，地址/私钥为 20/32 字节 BLOB，时间为整数时间戳，token 单独存放
+SCHEMA_VERSION = 2
+
+# 旧表迁移时每批复制的行数
+MIGRATION_BATCH_SIZE = 5000
+
+
+def address_to_bytes(address: str) -> bytes:
+    """0x 开头的地址转换为 20 字节"""
+    raw = bytes.fromhex(address[2:] if address[:2].lower() == '0x' else address)
+    if len(raw) != 20:
+        raise ValueError(f"地址长度错误: {address}")
+    return raw
+
+
+def private_key_to_bytes(private_key: str) -> bytes:
+    """私钥（可带 0x 前缀）转换为 32 字节"""
+    private_key = private_key.strip()
+    raw = bytes.fromhex(private_key[2:] if private_key[:2].lower() == '0x' else private_key)
+    if len(raw) != 32:
+        raise ValueError("私钥长度错误")
+    return raw
+
+
+_CHECKSUM_UPPER = frozenset('89abcdef')
+
+
+def bytes_to_address(raw: bytes) -> str:
+    """20 字节地址转换为 EIP-55 校验和地址（省去 eth_utils 的参数校验，扫描大批账号时更快）"""
+    hex_address = raw.hex()
+    digest = keccak(hex_address.encode()).hex()
+    return '0x' + ''.join([c.upper() if d in _CHECKSUM_UPPER else c for c, d in zip(hex_address, digest)])
+
+
+def bytes_to_private_key(raw: bytes) -> str:
+    return '0x' + raw.hex()
+
+
+def normalize_private_key(private_key: str) -> str:
+    """统一为 0x 开头的小写十六进制私钥"""
+    return bytes_to_private_key(private_key_to_bytes(private_key))
+
+
+def partition_address_space(parts: int) -> list:
+    """
+    把 20 字节地址空间等分为 parts 段；地址为哈希值，分布均匀，各段账号数大致相同
+
+    Returns:
+        [(下界, 上界)]，下界含、上界不含，最后一段上界为 None
+    """
+    bounds = [((1 << 160) * i // parts).to_bytes(20, 'big') for i in range(parts)]
+    return [(lo, bounds[i + 1] if i + 1 < parts else None) for i, lo in enumerate(bounds)]
+
+
+def format_shanghai_time(timestamp: Optional[int]) -> Optional[str]:
+    """时间戳转为上海时间字符串（兼容旧的 last_claim_time 字段）"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, SHANGHAI_TZ).strftime('%Y-%m-%d %H:%M:%S')
+
+
 class AccountDatabase:
-    def __init__(self, db_path: str = "accounts.db"):
+    """
+    账号数据库
+
+    热数据（地址、私钥、领取/过期时间）存放在 WITHOUT ROWID 的 accounts 表中，
+    token 原文存放在 account_tokens 表中；对外接口仍以 0x 字符串地址和私钥交互
+
+    Args:
+        db_path: 数据库文件路径
+        write_behind: 为 True 时，token/领取时间等更新写入队列，由单独的写线程
+            在 WAL 模式下按批提交（group commit），工作线程不再因写锁互相等待；
+            读操作仍使用各线程自己的连接并发进行
+        flush_interval: 写线程攒批的最长时间（秒）
+        max_batch: 每批最多提交的写操作数
+    """
+
+    # 查询账号时统一使用的列
+    ACCOUNT_COLUMNS = """
+        a.address, a.private_key, a.next_claim_at, a.last_claim_at, a.hp_token_exp, a.token_exp,
+        a.created_at, t.token, t.hp_token
+    """
+
+    def __init__(
+        self,
+        db_path: str = "accounts.db",
+        write_behind: bool = False,
+        flush_interval: float = 0.05,
+        max_batch: int = 1000
+    ):
         self.db_path = db_path
         self._local = threading.local()
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._write_queue = None
+        self._writer = None
         self._init_db()
+        if write_behind:
+            self._write_queue = queue.Queue()
+            self._writer = threading.Thread(target=self._writer_loop, name='db-writer', daemon=True)
+            self._writer.start()
+            # 进程退出前把队列中的写操作落盘
+            atexit.register(self.shutdown)
+
+    def _connect(self) -> sqlite3.Connection:
+        # timeout 即 busy_timeout：多个进程共用数据库时，写锁被占用的一方等待而不是立即报错
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # 启用外键约束
+        conn.execute("PRAGMA foreign_keys = ON")
+        # WAL 模式下 NORMAL 已能保证一致性，提交时不必每次 fsync
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # 设置行工厂为字典
+        conn.row_factory = sqlite3.Row
+        return conn
 
     def _get_conn(self) -> sqlite3.Connection:
         """获取线程本地的数据库连接"""
         if not hasattr(self._local, "conn"):
-            self._local.conn = sqlite3.connect(self.db_path)
-            # 启用外键约束
-            self._local.conn.execute("PRAGMA foreign_keys = ON")
-            # 设置行工厂为字典
-            self._local.conn.row_factory = sqlite3.Row
+            self._local.conn = self._connect()
         return self._local.conn
 
+    def _write(self, *statements: Tuple[str, tuple]):
+        """
+        执行一组写语句（同一事务）：write-behind 模式下入队由写线程提交，否则直接提交
+
+        Args:
+            statements: (sql, params) 序列
+        """
+        if self._write_queue is not None:
+            self._write_queue.put(statements)
+            return
+        with self._get_conn() as conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        持久化屏障：等待此前入队的写操作全部提交
+
+        Returns:
+            bool: 在 timeout 内完成返回 True
+        """
+        if self._write_queue is None or self._writer is None or not self._writer.is_alive():
+            return True
+        barrier = threading.Event()
+        self._write_queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            first = self._write_queue.get()
+            batch = [first]
+            deadline = time.time() + self.flush_interval
+            # 攒批：直到达到批量上限或超过 flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            barriers = []
+            try:
+                # 整批在一个事务中提交；每个写操作用 SAVEPOINT 隔离。
+                # IMMEDIATE 在事务开始时就取得写锁，多进程并发写时不会在读锁升级为写锁时失败
+                conn.execute("BEGIN IMMEDIATE")
+                for item in batch:
+                    if item is None:
+                        stopping = True
+                    elif isinstance(item, threading.Event):
+                        barriers.append(item)
+                    else:
+                        conn.execute("SAVEPOINT write_item")
+                        try:
+                            for sql, params in item:
+                                conn.execute(sql, params)
+                            conn.execute("RELEASE write_item")
+                        except sqlite3.Error as e:
+                            # 单个写操作失败只回滚自身，不影响同批其他写操作
+                            conn.execute("ROLLBACK TO write_item")
+                            conn.execute("RELEASE write_item")
+                            logger.error(f"数据库写入失败: {str(e)}")
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"数据库批量提交失败: {str(e)}")
+            for barrier in barriers:
+                barrier.set()
+        conn.close()
+
     def _init_db(self):
-        """初始化数据库表"""
-        with self._get_conn() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS accounts (
-                    address TEXT PRIMARY KEY,
-                    private_key TEXT NOT NULL,
-                    token TEXT,
-                    hp_token TEXT,
-                    last_claim_time TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            # 创建索引
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_claim ON accounts(last_claim_time)")
+        """初始化数据库表，必要时迁移旧表结构"""
+        conn = self._get_conn()
+        # WAL 模式：写入时不阻塞读取
+        conn.execute("PRAGMA journal_mode = WAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        legacy = version == 0 and self._table_exists(conn, "accounts")
+
+        with conn:
+            self._create_schema(conn, "accounts_v2" if legacy else "accounts")
+        if legacy:
+            self._migrate_legacy(conn)
+        elif version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @staticmethod
+    def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone() is not None
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection, accounts_table: str):
+        # 热数据：每次调度都会扫描，保持行尽量小
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {accounts_table} (
+                address BLOB PRIMARY KEY,
+                private_key BLOB NOT NULL,
+                next_claim_at INTEGER NOT NULL DEFAULT 0,
+                last_claim_at INTEGER,
+                hp_token_exp INTEGER,
+                token_exp INTEGER,
+                created_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # WITHOUT ROWID 表的二级索引自带主键，(next_claim_at, address) 可直接用于分页
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_accounts_next_claim ON {accounts_table}(next_claim_at)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_accounts_hp_token_exp ON {accounts_table}(hp_token_exp)")
+        # 私钥唯一索引：导入私钥时无需推导地址即可判断是否已存在
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_accounts_private_key ON {accounts_table}(private_key)")
+        # 私钥文件导入进度：已处理的字节数及这部分内容的哈希，文件只追加时从断点继续
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS key_imports (
+                path TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                prefix_hash BLOB NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        """)
+        # 账号租约：多个工作进程共用数据库时，领取到的账号在 expires_at 之前归 owner 处理，
+        # owner 定期续约；进程崩溃后租约过期，账号自动回到待处理队列
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS account_leases (
+                address BLOB PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_account_leases_owner ON account_leases(owner)")
+        # 每次运行的待处理账号及进度：中断后 --resume 只需扫描未完成的账号（部分索引）
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                label TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL,
+                success_path TEXT,
+                fail_path TEXT,
+                started_at INTEGER NOT NULL,
+                finished_at INTEGER
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS run_items (
+                run_id INTEGER NOT NULL,
+                address BLOB NOT NULL,
+                stage TEXT,
+                outcome TEXT,
+                updated_at INTEGER,
+                PRIMARY KEY (run_id, address)
+            ) WITHOUT ROWID
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_run_items_pending ON run_items(run_id, address) WHERE outcome IS NULL"
+        )
+        # 冷数据：token 原文较长，单独存放，避免撑大热表和索引页
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS account_tokens (
+                address BLOB PRIMARY KEY,
+                token TEXT,
+                hp_token TEXT,
+                updated_at INTEGER
+            )
+        """)
+
+    def _migrate_legacy(self, conn: sqlite3.Connection):
+        """
+        旧表在线迁移：按 rowid 分批复制到新表，每批一个短事务，进度记录在
+        schema_migration 表中，中断后可继续；复制期间旧表仍可读写，最后在一个
+        事务中补齐复制期间变更的行并替换旧表
+        """
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS schema_migration (name TEXT PRIMARY KEY, last_rowid INTEGER, started_at TEXT)")
+            conn.execute(
+                "INSERT OR IGNORE INTO schema_migration (name, last_rowid, started_at) VALUES ('accounts_v2', 0, CURRENT_TIMESTAMP)"
+            )
+        last_rowid, started_at = conn.execute(
+            "SELECT last_rowid, started_at FROM schema_migration WHERE name = 'accounts_v2'"
+        ).fetchone()
+        legacy_columns = {row["name"] for row in conn.execute("PRAGMA table_info(accounts)")}
+        logger.info(f"开始迁移账号表结构，从 rowid {last_rowid} 继续")
+
+        while True:
+            rows = conn.execute(
+                "SELECT rowid AS legacy_rowid, * FROM accounts WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, MIGRATION_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1]["legacy_rowid"]
+            with conn:
+                self._copy_legacy_rows(conn, rows, legacy_columns)
+                conn.execute("UPDATE schema_migration SET last_rowid = ? WHERE name = 'accounts_v2'", (last_rowid,))
+
+        with conn:
+            # 复制期间被更新或新增的行
+            changed = conn.execute("SELECT * FROM accounts WHERE updated_at >= ?", (started_at,)).fetchall()
+            self._copy_legacy_rows(conn, changed, legacy_columns)
+            conn.execute("DROP TABLE accounts")
+            conn.execute("ALTER TABLE accounts_v2 RENAME TO accounts")
+            conn.execute("DROP TABLE schema_migration")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        logger.info("账号表结构迁移完成，正在回收空间")
+        self.compact()
+
+    @staticmethod
+    def _copy_legacy_rows(conn: sqlite3.Connection, rows: list, legacy_columns: set):
+        accounts = []
+        tokens = []
+        for row in rows:
+            try:
+                address = address_to_bytes(row["address"])
+                private_key = private_key_to_bytes(row["private_key"])
+            except ValueError as e:
+                logger.error(f"跳过无法迁移的账号 {row['address']}: {str(e)}")
+                continue
+            last_claim_at = None
+            if row["last_claim_time"]:
+                last_claim_at = int(parse_claim_time(row["last_claim_time"]).timestamp())
+            next_claim_at = row["next_claim_at"] if "next_claim_at" in legacy_columns else 0
+            if not next_claim_at and last_claim_at:
+                next_claim_at = next_claim_timestamp(parse_claim_time(row["last_claim_time"]))
+            hp_token_exp = row["hp_token_exp"] if "hp_token_exp" in legacy_columns else None
+            token_exp = row["token_exp"] if "token_exp" in legacy_columns else None
+            created_at = int(datetime.strptime(row["created_at"], '%Y-%m-%d %H:%M:%S')
+                             .replace(tzinfo=pytz.utc).timestamp()) if row["created_at"] else int(time.time())
+            accounts.append((
+                address, private_key, next_claim_at or 0, last_claim_at,
+                hp_token_exp or get_token_exp(row["hp_token"]), token_exp or get_token_exp(row["token"]),
+                created_at
+            ))
+            if row["token"] or row["hp_token"]:
+                tokens.append((address, row["token"], row["hp_token"], int(time.time())))
+        conn.executemany("INSERT OR REPLACE INTO accounts_v2 VALUES (?, ?, ?, ?, ?, ?, ?)", accounts)
+        conn.executemany("INSERT OR REPLACE INTO account_tokens VALUES (?, ?, ?, ?)", tokens)
+
+    @staticmethod
+    def _row_to_account(row: sqlite3.Row) -> Dict[str, Any]:
+        """数据库行转换为对外的账号字典（地址/私钥为 0x 字符串）"""
+        account = dict(row)
+        account['address'] = bytes_to_address(row['address'])
+        account['private_key'] = bytes_to_private_key(row['private_key'])
+        account['last_claim_time'] = format_shanghai_time(row['last_claim_at'])
+        return account
 
     def add_account(self, address: str, private_key: str) -> bool:
         """添加新账号"""
         try:
             with self._get_conn() as conn:
                 conn.execute(
-                    "INSERT INTO accounts (address, private_key) VALUES (?, ?)",
-                    (address, private_key)
+                    "INSERT INTO accounts (address, private_key, created_at) VALUES (?, ?, ?)",
+                    (address_to_bytes(address), private_key_to_bytes(private_key), int(time.time()))
                 )
                 return True
         except sqlite3.IntegrityError:
             return False
 
-    def update_tokens(self, address: str, token: Optional[str] = None, hp_token: Optional[str] = None):
-        """更新账号的token信息"""
+    def add_accounts(self, accounts: Iterable[Tuple[str, str]]) -> int:
+        """
+        批量添加账号，已存在的地址会被忽略
+
+        Args:
+            accounts: (address, private_key) 序列
+
+        Returns:
+            实际新增的数量
+        """
+        now = int(time.time())
         with self._get_conn() as conn:
-            updates = []
-            params = []
-            if token is not None:
-                updates.append("token = ?")
-                params.append(token)
-            if hp_token is not None:
-                updates.append("hp_token = ?")
-                params.append(hp_token)
-            
-            if updates:
-                updates.append("updated_at = CURRENT_TIMESTAMP")
-                query = f"UPDATE accounts SET {', '.join(updates)} WHERE address = ?"
-                params.append(address)
-                conn.execute(query, params)
-
-    def update_claim_time(self, address: str):
-        """更新领取时间为当前上海时间"""
-        with self._get_conn() as conn:
-            # 获取当前上海时间
-            now = datetime.now(SHANGHAI_TZ)
-            now_str = now.strftime('%Y-%m-%d %H:%M:%S')
-            
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO accounts (address, private_key, created_at) VALUES (?, ?, ?)",
+                ((address_to_bytes(address), private_key_to_bytes(pk), now) for address, pk in accounts)
+            )
+            return conn.total_changes - before
+
+    def get_import_state(self, path: str) -> Optional[Dict[str, Any]]:
+        """获取私钥文件的导入进度"""
+        with self._get_conn() as conn:
+            row = conn.execute("SELECT * FROM key_imports WHERE path = ?", (path,)).fetchone()
+            return dict(row) if row else None
+
+    def filter_new_private_keys(self, private_keys: list) -> list:
+        """
+        过滤出数据库中还没有的私钥（走私钥唯一索引）
+
+        Args:
+            private_keys: 32 字节私钥列表
+        """
+        existing = set()
+        with self._get_conn() as conn:
+            for i in range(0, len(private_keys), 500):
+                chunk = private_keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT private_key FROM accounts WHERE private_key IN ({placeholders})", chunk
+                ))
+        return [pk for pk in private_keys if pk not in existing]
+
+    def import_accounts(self, accounts: list, path: str, offset: int, prefix_hash: bytes) -> int:
+        """
+        批量写入已推导好地址的账号，并在同一事务中记录导入进度
+
+        Args:
+            accounts: (20 字节地址, 32 字节私钥) 列表
+            path: 私钥文件路径
+            offset: 已处理到的字节数
+            prefix_hash: 文件前 offset 字节的 sha256
+
+        Returns:
+            实际新增的数量
+        """
+        now = int(time.time())
+        with self._get_conn() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO accounts (address, private_key, created_at) VALUES (?, ?, ?)",
+                ((address, private_key, now) for address, private_key in accounts)
+            )
+            added = conn.total_changes - before
             conn.execute(
-                """
-                UPDATE accounts 
-                SET last_claim_time = ?, 
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE address = ?
-                """,
-                (now_str, address)
+                "INSERT OR REPLACE INTO key_imports (path, offset, prefix_hash, updated_at) VALUES (?, ?, ?, ?)",
+                (path, offset, prefix_hash, now)
             )
+            return added
+
+    def get_private_keys(self) -> set:
+        """获取数据库中已有的全部私钥（0x 开头的小写十六进制）"""
+        with self._get_conn() as conn:
+            return {bytes_to_private_key(row[0]) for row in conn.execute("SELECT private_key FROM accounts")}
+
+    def update_tokens(self, address: str, token: Optional[str] = None, hp_token: Optional[str] = None):
+        """更新账号的token信息"""
+        if token is None and hp_token is None:
+            return
+        raw_address = address_to_bytes(address)
+        now = int(time.time())
+        statements = [(
+            """
+            INSERT INTO account_tokens (address, token, hp_token, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(address) DO UPDATE SET
+                token = COALESCE(excluded.token, token),
+                hp_token = COALESCE(excluded.hp_token, hp_token),
+                updated_at = excluded.updated_at
+            """,
+            (raw_address, token, hp_token, now)
+        )]
+        if token is not None:
+            statements.append(("UPDATE accounts SET token_exp = ? WHERE address = ?", (get_token_exp(token), raw_address)))
+        if hp_token is not None:
+            # 保存时解析一次exp，之后按整数列判断是否过期
+            statements.append(("UPDATE accounts SET hp_token_exp = ? WHERE address = ?", (get_token_exp(hp_token), raw_address)))
+        self._write(*statements)
+
+    def update_claim_time(self, address: str, next_claim_at: Optional[int] = None):
+        """
+        更新领取时间为当前时间，并记录下次可领取时间
+
+        Args:
+            address: 钱包地址
+            next_claim_at: 接口返回的下次可领取时间戳，为空时按上海时间9点规则计算
+        """
+        now = datetime.now(SHANGHAI_TZ)
+        if next_claim_at is None:
+            next_claim_at = next_claim_timestamp(now)
+        self._write((
+            "UPDATE accounts SET last_claim_at = ?, next_claim_at = ? WHERE address = ?",
+            (int(now.timestamp()), next_claim_at, address_to_bytes(address))
+        ))
+
+    def update_next_claim_at(self, address: str, next_claim_at: int):
+        """记录接口返回的下次可领取时间（例如今天已经领取过）"""
+        self._write((
+            "UPDATE accounts SET next_claim_at = ? WHERE address = ?",
+            (next_claim_at, address_to_bytes(address))
+        ))
 
     def get_account(self, address: str) -> Optional[Dict[str, Any]]:
         """获取账号信息"""
         with self._get_conn() as conn:
             result = conn.execute(
-                "SELECT * FROM accounts WHERE address = ?",
-                (address,)
+                f"""
+                SELECT {self.ACCOUNT_COLUMNS} FROM accounts a
+                LEFT JOIN account_tokens t ON t.address = a.address
+                WHERE a.address = ?
+                """,
+                (address_to_bytes(address),)
             ).fetchone()
-            return dict(result) if result else None
+            return self._row_to_account(result) if result else None
 
-    def get_claimable_accounts(self, batch_size: int = 100) -> list:
-        """获取可以领取奖励的账号"""
+    def get_claimable_accounts(
+        self,
+        batch_size: int = 100,
+        now: Optional[int] = None,
+        after: Optional[Tuple[int, str]] = None,
+        address_range: Optional[Tuple[bytes, Optional[bytes]]] = None
+    ) -> list:
+        """
+        获取可以领取奖励的账号，走 (next_claim_at, address) 索引的范围扫描
+
+        Args:
+            batch_size: 最多返回的数量
+            now: 当前时间戳，默认取系统时间
+            after: 分页游标，上一页最后一行的 (next_claim_at, address)
+            address_range: 只返回该地址段内的账号，见 partition_address_space()
+        """
+        now = int(time.time()) if now is None else now
+        last_next_claim, last_address = (after[0], address_to_bytes(after[1])) if after else (-1, b'')
+        range_sql, range_params = self._address_range_sql(address_range)
         with self._get_conn() as conn:
-            # 获取当前上海时间24小时前的时间戳
-            now = datetime.now(SHANGHAI_TZ)
-            one_day_ago = now - timedelta(days=1)
-            one_day_ago_str = one_day_ago.strftime('%Y-%m-%d %H:%M:%S')
-            
             results = conn.execute(
+                f"""
+                SELECT {self.ACCOUNT_COLUMNS} FROM accounts a
+                LEFT JOIN account_tokens t ON t.address = a.address
+                WHERE a.next_claim_at <= ?
+                AND (a.next_claim_at, a.address) > (?, ?)
+                {range_sql}
+                ORDER BY a.next_claim_at, a.address
+                LIMIT ?
+                """,
+                (now, last_next_claim, last_address, *range_params, batch_size)
+            ).fetchall()
+            return [self._row_to_account(row) for row in results]
+
+    def get_next_claim_at(self, after: Optional[int] = None) -> Optional[int]:
+        """
+        下一个领取窗口：晚于 after 的最早 next_claim_at，走 next_claim_at 索引
+
+        Args:
+            after: 时间戳，默认取系统时间
+        """
+        after = int(time.time()) if after is None else after
+        with self._get_conn() as conn:
+            return conn.execute(
+                "SELECT MIN(next_claim_at) FROM accounts WHERE next_claim_at > ?", (after,)
+            ).fetchone()[0]
+
+    @staticmethod
+    def _address_range_sql(address_range: Optional[Tuple[bytes, Optional[bytes]]]) -> Tuple[str, tuple]:
+        if address_range is None:
+            return '', ()
+        lo, hi = address_range
+        if hi is None:
+            return 'AND a.address >= ?', (lo,)
+        return 'AND a.address >= ? AND a.address < ?', (lo, hi)
+
+    def iter_claimable_accounts(
+        self,
+        batch_size: int = 500,
+        now: Optional[int] = None,
+        address_range: Optional[Tuple[bytes, Optional[bytes]]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """按页遍历当前可领取的账号，页与页之间不持有读游标"""
+        now = int(time.time()) if now is None else now
+        after = None
+        while True:
+            rows = self.get_claimable_accounts(batch_size=batch_size, now=now, after=after,
+                                               address_range=address_range)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]['next_claim_at'], rows[-1]['address'])
+
+    def lease_accounts(
+        self,
+        owner: str,
+        batch_size: int = 100,
+        lease_seconds: int = 300,
+        now: Optional[int] = None,
+        after: Optional[Tuple[int, str]] = None,
+        address_range: Optional[Tuple[bytes, Optional[bytes]]] = None,
+        run_id: Optional[int] = None
+    ) -> list:
+        """
+        原子地领取一批可领取、且没有有效租约的账号，并为其加上 owner 的租约
+
+        查询和加租约在同一个 IMMEDIATE 事务中完成，多个进程同时领取时不会拿到同一个账号
+
+        Args:
+            owner: 租约持有者标识
+            batch_size: 最多领取的数量
+            lease_seconds: 租约有效期，持有者需在此之前续约
+            now: 当前时间戳，默认取系统时间
+            after: 分页游标，上一批最后一行的 (next_claim_at, address)
+            address_range: 只领取该地址段内的账号
+            run_id: 指定时从该次运行未完成的账号中领取（按地址排序），不再按 next_claim_at 扫描
+        """
+        now = int(time.time()) if now is None else now
+        last_next_claim, last_address = (after[0], address_to_bytes(after[1])) if after else (-1, b'')
+        range_sql, range_params = self._address_range_sql(address_range)
+        if run_id is None:
+            sql = f"""
+                SELECT {self.ACCOUNT_COLUMNS} FROM accounts a
+                LEFT JOIN account_tokens t ON t.address = a.address
+                LEFT JOIN account_leases l ON l.address = a.address
+                WHERE a.next_claim_at <= ?
+                AND (a.next_claim_at, a.address) > (?, ?)
+                AND (l.address IS NULL OR l.expires_at <= ?)
+                {range_sql}
+                ORDER BY a.next_claim_at, a.address
+                LIMIT ?
+            """
+            params = (now, last_next_claim, last_address, now, *range_params, batch_size)
+        else:
+            sql = f"""
+                SELECT {self.ACCOUNT_COLUMNS} FROM run_items r
+                JOIN accounts a ON a.address = r.address
+                LEFT JOIN account_tokens t ON t.address = a.address
+                LEFT JOIN account_leases l ON l.address = a.address
+                WHERE r.run_id = ? AND r.outcome IS NULL
+                AND r.address > ?
+                AND (l.address IS NULL OR l.expires_at <= ?)
+                {range_sql}
+                ORDER BY r.address
+                LIMIT ?
+            """
+            params = (run_id, last_address, now, *range_params, batch_size)
+        conn = self._get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = conn.execute(sql, params).fetchall()
+            conn.executemany(
+                "INSERT OR REPLACE INTO account_leases (address, owner, expires_at) VALUES (?, ?, ?)",
+                ((row['address'], owner, now + lease_seconds) for row in results)
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return [self._row_to_account(row) for row in results]
+
+    def renew_leases(self, owner: str, lease_seconds: int = 300) -> int:
+        """心跳：延长 owner 持有的全部租约，返回续约的数量"""
+        with self._get_conn() as conn:
+            return conn.execute(
+                "UPDATE account_leases SET expires_at = ? WHERE owner = ?",
+                (int(time.time()) + lease_seconds, owner)
+            ).rowcount
+
+    def release_lease(self, address: str, owner: str, hold: int = 0):
+        """
+        账号处理结束后释放租约；与 token、领取时间的更新走同一个写队列，
+        其他进程看到租约释放时一定也能看到新的 next_claim_at
+
+        Args:
+            hold: 大于 0 时租约改为无主并保留 hold 秒（最终失败的账号），期间其他进程不会再领取
+        """
+        raw_address = address_to_bytes(address)
+        if hold > 0:
+            self._write((
+                "UPDATE account_leases SET owner = '', expires_at = ? WHERE address = ? AND owner = ?",
+                (int(time.time()) + hold, raw_address, owner)
+            ))
+        else:
+            self._write(("DELETE FROM account_leases WHERE address = ? AND owner = ?", (raw_address, owner)))
+
+    def release_leases(self, owner: str) -> int:
+        """释放 owner 仍持有的全部租约（进程退出时未处理完的账号），返回释放的数量"""
+        self.flush()
+        with self._get_conn() as conn:
+            return conn.execute("DELETE FROM account_leases WHERE owner = ?", (owner,)).rowcount
+
+    def create_run(self, success_path: str, fail_path: str, label: str = '', keep_runs: int = 7) -> int:
+        """
+        开始一次新的运行，同一 label 下之前未完成的运行标记为 abandoned
+
+        Args:
+            label: 运行的分组（例如分片），--resume 只继续同一分组的运行
+            keep_runs: 同一 label 下保留最近多少次运行的 run_items，更早的明细被删除
+
+        Returns:
+            运行编号
+        """
+        now = int(time.time())
+        with self._get_conn() as conn:
+            conn.execute("UPDATE runs SET status = 'abandoned' WHERE label = ? AND status = 'running'", (label,))
+            run_id = conn.execute(
+                "INSERT INTO runs (label, status, success_path, fail_path, started_at) VALUES (?, 'running', ?, ?, ?)",
+                (label, success_path, fail_path, now)
+            ).lastrowid
+            # 只清理同一 label 的旧运行：各分片共用数据库，别的分片未完成的运行仍要能 --resume
+            conn.execute(
+                """
+                DELETE FROM run_items WHERE run_id IN (
+                    SELECT id FROM runs WHERE label = ? AND id NOT IN (
+                        SELECT id FROM runs WHERE label = ? ORDER BY id DESC LIMIT ?
+                    )
+                )
+                """,
+                (label, label, keep_runs)
+            )
+            return run_id
+
+    def snapshot_run(self, run_id: int, account_filter: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                     now: Optional[int] = None) -> int:
+        """
+        把当前可领取的账号写入 run_items，作为本次运行的待处理队列
+
+        Args:
+            account_filter: 只加入返回 True 的账号；为空时直接在 SQL 中复制，不经过 Python
+
+        Returns:
+            加入的账号数
+        """
+        now = int(time.time()) if now is None else now
+        if account_filter is None:
+            with self._get_conn() as conn:
+                return conn.execute(
+                    "INSERT OR IGNORE INTO run_items (run_id, address) SELECT ?, address FROM accounts WHERE next_claim_at <= ?",
+                    (run_id, now)
+                ).rowcount
+        added = 0
+        batch = []
+        for account in self.iter_claimable_accounts(now=now):
+            if account_filter(account):
+                batch.append((run_id, address_to_bytes(account['address'])))
+            if len(batch) >= 5000:
+                added += self._add_run_items(batch)
+                batch = []
+        return added + self._add_run_items(batch)
+
+    def _add_run_items(self, rows: list) -> int:
+        if not rows:
+            return 0
+        with self._get_conn() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO run_items (run_id, address) VALUES (?, ?)", rows)
+            return conn.total_changes - before
+
+    def get_resumable_run(self, label: str = '') -> Optional[Dict[str, Any]]:
+        """同一 label 下最近一次未完成的运行，附带剩余账号数"""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT * FROM runs WHERE label = ? AND status = 'running' ORDER BY id DESC LIMIT 1", (label,)
+            ).fetchone()
+            if row is None:
+                return None
+            run = dict(row)
+            run['pending'] = conn.execute(
+                "SELECT COUNT(*) FROM run_items WHERE run_id = ? AND outcome IS NULL", (run['id'],)
+            ).fetchone()[0]
+            return run
+
+    def get_run_leases(self, run_id: int, now: Optional[int] = None) -> Tuple[int, Optional[int]]:
+        """
+        运行中还没有结果、但仍被某个进程持有有效租约的账号
+
+        Returns:
+            (账号数, 最晚的租约到期时间)
+        """
+        now = int(time.time()) if now is None else now
+        with self._get_conn() as conn:
+            count, expires_at = conn.execute(
                 """
-                SELECT * FROM accounts 
-                WHERE last_claim_time IS NULL 
-                OR last_claim_time <= ?
+                SELECT COUNT(*), MAX(l.expires_at) FROM run_items r
+                JOIN account_leases l ON l.address = r.address
+                WHERE r.run_id = ? AND r.outcome IS NULL AND l.owner != '' AND l.expires_at > ?
+                """,
+                (run_id, now)
+            ).fetchone()
+            return count, expires_at
+
+    def iter_run_items(
+        self,
+        run_id: int,
+        batch_size: int = 500,
+        address_range: Optional[Tuple[bytes, Optional[bytes]]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """按地址分页遍历运行中未完成的账号，只扫描部分索引中剩余的行"""
+        range_sql, range_params = self._address_range_sql(address_range)
+        last_address = b''
+        while True:
+            with self._get_conn() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT {self.ACCOUNT_COLUMNS} FROM run_items r
+                    JOIN accounts a ON a.address = r.address
+                    LEFT JOIN account_tokens t ON t.address = a.address
+                    WHERE r.run_id = ? AND r.outcome IS NULL AND r.address > ?
+                    {range_sql}
+                    ORDER BY r.address
+                    LIMIT ?
+                    """,
+                    (run_id, last_address, *range_params, batch_size)
+                ).fetchall()
+            yield from (self._row_to_account(row) for row in rows)
+            if len(rows) < batch_size:
+                return
+            last_address = rows[-1]['address']
+
+    def update_run_item(self, run_id: int, address: str, stage: Optional[str] = None, outcome: Optional[str] = None):
+        """记录账号在本次运行中进入的阶段，或最终结果（success 或失败分类）"""
+        self._write((
+            """
+            UPDATE run_items SET stage = COALESCE(?, stage), outcome = COALESCE(?, outcome), updated_at = ?
+            WHERE run_id = ? AND address = ?
+            """,
+            (stage, outcome, int(time.time()), run_id, address_to_bytes(address))
+        ))
+
+    def finish_run(self, run_id: int) -> Dict[str, int]:
+        """
+        所有账号都有结果时把运行标记为 finished
+
+        Returns:
+            各结果的账号数，未完成的计入 pending
+        """
+        self.flush()
+        with self._get_conn() as conn:
+            counts = {
+                row[0] or 'pending': row[1] for row in conn.execute(
+                    "SELECT outcome, COUNT(*) FROM run_items WHERE run_id = ? GROUP BY outcome", (run_id,)
+                )
+            }
+            if not counts.get('pending'):
+                conn.execute("UPDATE runs SET status = 'finished', finished_at = ? WHERE id = ?",
+                             (int(time.time()), run_id))
+            return counts
+
+    def get_expiring_accounts(
+        self,
+        expire_before: int,
+        batch_size: int = 100,
+        after: Optional[Tuple[Optional[int], str]] = None
+    ) -> list:
+        """
+        获取hp_token将在指定时间前过期（或尚未登录）的账号，按 (过期时间, 地址) 升序，尚未登录的排在最前
+
+        Args:
+            expire_before: 时间戳（秒），hp_token_exp 早于该时间的账号会被返回
+            batch_size: 最多返回的数量
+            after: 分页游标，上一页最后一行的 (hp_token_exp, address)
+        """
+        if after is None:
+            where, params = "a.hp_token_exp IS NULL OR a.hp_token_exp <= ?", (expire_before,)
+        elif after[0] is None:
+            # 游标还在尚未登录（hp_token_exp 为 NULL）的账号中
+            where = "(a.hp_token_exp IS NULL AND a.address > ?) OR a.hp_token_exp <= ?"
+            params = (address_to_bytes(after[1]), expire_before)
+        else:
+            where = "a.hp_token_exp <= ? AND (a.hp_token_exp, a.address) > (?, ?)"
+            params = (expire_before, after[0], address_to_bytes(after[1]))
+        with self._get_conn() as conn:
+            results = conn.execute(
+                f"""
+                SELECT {self.ACCOUNT_COLUMNS} FROM accounts a
+                LEFT JOIN account_tokens t ON t.address = a.address
+                WHERE {where}
+                ORDER BY a.hp_token_exp, a.address
                 LIMIT ?
                 """,
-                (one_day_ago_str, batch_size)
+                (*params, batch_size)
             ).fetchall()
-            return [dict(row) for row in results]
+            return [self._row_to_account(row) for row in results]
+
+    def stats(self) -> Dict[str, Any]:
+        """数据库文件大小与行数，用于观察表结构调整的效果"""
+        conn = self._get_conn()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {
+            'schema_version': conn.execute("PRAGMA user_version").fetchone()[0],
+            'accounts': conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0],
+            'file_bytes': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+            'used_bytes': (page_count - freelist) * page_size,
+            'free_bytes': freelist * page_size,
+        }
+
+    def compact(self):
+        """回收已删除数据占用的空间（VACUUM 期间会锁库，只在迁移或维护时调用）"""
+        self.flush()
+        conn = self._get_conn()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        # WAL 模式下 VACUUM 的结果先写入 WAL，checkpoint 后主文件才会变小
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def shutdown(self, timeout: Optional[float] = 30):
+        """落盘队列中的写操作并停止写线程，程序退出前调用"""
+        if self._write_queue is not None and self._writer is not None and self._writer.is_alive():
+            self._write_queue.put(None)
+            self._writer.join(timeout)
+        self.close()
 
     def close(self):
-        """关闭数据库连接"""
+        """关闭当前线程的数据库连接（write-behind 模式下先等待已入队的写操作提交）"""
+        self.flush()
         if hasattr(self._local, "conn"):
             self._local.conn.close()
-            del self._local.conn 
\ No newline at end of file
+            del self._local.conn
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='账号数据库维护：打开时自动迁移到最新表结构')
+    parser.add_argument('db_path', nargs='?', default='accounts.db')
+    args = parser.parse_args()
+
+    size_before = os.path.getsize(args.db_path) if os.path.exists(args.db_path) else 0
+    db = AccountDatabase(args.db_path)
+    print(f"迁移前文件大小: {size_before} 字节")
+    print(db.stats())
+    db.close()
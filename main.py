@@ -10,19 +10,32 @@ from urllib.parse import urlparse
 import os
 import threading
 import queue
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from web3.exceptions import TimeExhausted
+from eth_account import Account
+
+from utils.proxy_pool import ProxyPool, normalize_proxy
+from utils.hedging import HedgePolicy, hedged_call
+from utils.circuit_breaker import CircuitBreaker
+from utils.sharding import Shard
+from utils.dedupe import iter_unique_lines
 
 # 初始化 colorama
 init(autoreset=True)
 
 class HumanityProtocolBot:
-    def __init__(self, max_workers=5, wait_for_receipt=True, receipt_timeout=30):
+    def __init__(self, max_workers=5, wait_for_receipt=True, receipt_timeout=30, hedge_reads=False, shard=None):
         self.rpc_url = 'https://rpc.testnet.humanity.org'
         self.contract_address = '0xa18f6FCB2Fd4884436d10610E69DB7BFa1bFe8C7'
         self.max_workers = max_workers  # 设置最大并发数
         self.wait_for_receipt = wait_for_receipt  # 是否等待交易收据
         self.receipt_timeout = receipt_timeout  # 等待交易收据的超时时间（秒）
+        # 只读RPC调用的对冲策略：慢请求经另一个代理/连接再查一次，交易发送不对冲
+        self.hedge_policy = HedgePolicy() if hedge_reads else None
+        # RPC 节点熔断器：节点不可用时账号在建立连接前等待，避免所有线程同时重试
+        self.rpc_breaker = CircuitBreaker('RPC节点')
+        # 多节点运行时只处理本分片的账号，结果文件按分片分开
+        self.shard = shard
         self.contract_abi = [
             {"inputs":[],"name":"AccessControlBadConfirmation","type":"error"},
             {"inputs":[{"internalType":"address","name":"account","type":"address"},{"internalType":"bytes32","name":"neededRole","type":"bytes32"}],"name":"AccessControlUnauthorizedAccount","type":"error"},
@@ -63,14 +76,20 @@ class HumanityProtocolBot:
             
         # 获取当前日期，用于文件命名
         self.current_date = datetime.now().strftime("%Y_%m_%d")
-        
-        # 记录地址到私钥的映射，方便查询
-        self.address_to_key = {}
+        if self.shard is not None:
+            self.current_date = f"{self.current_date}_{self.shard.suffix}"
         
         # 记录已处理的地址，避免重复写入
         self.claimed_addresses = self.load_addresses("claimed")
         self.failed_addresses = self.load_addresses("failed")
 
+        # 代理池：按健康状况分配代理，账号尽量固定使用同一个代理
+        self.proxy_pool = ProxyPool.from_file('proxy.txt', max_concurrency=max_workers, probe_url=self.rpc_url)
+        if self.proxy_pool is None:
+            print(Fore.YELLOW + "未找到 proxy.txt 文件，所有账号将使用直连")
+        else:
+            self.proxy_pool.start_probing()
+
     def load_addresses(self, status_type):
         """加载已有的地址记录，避免重复"""
         addresses = set()
@@ -84,11 +103,7 @@ class HumanityProtocolBot:
                         if line.strip():
                             parts = line.strip().split('----')
                             if len(parts) >= 2:
-                                address = parts[0]
-                                private_key = parts[1]
-                                addresses.add(address)
-                                # 存储地址和私钥的映射关系
-                                self.address_to_key[address] = private_key
+                                addresses.add(parts[0])
             except Exception as e:
                 print(Fore.RED + f"读取文件 {file_path} 时出错: {str(e)}")
         
@@ -110,9 +125,6 @@ class HumanityProtocolBot:
             if status_type == "failed" and address in self.failed_addresses:
                 return
             
-            # 保存地址与私钥的映射
-            self.address_to_key[address] = private_key
-            
             # 将地址写入对应状态的文件
             file_path = os.path.join(self.data_dir, f"{status_type}_{self.current_date}.txt")
             try:
@@ -162,36 +174,33 @@ class HumanityProtocolBot:
         """返回当前时间的格式化字符串"""
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    @staticmethod
-    def load_accounts_data():
-        """加载私钥和对应的代理"""
-        accounts_data = []
+    def iter_accounts_data(self):
+        """
+        逐行读取私钥（代理在处理账号时从代理池分配），指定分片时只保留本分片的账号
 
-        try:
-            with open('data/private_keys.txt', 'r') as f:
-                private_keys = [line.strip() for line in f if line.strip()]
-        except FileNotFoundError:
+        私钥不会一次性全部读入内存，重复的私钥用布隆过滤器去重（疑似重复的再精确确认）
+        """
+        if not os.path.exists('data/private_keys.txt'):
             print(Fore.RED + "错误: 找不到 private_keys.txt 文件")
             sys.exit(1)
 
-        try:
-            with open('proxy.txt', 'r') as f:
-                proxies = [line.strip() for line in f if line.strip()]
-        except FileNotFoundError:
-            print(Fore.YELLOW + "未找到 proxy.txt 文件，所有账号将使用直连")
-            proxies = [''] * len(private_keys)
-
-        if len(proxies) < len(private_keys):
-            print(Fore.YELLOW + f"代理数量({len(proxies)})少于私钥数量({len(private_keys)})，部分账号将使用直连")
-            proxies.extend([''] * (len(private_keys) - len(proxies)))
-
-        for private_key, proxy in zip(private_keys, proxies):
-            accounts_data.append({
+        for private_key in iter_unique_lines('data/private_keys.txt'):
+            # 分片时在这里推导地址（每行一次）并传给领取流程，不分片时由工作线程推导
+            address = None
+            if self.shard is not None:
+                try:
+                    address = Account.from_key(private_key).address
+                except ValueError:
+                    # 格式错误的私钥交给第一个分片，在处理时报错
+                    if self.shard.index != 1:
+                        continue
+                else:
+                    if not self.shard.owns(address):
+                        continue
+            yield {
                 'private_key': private_key,
-                'proxy': proxy
-            })
-
-        return accounts_data
+                'address': address
+            }
 
     @staticmethod
     def format_proxy(proxy):
@@ -200,53 +209,85 @@ class HumanityProtocolBot:
             return None
         
         try:
-            if proxy.startswith('socks5://'):
-                return {'http': proxy, 'https': proxy}
-            elif proxy.startswith('http://') or proxy.startswith('https://'):
-                return {'http': proxy, 'https': proxy}
-            else:
-                return {'http': f'http://{proxy}', 'https': f'http://{proxy}'}
+            proxy = normalize_proxy(proxy)
+            return {'http': proxy, 'https': proxy}
         except Exception as e:
             print(Fore.RED + f"代理格式化错误: {str(e)}")
             return None
 
+    def create_web3(self, proxy=None, new_session=False):
+        """创建 Web3 实例，new_session 为 True 时使用独立的连接（不与其他账号共用）"""
+        formatted_proxy = self.format_proxy(proxy) if proxy else None
+        if formatted_proxy or new_session:
+            session = requests.Session()
+            if formatted_proxy:
+                session.proxies = formatted_proxy
+            return Web3(Web3.HTTPProvider(
+                self.rpc_url,
+                session=session,
+                request_kwargs={"timeout": 30}
+            ))
+        return Web3(Web3.HTTPProvider(self.rpc_url))
+
+    def hedged_read(self, contract, read, key):
+        """
+        执行只读合约调用，开启对冲时过慢的调用会经另一个代理（或新连接）再查一次，首选调用出错或超时时使用这一份的结果
+
+        Args:
+            contract: 账号当前连接上的合约
+            read: 接收合约、返回查询结果的函数，只能包含只读调用
+            key: 账号标识，用于为对冲请求另选代理
+        """
+        if self.hedge_policy is None:
+            return read(contract)
+
+        def backup():
+            proxy = self.proxy_pool.try_acquire(f'{key}#hedge') if self.proxy_pool is not None else None
+            try:
+                web3 = self.create_web3(proxy, new_session=True)
+                return read(web3.eth.contract(address=contract.address, abi=self.contract_abi))
+            finally:
+                if self.proxy_pool is not None:
+                    self.proxy_pool.release(proxy)
+
+        return hedged_call(self.hedge_policy, lambda: read(contract), backup)
+
     def setup_blockchain_connection(self, proxy=None):
         """建立区块链连接"""
         try:
-            if proxy:
-                formatted_proxy = self.format_proxy(proxy)
-                if formatted_proxy:
-                    session = requests.Session()
-                    session.proxies = formatted_proxy
-                    web3 = Web3(Web3.HTTPProvider(
-                        self.rpc_url,
-                        session=session,
-                        request_kwargs={"timeout": 30}
-                    ))
-                else:
-                    web3 = Web3(Web3.HTTPProvider(self.rpc_url))
-            else:
-                web3 = Web3(Web3.HTTPProvider(self.rpc_url))
+            web3 = self.create_web3(proxy)
 
-            if web3.is_connected():
+            start = time.time()
+            connected = web3.is_connected()
+            self.rpc_breaker.record(connected)
+            if self.proxy_pool is not None:
+                self.proxy_pool.record(normalize_proxy(proxy), connected, time.time() - start)
+            if connected:
                 with self.print_lock:
                     connection_msg = f"{self.current_time()} 成功连接到 Humanity Protocol"
                     connection_msg += f" (使用代理: {proxy})" if proxy else " (直连)"
                     print(Fore.GREEN + connection_msg)
                 return web3
         except Exception as e:
+            self.rpc_breaker.record(False)
+            if self.proxy_pool is not None:
+                self.proxy_pool.record(normalize_proxy(proxy), False)
             with self.print_lock:
                 print(Fore.RED + f"连接错误: {str(e)}")
             return None
 
-    def claim_rewards(self, private_key, web3, contract):
-        """尝试领取奖励"""
+    def claim_rewards(self, private_key, web3, contract, sender_address=None):
+        """尝试领取奖励，sender_address 为读取私钥时已推导的地址"""
         try:
-            account = web3.eth.account.from_key(private_key)
-            sender_address = account.address
-            genesis_claimed = contract.functions.userGenesisClaimStatus(sender_address).call()
-            current_epoch = contract.functions.currentEpoch().call()
-            buffer_amount, claim_status = contract.functions.userClaimStatus(sender_address, current_epoch).call()
+            if sender_address is None:
+                sender_address = web3.eth.account.from_key(private_key).address
+            # 以下均为只读调用，可以对冲；process_claim 中的交易发送不对冲
+            genesis_claimed = self.hedged_read(
+                contract, lambda c: c.functions.userGenesisClaimStatus(sender_address).call(), private_key)
+            current_epoch = self.hedged_read(
+                contract, lambda c: c.functions.currentEpoch().call(), private_key)
+            buffer_amount, claim_status = self.hedged_read(
+                contract, lambda c: c.functions.userClaimStatus(sender_address, current_epoch).call(), private_key)
 
             if (genesis_claimed and not claim_status) or (not genesis_claimed):
                 with self.print_lock:
@@ -259,6 +300,9 @@ class HumanityProtocolBot:
                 self.record_address("claimed", sender_address, private_key)
 
         except Exception as e:
+            if isinstance(e, requests.RequestException):
+                # 网络层面的错误计入 RPC 节点熔断器，合约调用失败不计
+                self.rpc_breaker.record(False)
             with self.print_lock:
                 print(Fore.RED + f"处理地址 {sender_address} 时发生错误: {str(e)}")
             # 发生异常时将地址记录为失败
@@ -320,21 +364,29 @@ class HumanityProtocolBot:
 
     def process_account(self, account):
         """处理单个账号的任务，用于多线程"""
-        # 为账号建立独立的连接
-        web3 = self.setup_blockchain_connection(account['proxy'])
-        if not web3:
-            with self.print_lock:
-                print(Fore.RED + "连接失败，跳过当前账号...")
-            return
+        # 从代理池分配代理，同一账号尽量固定使用同一个代理
+        # RPC 节点熔断期间睡到可以探测的时间，探测进行中时等探测结果，不轮询
+        self.rpc_breaker.wait_allow()
+        proxy = self.proxy_pool.acquire(account['private_key']) if self.proxy_pool is not None else None
+        try:
+            # 为账号建立独立的连接
+            web3 = self.setup_blockchain_connection(proxy)
+            if not web3:
+                with self.print_lock:
+                    print(Fore.RED + "连接失败，跳过当前账号...")
+                return
 
-        # 设置合约
-        contract = web3.eth.contract(
-            address=Web3.to_checksum_address(self.contract_address), 
-            abi=self.contract_abi
-        )
-        
-        # 执行领取操作
-        self.claim_rewards(account['private_key'], web3, contract)
+            # 设置合约
+            contract = web3.eth.contract(
+                address=Web3.to_checksum_address(self.contract_address),
+                abi=self.contract_abi
+            )
+
+            # 执行领取操作
+            self.claim_rewards(account['private_key'], web3, contract, account.get('address'))
+        finally:
+            if self.proxy_pool is not None:
+                self.proxy_pool.release(proxy)
 
     def run(self):
         """运行主循环"""
@@ -346,6 +398,8 @@ class HumanityProtocolBot:
             print(Fore.CYAN + f"{self.current_time()} ╔╝╔╗╚╣╚═╝║╚══╣╚╩═║╔═╗║╚═╝║")
             print(Fore.CYAN + f"{self.current_time()} ╚═╝╚═╩═══╩═══╩═══╩╝─╚╩═══╝")
             print(Fore.CYAN + f"{self.current_time()} 当前并发数设置为: {self.max_workers}")
+            if self.shard is not None:
+                print(Fore.CYAN + f"{self.current_time()} 分片: {self.shard}")
             print(Fore.CYAN + f"{self.current_time()} 等待交易收据: {'是' if self.wait_for_receipt else '否'}, 超时时间: {self.receipt_timeout if self.wait_for_receipt else 'N/A'}秒")
             print(Fore.CYAN + f"{self.current_time()} 数据记录目录: {self.data_dir}")
             print(Fore.CYAN + f"{self.current_time()} 已加载 {len(self.claimed_addresses)} 个已领取地址, {len(self.failed_addresses)} 个失败地址")
@@ -353,24 +407,28 @@ class HumanityProtocolBot:
 
         while True:
             try:
-                # 加载账号数据
-                accounts_data = self.load_accounts_data()
-                total_accounts = len(accounts_data)
-                
                 # 使用线程池执行账号操作
+                total_accounts = 0
                 with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
                     with self.print_lock:
-                        print(Fore.CYAN + f"{self.current_time()} 开始处理 {total_accounts} 个账号，并发数: {self.max_workers}")
-                    
-                    # 提交所有任务到线程池
-                    futures = [executor.submit(self.process_account, account) for account in accounts_data]
-                    
-                    # 等待所有任务完成
-                    for future in futures:
-                        future.result()  # 这会抛出线程中的任何异常
+                        print(Fore.CYAN + f"{self.current_time()} 开始处理账号，并发数: {self.max_workers}")
+
+                    # 边读边提交，在途任务数不超过并发数的2倍，内存占用不随账号数增长
+                    in_flight = set()
+                    for account in self.iter_accounts_data():
+                        if len(in_flight) >= self.max_workers * 2:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()  # 这会抛出线程中的任何异常
+                        in_flight.add(executor.submit(self.process_account, account))
+                        total_accounts += 1
+
+                    # 等待剩余任务完成
+                    for future in in_flight:
+                        future.result()
                 
                 with self.print_lock:
-                    print(Fore.CYAN + f"{self.current_time()} 本轮领取完成，等待6小时后继续运行...")
+                    print(Fore.CYAN + f"{self.current_time()} 本轮领取完成，共 {total_accounts} 个账号，等待6小时后继续运行...")
                     print(Fore.CYAN + f"{self.current_time()} 当前状态: {len(self.claimed_addresses)} 个已领取地址, {len(self.failed_addresses)} 个失败地址")
                 time.sleep(6 * 60 * 60)  # 6小时
 
@@ -385,6 +443,17 @@ class HumanityProtocolBot:
 
 if __name__ == "__main__":
 
+    # --shard i/N：多节点运行时只处理第 i 个分片，其余参数仍按位置解析
+    shard = None
+    if '--shard' in sys.argv:
+        position = sys.argv.index('--shard')
+        try:
+            shard = Shard.parse(sys.argv[position + 1])
+        except (IndexError, ValueError) as e:
+            print(Fore.RED + f"分片参数错误，格式为 --shard i/N: {str(e)}")
+            sys.exit(1)
+        del sys.argv[position:position + 2]
+
     max_workers = 3
     wait_for_receipt = True
     receipt_timeout = 15
@@ -414,6 +483,10 @@ if __name__ == "__main__":
         except ValueError:
             print(Fore.RED + "超时时间必须是整数，使用默认值15秒")
             receipt_timeout = 15
-    
-    bot = HumanityProtocolBot(max_workers=max_workers, wait_for_receipt=wait_for_receipt, receipt_timeout=receipt_timeout)
+
+    # 第四个参数表示是否对冲只读RPC调用：0=否（默认），1=是
+    hedge_reads = len(sys.argv) > 4 and sys.argv[4] == '1'
+
+    bot = HumanityProtocolBot(max_workers=max_workers, wait_for_receipt=wait_for_receipt,
+                              receipt_timeout=receipt_timeout, hedge_reads=hedge_reads, shard=shard)
     bot.run()
@@ -4,17 +4,52 @@ import time
 import sys
 import traceback
 import threading
+import argparse
+import asyncio
 import concurrent.futures
+import itertools
+import multiprocessing
+import random
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
 
+from curl_cffi.requests import AsyncSession
+
 from utils.csv_tools import *
 from utils.logger_utils import logger
-from utils.JWT_utils import is_token_expired, can_claim
+from utils.captcha_pool import CaptchaPool
+from utils.signing_service import SigningService
+from utils.session_pool import SessionPool, get_session_pool
+from utils.proxy_pool import ProxyPool
+from utils.rate_limiter import AdaptiveRateLimiter
+from utils.concurrency_limiter import GradientLimiter
+from utils.circuit_breaker import CircuitOpenError, get_breakers
+from utils.retry import RetryQueue, classify, retry_delay, AUTH_EXPIRED, PERMANENT
+from utils.pipeline import Pipeline
+from utils.JWT_utils import get_token_exp
+from utils.token_refresher import TokenRefreshPlanner
+from utils.key_importer import import_keys
+from utils.sharding import Shard
+from utils.lease import LeaseManager
+from utils.server_clock import get_server_clock
 
-from API import HumanityBotAPI
-from database import AccountDatabase
+from API import HumanityBotAPI, AsyncHumanityBotAPI, TOKEN_EXPIRY_MARGIN, CONNECT_URL, CHECK_URL, CLAIM_URL, can_reuse_token
+from database import AccountDatabase, partition_address_space, format_shanghai_time
 
-from config import concurrent_number
+from config import (
+    concurrent_number, async_concurrent_number,
+    CAPTCHA_POOL_ENABLED, CAPTCHA_POOL_MIN_SIZE, CAPTCHA_POOL_MAX_SIZE, CAPTCHA_TOKEN_TTL,
+    TOKEN_REFRESH_HORIZON_HOURS, DB_WRITE_BEHIND, DB_FLUSH_INTERVAL,
+    SIGNING_SERVICE_ENABLED, SIGNING_PROCESSES,
+    PROXY_FILE, PROXY_MAX_CONCURRENCY, PROXY_QUARANTINE_AFTER, PROXY_QUARANTINE_SECONDS, PROXY_PROBE_INTERVAL,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX,
+    BREAKER_ENABLED,
+    ADAPTIVE_CONCURRENCY, PIPELINE_ENABLED, PIPELINE_WORKERS, PIPELINE_QUEUE_SIZE, PIPELINE_REPORT_INTERVAL,
+    LEASE_ENABLED, LEASE_SECONDS, LEASE_BATCH_SIZE, LEASE_FAILURE_HOLD,
+    DAEMON_PREPARE_BEFORE, DAEMON_CALIBRATE_BEFORE, DAEMON_CALIBRATE_SAMPLES, DAEMON_RELEASE_MARGIN,
+    DAEMON_SPREAD, DAEMON_MAX_SLEEP
+)
 
 # 获取 exe 文件所在的目录
 if getattr(sys, 'frozen', False):
@@ -35,91 +70,885 @@ dir_deque_lock = threading.Lock()
 check_fail_num = 0
 run_success_num = 0
 
+# 本进程的结果统计：success 以及各失败分类的账号数，多进程模式下由父进程汇总
+outcome_counts = Counter()
+outcome_lock = threading.Lock()
+
 wallet_deque = None
-wallet_deque_lock = threading.Lock()
+
+# 多节点运行时本节点负责的分片，None 表示处理全部账号
+shard = None
+
+# 账号租约，启用时按批从数据库领取账号
+leases = None
+
+# 本次运行在 runs 表中的编号，各账号的阶段和结果记录在 run_items 中
+run_id = None
 
 SUCCESS_PATH = None
 FAIL_PATH = None
 
-# 创建数据库实例
-db = AccountDatabase()
+# 数据库实例，由 setup() 创建
+db = None
+
+# 预打码池，在 __main__ 中按配置启动
+captcha_pool = None
+
+# 签名进程池，在 __main__ 中按配置启动
+signing_service = None
+
+# 代理池，proxy.txt 不存在时为 None（直连）
+proxy_pool = None
+
+# 所有客户端共享的接口限速器，由 setup() 创建
+rate_limiter = None
+
+# 各上游依赖的熔断器，由 setup() 创建
+breakers = None
+
+# 同时进行的账号流程数上限，在 __main__ 中按运行模式创建
+concurrency_limiter = None
+
+# 守护模式下按 testnet 响应的 Date 头校准的服务端时钟
+server_clock = None
+
+# 线程模式下每个工作线程复用的API客户端
+client_local = threading.local()
+
+def setup(processes=1):
+    """
+    创建本进程的数据库实例、接口限速器和熔断器
+
+    不在模块导入时创建：签名、导入私钥等 spawn 子进程会重新导入本模块，不需要这些对象
+
+    Args:
+        processes: 多进程模式下的进程总数，服务端按出口限流，各进程分摊总速率
+    """
+    global db, rate_limiter, breakers
+    db = AccountDatabase(write_behind=DB_WRITE_BEHIND, flush_interval=DB_FLUSH_INTERVAL)
+    rate_limiter = AdaptiveRateLimiter(
+        initial_rate=RATE_LIMIT_INITIAL / processes,
+        min_rate=RATE_LIMIT_MIN / processes,
+        max_rate=RATE_LIMIT_MAX / processes
+    ) if RATE_LIMIT_ENABLED else None
+    breakers = get_breakers() if BREAKER_ENABLED else None
+
+
+def hp_token_expired(account: dict) -> bool:
+    """按数据库中的 hp_token_exp 判断是否需要重新登录，无需再解析 JWT"""
+    hp_token_exp = account.get('hp_token_exp')
+    return not hp_token_exp or hp_token_exp - int(time.time()) <= TOKEN_EXPIRY_MARGIN
+
 
-def work():
-    global wallet_deque, db, SUCCESS_PATH,FAIL_PATH
-    pageClient = None
+def start_run(resume=False, now=None):
+    """
+    开始本次运行：把当前可领取、且属于本节点分片的账号写入 run_items；
+    resume 时继续上一次未完成的运行，沿用其结果文件，只处理还没有结果的账号
+
+    Args:
+        now: 按该时间戳判断是否可领取，默认取本地时间
+
+    Returns:
+        本次需要处理的账号数
+    """
+    global run_id, SUCCESS_PATH, FAIL_PATH
+    label = str(shard) if shard is not None else ''
+    if resume:
+        run = db.get_resumable_run(label)
+        if run is not None:
+            run_id = run['id']
+            SUCCESS_PATH, FAIL_PATH = run['success_path'], run['fail_path']
+            logger.info(f"继续第 {run_id} 次运行，剩余 {run['pending']} 个账号")
+            leased, expires_at = db.get_run_leases(run_id)
+            if leased:
+                # 中断的进程没有释放的租约要等到期后才能重新领取；也可能另一个进程仍在处理
+                logger.warning(f"其中 {leased} 个账号仍被其他进程租用，"
+                               f"{max(0, expires_at - int(time.time()))} 秒内不会处理，届时请再次 --resume")
+            return run['pending']
+        logger.info("没有未完成的运行，开始新的运行")
+    run_id = db.create_run(SUCCESS_PATH, FAIL_PATH, label)
+    added = db.snapshot_run(run_id, (lambda account: shard.owns(account['address'])) if shard is not None else None,
+                            now=now)
+    logger.info(f"第 {run_id} 次运行，可领取账号数: {added}")
+    return added
+
+
+def finish_run():
+    counts = db.finish_run(run_id)
+    logger.info(f"第 {run_id} 次运行结果: {counts}")
+    return counts
+
+
+def claimable_accounts(address_range=None):
+    """
+    本次运行中还没有结果的账号
+
+    返回按需读取的迭代器，调度方取用时才从数据库分页读出，内存占用不随账号数增长；
+    启用租约时按批领取，多个进程共用数据库时各自领取、互不重复
+    """
+    global leases
+    if not LEASE_ENABLED:
+        return limit_presolving(db.iter_run_items(run_id, address_range=address_range))
+    leases = LeaseManager(db, lease_seconds=LEASE_SECONDS, batch_size=LEASE_BATCH_SIZE,
+                          failure_hold=LEASE_FAILURE_HOLD, address_range=address_range, run_id=run_id).start()
+    return limit_presolving(leases.iter_accounts())
+
+
+def limit_presolving(accounts):
+    """账号全部取出后，预打码数量以仍未结束的账号数为上限，最后一批登录之后不再预打码"""
+    with outcome_lock:
+        finished_before = sum(outcome_counts.values())
+    if captcha_pool is not None:
+        captcha_pool.set_remaining(None)
+    taken = 0
+    for account in accounts:
+        taken += 1
+        yield account
+    with outcome_lock:
+        finished = sum(outcome_counts.values()) - finished_before
+    if captcha_pool is not None:
+        captcha_pool.set_remaining(taken - finished)
+
+
+@contextmanager
+def refresh_client(account):
+    """续期用的客户端：地址来自数据库不再推导，结束后归还会话和代理"""
+    proxy = proxy_pool.acquire(account['address']) if proxy_pool is not None else None
+    client = None
     try:
-        if len(wallet_deque) <= 0:
-            return False
-
-        pk = None
-        with wallet_deque_lock:
-            pk = wallet_deque.pop()
-
-        if pk is None:
-            return False
-
-        logging.info(f'[{pk} 开始任务]')
-        humanity_client = HumanityBotAPI(private_key=pk, db=db)
-        address = humanity_client.address
-        res = db.get_account(address)
-        hp_token = res.get('hp_token')
-        last_claim_time = res.get('last_claim_time')
-        can_claim_flag = False
-        if not can_claim(last_claim_time):
-            logger.info(f"[{address} 上次claim时间为 {last_claim_time}, 暂时不能领取]")
-            return True
-        else:
-            can_claim_flag = True
+        client = HumanityBotAPI(
+            private_key=account['private_key'], address=account['address'], db=db, proxy=proxy,
+            proxy_pool=proxy_pool, captcha_pool=captcha_pool, signing_service=signing_service,
+            rate_limiter=rate_limiter, concurrency_limiter=concurrency_limiter,
+            breakers=breakers, server_clock=server_clock
+        )
+        yield client
+    finally:
+        if client is not None:
+            client.release()
+        if proxy_pool is not None:
+            proxy_pool.release(proxy)
+
+
+def refresh_tokens(horizon_hours):
+    """为 horizon_hours 小时内过期的账号提前续期 hp_token"""
+    planner = TokenRefreshPlanner(
+        db,
+        client_factory=refresh_client,
+        horizon=int(horizon_hours * 3600),
+        workers=concurrent_number,
+        account_filter=(lambda account: shard.owns(account['address'])) if shard is not None else None
+    )
+    success, fail = planner.drain()
+    logger.info(f"token续期全部完成: 成功 {success}, 失败 {fail}")
+
+
+def get_client(private_key, address, proxy=None):
+    """每个工作线程复用一个API客户端，切换账号时只重新绑定账号（会话及其连接保留）"""
+    client = getattr(client_local, 'client', None)
+    if client is None:
+        client = client_local.client = HumanityBotAPI(
+            private_key=private_key, address=address, db=db, proxy=proxy, proxy_pool=proxy_pool,
+            captcha_pool=captcha_pool, signing_service=signing_service, rate_limiter=rate_limiter,
+            concurrency_limiter=concurrency_limiter, breakers=breakers,
+            server_clock=server_clock
+        )
+    else:
+        client.reset(private_key=private_key, address=address, proxy=proxy)
+    return client
+
+
+def create_concurrency_limiter(ceiling):
+    """ceiling 只是上限；关闭自适应时上限固定为 ceiling"""
+    if ADAPTIVE_CONCURRENCY:
+        return GradientLimiter(ceiling)
+    return GradientLimiter(ceiling, initial_limit=ceiling, min_limit=ceiling)
+
+
+def on_failure(account, attempts, error):
+    """
+    按失败分类决定账号是否重试
+
+    Args:
+        attempts: 该账号各分类已失败的次数，每类按各自的策略计数
+
+    Returns:
+        重试前的等待秒数；不再重试时返回 None，并把失败分类和原因写入 FAIL_PATH
+    """
+    kind, retry_after = classify(error)
+    if isinstance(error, CircuitOpenError):
+        # 请求没有发出，不计入失败次数
+        logger.info(f"[{account['address']}] {str(error)}，稍后重试")
+        return max(1.0, retry_after)
+    if kind == AUTH_EXPIRED:
+        # 丢弃失效的 hp_token，重试时重新登录
+        account['hp_token'] = None
+    attempts[kind] = attempts.get(kind, 0) + 1
+    delay = retry_delay(kind, attempts[kind], retry_after)
+    if delay is None:
+        if kind == PERMANENT:
+            traceback.print_exc()
+        write_csv(FAIL_PATH, [account['private_key'], datetime.now(), kind, str(error)])
+        record_outcome(account, kind)
+        return None
+    logger.info(f"[{account['address']}] 第 {attempts[kind]} 次失败（{kind}），{delay:.1f} 秒后重试: {str(error)}")
+    return delay
+
+
+def record_outcome(account, kind):
+    """账号处理结束（成功或不再重试）：计数、记录到 run_items，并释放租约"""
+    with outcome_lock:
+        outcome_counts[kind] += 1
+    if run_id is not None:
+        db.update_run_item(run_id, account['address'], outcome=kind)
+    if leases is not None:
+        leases.release(account['address'], failed=kind != 'success')
+
+
+def remember_login(account, humanity_client):
+    """登录成功后把 hp_token 记在账号上，重试时从领取阶段继续"""
+    account['hp_token'] = humanity_client.hpToken
+    account['hp_token_exp'] = get_token_exp(humanity_client.hpToken)
+    checkpoint(account, 'claim')
+
+
+def checkpoint(account, stage):
+    """记录账号进入的阶段（hp_token 等已经保存在账号表中，--resume 时按已有 token 从对应阶段继续）"""
+    if run_id is not None:
+        db.update_run_item(run_id, account['address'], stage=stage)
+
+
+def work(account, attempts):
+    """
+    处理一个账号，失败时不在线程内等待
+
+    Args:
+        attempts: 各失败分类的已失败次数，首次执行时为空字典
+
+    Returns:
+        需要重试时返回等待秒数，由调度方放入重试队列
+    """
+    global db, SUCCESS_PATH, FAIL_PATH
+    proxy = None
+    concurrency_limiter.acquire()
+    try:
+        # 账号来自 get_claimable_accounts，已按 next_claim_at 筛选为可领取
+        address = account['address']
+        pk = account['private_key']
+        logging.info(f'[{address} 开始任务]')
+        # 同一账号尽量固定使用同一个代理，该代理不可用时自动换下一个
+        proxy = proxy_pool.acquire(address) if proxy_pool is not None else None
+        humanity_client = get_client(pk, address, proxy)
+        hp_token = account.get('hp_token')
         login_flag = True
         if hp_token:
-            if not is_token_expired(token=hp_token):
+            if not hp_token_expired(account):
                 login_flag = False
-                humanity_client.http_client.headers.update({'authorization': f'Bearer {hp_token}'})
-                humanity_client.http_client.headers.update({'token': hp_token})
+                humanity_client.set_hp_token(hp_token)
 
         if login_flag:
-            humanity_client.collect()
-            humanity_client.auth()
-            humanity_client.loginAndRegister()
+            humanity_client.login(stored_token=account.get('token'))
+            remember_login(account, humanity_client)
 
-        if can_claim_flag:
-            humanity_client.claim()
-        else:
-            available = humanity_client.check()
-            if available:
-                if can_claim(last_claim_time, wallet_address=address):
-                    humanity_client.claim()
+        humanity_client.claim()
 
         now = datetime.now()
         data = [address, pk, now]
         write_csv(SUCCESS_PATH, data)
+        record_outcome(account, 'success')
+        return None
+    except Exception as e:
+        return on_failure(account, attempts, e)
+    finally:
+        if proxy_pool is not None:
+            proxy_pool.release(proxy)
+        concurrency_limiter.release()
+
 
+def run_threads(pool_size):
+    """
+    线程调度入口：失败的账号带着到期时间进入重试队列，到期后重新提交，等待期间不占用线程
+
+    账号边读边提交，在途任务数不超过线程数的2倍，不会为全部账号预先创建 Future
+    """
+    retry_queue = RetryQueue()
+    window = pool_size * 2
+    accounts = iter(wallet_deque)
+    exhausted = False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as executor:
+        futures = {}
+        while not exhausted or futures or len(retry_queue):
+            # 到期的重试优先于新账号
+            for account, attempts in retry_queue.pop_due():
+                futures[executor.submit(work, account, attempts)] = (account, attempts)
+            while not exhausted and len(futures) < window:
+                account = next(accounts, None)
+                if account is None:
+                    exhausted = True
+                    break
+                attempts = {}
+                futures[executor.submit(work, account, attempts)] = (account, attempts)
+            timeout = retry_queue.wait_time()
+            if not futures:
+                if timeout is not None:
+                    time.sleep(timeout)
+                continue
+            done, _ = concurrent.futures.wait(futures, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = futures.pop(future)
+                delay = future.result()
+                if delay is not None:
+                    retry_queue.schedule(item, delay)
+
+
+
+@contextmanager
+def stage_client(account):
+    """流水线各阶段按账号当前状态取得客户端，阶段结束即归还代理，排队期间不占用代理和会话"""
+    proxy = proxy_pool.acquire(account['address']) if proxy_pool is not None else None
+    try:
+        client = get_client(account['private_key'], account['address'], proxy)
+        client.token = account.get('token')
+        client.code = account.get('code')
+        if account.get('hp_token'):
+            client.set_hp_token(account['hp_token'])
+        yield client
+    finally:
+        if proxy_pool is not None:
+            proxy_pool.release(proxy)
+
+
+def entry_stage(account):
+    """按账号已有的 token 选择起始阶段，首次提交和重试时都会重新判断"""
+    if account.get('hp_token') and not hp_token_expired(account):
+        return 'claim'
+    if can_reuse_token(account.get('token')):
+        # 复用已有的 terminal3 token 失败时回到打码阶段，与 login() 一致
+        account['token_reused'] = True
+        return 'auth'
+    return 'collect'
+
+
+def reuse_failed(account, error):
+    """复用的 terminal3 token 无效时改走完整的签名登录"""
+    if not account.pop('token_reused', False) or isinstance(error, CircuitOpenError):
+        return False
+    logger.info(f"[{account['address']}] 复用terminal3 token失败，重新签名登录: {str(error)}")
+    account['token'] = None
+    return True
+
+
+def stage_collect(account):
+    with stage_client(account) as client:
+        client._preflight()
+        client.collect()
+        account['token'] = client.token
+    return 'auth'
+
+
+def stage_auth(account):
+    concurrency_limiter.acquire()
+    try:
+        with stage_client(account) as client:
+            client.auth()
+            account['code'] = client.code
     except Exception as e:
-        traceback.print_exc()
-        now = datetime.now()
-        data = [pk, now]
-        write_csv(FAIL_PATH, data)
+        if reuse_failed(account, e):
+            return 'collect'
+        raise
+    finally:
+        concurrency_limiter.release()
+    return 'login'
 
 
-if __name__ == '__main__':
+def stage_login(account):
+    concurrency_limiter.acquire()
+    try:
+        with stage_client(account) as client:
+            client.loginAndRegister()
+            remember_login(account, client)
+    except Exception as e:
+        if reuse_failed(account, e):
+            return 'collect'
+        raise
+    finally:
+        concurrency_limiter.release()
+    account.pop('token_reused', None)
+    return 'claim'
 
 
-    wallet_path = os.path.join(script_dir, 'data', 'private_keys.txt')
-    wallet_deque = load_data_from_txt(wallet_path)
+def stage_claim(account):
+    concurrency_limiter.acquire()
+    try:
+        with stage_client(account) as client:
+            client.claim()
+    finally:
+        concurrency_limiter.release()
+    write_csv(SUCCESS_PATH, [account['address'], account['private_key'], datetime.now()])
+    record_outcome(account, 'success')
+    return None
 
-    # 获取程序启动时间并格式化为指定格式
-    start_time = datetime.now().strftime('%m%d_%H%M')
-    SUCCESS_PATH = os.path.join(script_dir, 'data', f'success_{start_time}.txt')
-    FAIL_PATH = os.path.join(script_dir, 'data', f'fail_{start_time}.txt')
 
-    pool_size = concurrent_number
-    # 创建线程池，并发大小为3
-    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as executor:
-        # 使用列表推导式创建并提交1000个任务到线程池
-        futures = [executor.submit(work) for i in range(len(wallet_deque))]
-        # 等待所有任务完成
+def checkpointed(stage, handler):
+    def run_stage(account):
+        checkpoint(account, stage)
+        return handler(account)
+    return run_stage
+
+
+# 发起 testnet 请求的流水线阶段
+NETWORK_STAGES = ('auth', 'login', 'claim')
+
+
+def create_pipeline(max_concurrency):
+    """
+    创建并启动打码/签名、授权、登录、领取四个阶段的流水线
+
+    Args:
+        max_concurrency: 并发上限，授权/登录/领取阶段的线程数都不超过该值
+    """
+    pipeline = Pipeline(
+        entry=entry_stage,
+        on_error=lambda account, stage, e: on_failure(account, account.setdefault('failures', {}), e),
+        report_interval=PIPELINE_REPORT_INTERVAL
+    )
+    for name, handler in (('collect', stage_collect), ('auth', stage_auth),
+                          ('login', stage_login), ('claim', stage_claim)):
+        workers = min(PIPELINE_WORKERS[name], max_concurrency) if name in NETWORK_STAGES else PIPELINE_WORKERS[name]
+        pipeline.add_stage(name, checkpointed(name, handler), workers, PIPELINE_QUEUE_SIZE)
+    return pipeline.start()
+
+
+def run_pipeline(pipeline=None, max_concurrency=None):
+    """
+    流水线调度入口：打码/签名、授权、登录、领取各有独立的有界队列和线程池，
+    打码慢时只会堆积 collect 队列，领取阶段仍按自己的线程数全速运行
+
+    Args:
+        pipeline: 复用已启动的流水线（守护模式下各阶段线程及其客户端、会话跨窗口保留），为空时新建并在结束后关闭
+        max_concurrency: 新建流水线时的并发上限，默认取 config.concurrent_number
+    """
+    owned = pipeline is None
+    pipeline = pipeline or create_pipeline(max_concurrency or concurrent_number)
+    try:
+        pipeline.run(wallet_deque)
+        logger.info(f"流水线结束: {pipeline.stats()}")
+    finally:
+        if owned:
+            pipeline.close()
+
+async def work_async(account, session_pool):
+    """work()的asyncio版本；重试等待期间释放并发名额，不占用事件循环"""
+    attempts = {}
+    while True:
+        delay = await work_async_once(account, session_pool, attempts)
+        if delay is None:
+            return
+        await asyncio.sleep(delay)
+
+
+async def work_async_once(account, session_pool, attempts):
+    """由 concurrency_limiter 限制同时进行的账号流程数"""
+    await concurrency_limiter.acquire_async()
+    humanity_client = None
+    proxy = None
+    address = account['address']
+    pk = account['private_key']
+    try:
+        logging.info(f'[{address} 开始任务]')
+        if proxy_pool is not None:
+            proxy = await proxy_pool.acquire_async(address)
+        humanity_client = AsyncHumanityBotAPI(private_key=pk, address=address, db=db, captcha_pool=captcha_pool,
+                                              signing_service=signing_service, session_pool=session_pool,
+                                              proxy=proxy, proxy_pool=proxy_pool, rate_limiter=rate_limiter,
+                                              concurrency_limiter=concurrency_limiter,
+                                              breakers=breakers, server_clock=server_clock)
+        hp_token = account.get('hp_token')
+        if hp_token and not hp_token_expired(account):
+            humanity_client.set_hp_token(hp_token)
+        else:
+            await humanity_client.login(stored_token=account.get('token'))
+            await asyncio.to_thread(remember_login, account, humanity_client)
+
+        await humanity_client.claim()
+
+        # 结果文件和 run_items/租约的写入放到线程中，等待写锁时不阻塞其他账号的请求
+        await asyncio.to_thread(write_csv, SUCCESS_PATH, [address, pk, datetime.now()])
+        await asyncio.to_thread(record_outcome, account, 'success')
+        return None
+    except Exception as e:
+        return await asyncio.to_thread(on_failure, account, attempts, e)
+    finally:
+        if humanity_client is not None:
+            await humanity_client.aclose()
+        if proxy_pool is not None:
+            proxy_pool.release(proxy)
+        concurrency_limiter.release()
+
+
+async def iter_accounts_async(accounts, batch_size=100):
+    """在线程中按批读取账号：取号会查询数据库，按租约领取时还要等待写锁，不能在事件循环中执行"""
+    iterator = iter(accounts)
+    while True:
+        batch = await asyncio.to_thread(list, itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        for account in batch:
+            yield account
+
+
+async def run_async(max_in_flight, pacing=None):
+    """
+    asyncio调度入口：concurrency_limiter 控制同时进行的账号流程数
+
+    账号边读边创建任务，任务数（含等待重试的）不超过 max_in_flight 的2倍，不会为全部账号预先创建任务
+
+    Args:
+        max_in_flight: 并发上限
+        pacing: (账号数, 秒数)，把任务创建分散到该时长内；等待用 asyncio.sleep，不阻塞进行中的流程
+    """
+    delays = release_delays(*pacing) if pacing else None
+    # 账号流程结束后会话归还池中，下一个账号复用其连接
+    session_pool = SessionPool(session_class=AsyncSession, max_idle_per_proxy=max_in_flight)
+    tasks = set()
+    async for account in iter_accounts_async(wallet_deque):
+        if len(tasks) >= max_in_flight * 2:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        if delays is not None:
+            delay = next(delays)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.add(asyncio.create_task(work_async(account, session_pool)))
+    if tasks:
+        await asyncio.gather(*tasks)
+    await session_pool.aclose()
+
+
+def start_services(signing=SIGNING_SERVICE_ENABLED):
+    """启动代理池、签名进程池、预打码池"""
+    global proxy_pool, signing_service, captcha_pool
+    proxy_pool = ProxyPool.from_file(
+        os.path.join(script_dir, PROXY_FILE),
+        max_concurrency=PROXY_MAX_CONCURRENCY,
+        quarantine_after=PROXY_QUARANTINE_AFTER,
+        quarantine_seconds=PROXY_QUARANTINE_SECONDS
+    )
+    if proxy_pool is not None:
+        logger.info(f"已加载 {len(proxy_pool)} 个代理")
+        proxy_pool.start_probing(PROXY_PROBE_INTERVAL)
+
+    if signing:
+        signing_service = SigningService(db.db_path, processes=SIGNING_PROCESSES).start()
+
+    if CAPTCHA_POOL_ENABLED:
+        captcha_pool = CaptchaPool(
+            min_size=CAPTCHA_POOL_MIN_SIZE,
+            max_size=CAPTCHA_POOL_MAX_SIZE,
+            ttl=CAPTCHA_TOKEN_TTL,
+            breaker=breakers.get(CONNECT_URL) if breakers is not None else None
+        ).start()
+
+
+def close_leases():
+    global leases
+    if leases is not None:
+        leases.close()
+        leases = None
+
+
+def stop_services():
+    close_leases()
+    if captcha_pool is not None:
+        captcha_pool.close()
+    if signing_service is not None:
+        signing_service.close()
+    if proxy_pool is not None:
+        proxy_pool.stop()
+
+
+def run_claims(use_async, concurrency, pacing=None):
+    """
+    按运行模式处理 wallet_deque 中的账号
+
+    Args:
+        pacing: (账号数, 秒数)，把账号的提交分散到该时长内
+    """
+    global concurrency_limiter, wallet_deque
+    if use_async:
+        max_in_flight = concurrency or async_concurrent_number
+        concurrency_limiter = create_concurrency_limiter(max_in_flight)
+        asyncio.run(run_async(max_in_flight, pacing))
+        return
+    if pacing:
+        wallet_deque = paced(wallet_deque, *pacing)
+    if PIPELINE_ENABLED:
+        # 与非流水线模式相同，并发上限取 concurrent_number，各网络阶段的线程数不超过该上限
+        max_concurrency = concurrency or concurrent_number
+        concurrency_limiter = create_concurrency_limiter(max_concurrency)
+        run_pipeline(max_concurrency=max_concurrency)
+    else:
+        pool_size = concurrency or concurrent_number
+        # 线程数即并发上限，实际同时进行的账号数由 concurrency_limiter 自适应调整
+        concurrency_limiter = create_concurrency_limiter(pool_size)
+        run_threads(pool_size)
+
+
+def run_worker(index, processes, address_range, use_async, concurrency, success_path, fail_path, worker_run_id):
+    """
+    多进程模式下子进程的入口：只处理 address_range 地址段内的账号
+
+    子进程以 spawn 方式启动，数据库连接、会话池、限速器等都在子进程内重新创建
+
+    Returns:
+        本进程的账号数、各结果的计数和耗时，由父进程汇总
+    """
+    global wallet_deque, SUCCESS_PATH, FAIL_PATH, run_id
+    started = time.time()
+    setup(processes)
+    SUCCESS_PATH, FAIL_PATH = success_path, fail_path
+    run_id = worker_run_id
+    wallet_deque = claimable_accounts(address_range)
+    # 签名已分散在各进程中进行，不再额外启动签名进程池
+    start_services(signing=False)
+    try:
+        run_claims(use_async, concurrency)
+    finally:
+        stop_services()
+        db.shutdown()
+    return {
+        'index': index,
+        'accounts': sum(outcome_counts.values()),
+        'outcomes': dict(outcome_counts),
+        'elapsed': time.time() - started,
+    }
+
+
+def run_processes(processes, use_async, concurrency):
+    """
+    把账号分给 processes 个子进程，每个进程运行自己的线程/asyncio调度，
+    JWT 解析、签名、JSON 解析等 CPU 开销分散到多个核；结果由父进程汇总
+
+    启用租约时各进程从数据库按批领取账号，先处理完的进程继续领取，不做静态划分；
+    否则按地址段划分。子进程共用同一个数据库文件（WAL），写入时按 busy_timeout 等待写锁
+    """
+    # 子进程开始写库前，父进程导入的账号必须已经落盘
+    db.flush()
+    started = time.time()
+    total = Counter()
+    accounts = 0
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [
+            executor.submit(run_worker, index, processes, address_range, use_async, concurrency,
+                            SUCCESS_PATH, FAIL_PATH, run_id)
+            for index, address_range in enumerate(
+                [None] * processes if LEASE_ENABLED else partition_address_space(processes))
+        ]
         for future in concurrent.futures.as_completed(futures):
-            result = future.result()  # 获取每个任务的结果
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"子进程异常退出: {str(e)}")
+                continue
+            accounts += result['accounts']
+            total.update(result['outcomes'])
+            logger.info(f"进程 {result['index'] + 1}/{processes} 完成: 账号 {result['accounts']}, "
+                        f"结果 {result['outcomes']}, 耗时 {result['elapsed']:.1f}s")
+    elapsed = time.time() - started
+    logger.info(f"全部进程完成: 账号 {accounts}, 结果 {dict(total)}, 耗时 {elapsed:.1f}s, "
+                f"{accounts / elapsed if elapsed else 0:.1f} 个/秒")
+    return total
+
+
+def outcome_paths(start_time):
+    """按开始时间（及分片）生成 success/fail 文件路径"""
+    if shard is not None:
+        # 各分片的结果文件分开，用 python -m utils.sharding merge 合并
+        start_time = f'{start_time}_{shard.suffix}'
+    return (os.path.join(script_dir, 'data', f'success_{start_time}.txt'),
+            os.path.join(script_dir, 'data', f'fail_{start_time}.txt'))
+
+
+def probe_server_date():
+    """时钟校准用的探测请求：未登录访问 daily/check 也会返回带 Date 头的响应"""
+    session_pool = get_session_pool()
+    session = session_pool.acquire()
+    try:
+        return session.get(CHECK_URL, timeout=10, allow_redirects=False).headers.get('date')
+    finally:
+        session_pool.release(session)
+
+
+def sleep_until(server_timestamp):
+    """按服务端时钟睡到指定时刻；分段睡眠，期间重新校准或本地时钟被调整时也能按时醒来"""
+    while True:
+        remaining = server_clock.to_local(server_timestamp) - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 60))
+
+
+def release_delays(total, spread):
+    """依次产出每个账号提交前需要等待的秒数：total 个账号均匀分散到 spread 秒内，每个账号在自己的时间片内随机抖动"""
+    started = time.time()
+    step = spread / max(1, total)
+    i = 0
+    while True:
+        yield started + (i + random.random()) * step - time.time()
+        i += 1
+
+
+def paced(accounts, total, spread):
+    """线程模式下按 release_delays 的节奏产出账号"""
+    delays = release_delays(total, spread)
+    for account in accounts:
+        delay = next(delays)
+        if delay > 0:
+            time.sleep(delay)
+        yield account
 
-    db.close()
+
+def run_daemon(args, wallet_path):
+    """
+    守护模式：常驻进程，数据库、会话、签名进程池、流水线线程在各领取窗口之间保持不变
+
+    每轮先找到下一个领取窗口（最早的 next_claim_at），窗口前导入新私钥并续期即将过期的 token，
+    临近窗口时按服务端 Date 头校准时钟，在服务端时间到达窗口时开始领取，可选在 spread 秒内抖动分散
+    """
+    global wallet_deque, concurrency_limiter, server_clock, SUCCESS_PATH, FAIL_PATH
+    server_clock = get_server_clock(CLAIM_URL)
+    start_services()
+    pipeline = None
+    if PIPELINE_ENABLED and not args.use_async:
+        max_concurrency = args.concurrency or concurrent_number
+        concurrency_limiter = create_concurrency_limiter(max_concurrency)
+        pipeline = create_pipeline(max_concurrency)
+    last_window = -1
+    try:
+        while True:
+            # 守护期间追加到私钥文件的新账号在下一个窗口处理
+            import_keys(db, wallet_path, processes=args.import_processes)
+            window = db.get_next_claim_at(after=last_window)
+            now = server_clock.now()
+            if window is None or window - DAEMON_PREPARE_BEFORE - now > DAEMON_MAX_SLEEP:
+                sleep_until(now + DAEMON_MAX_SLEEP)
+                continue
+            if window > now:
+                logger.info(f"下一个领取窗口: {format_shanghai_time(window)}（上海时间），{window - now:.0f} 秒后")
+                sleep_until(window - DAEMON_PREPARE_BEFORE)
+                refresh_tokens(max(0.0, window - server_clock.now()) / 3600 + 1)
+                sleep_until(window - DAEMON_CALIBRATE_BEFORE)
+                server_clock.reset()
+                offset, uncertainty = server_clock.calibrate(probe_server_date, DAEMON_CALIBRATE_SAMPLES)
+                if uncertainty is None:
+                    logger.info("时钟校准失败，按本地时间开始领取")
+                else:
+                    logger.info(f"服务端时钟偏差 {offset:+.3f} 秒（误差 ±{uncertainty:.3f} 秒）")
+                # 多等一个误差上限，保证服务端已经过了窗口
+                sleep_until(window + (uncertainty or 0) + DAEMON_RELEASE_MARGIN)
+
+            snapshot_at = int(server_clock.now())
+            last_window = snapshot_at
+            SUCCESS_PATH, FAIL_PATH = outcome_paths(datetime.now().strftime('%m%d_%H%M'))
+            total = start_run(now=snapshot_at)
+            pacing = (total, args.spread) if args.spread else None
+            wallet_deque = claimable_accounts()
+            if pipeline is not None:
+                if pacing:
+                    wallet_deque = paced(wallet_deque, *pacing)
+                run_pipeline(pipeline)
+            else:
+                run_claims(args.use_async, args.concurrency, pacing)
+            close_leases()
+            finish_run()
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        stop_services()
+
+
+def parse_shard(value):
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Humanity 批量签到')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='使用asyncio模式运行（基于curl_cffi AsyncSession）')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='并发上限，默认线程模式取config.concurrent_number，asyncio模式取config.async_concurrent_number')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='按地址段把账号分给 N 个进程并行处理，--concurrency 为每个进程的并发上限')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='多节点运行时只处理第 i 个分片（共 N 个，格式 i/N），按地址哈希分配账号')
+    parser.add_argument('--daemon', action='store_true',
+                        help='常驻运行：按服务端时钟在每天的领取窗口开启时自动领取，会话、数据库、签名进程在窗口之间保持')
+    parser.add_argument('--spread', type=float, default=DAEMON_SPREAD,
+                        help='守护模式下把领取分散到窗口开启后的 N 秒内（带随机抖动），默认取 config.DAEMON_SPREAD')
+    parser.add_argument('--resume', action='store_true',
+                        help='继续上一次中断的运行，只处理还没有结果的账号')
+    parser.add_argument('--refresh-tokens', action='store_true',
+                        help='只为即将过期的账号提前续期 hp_token，适合在领取窗口前定时运行')
+    parser.add_argument('--refresh-within', type=float, default=TOKEN_REFRESH_HORIZON_HOURS,
+                        help='续期 N 小时内过期的 token，默认取 config.TOKEN_REFRESH_HORIZON_HOURS')
+    parser.add_argument('--import-processes', type=int, default=None,
+                        help='导入新私钥时推导地址的进程数，默认CPU核数')
+    args = parser.parse_args()
+    if args.daemon and args.processes > 1:
+        parser.error('--daemon 不支持 --processes，多进程请在各节点分别以 --shard 运行守护进程')
+    return args
+
+
+if __name__ == '__main__':
+    # 打包为 exe 时子进程需要
+    multiprocessing.freeze_support()
+    args = parse_args()
+    setup()
+
+    wallet_path = os.path.join(script_dir, 'data', 'private_keys.txt')
+    # 只为新增的私钥推导地址，地址推导在进程池中并行
+    import_keys(db, wallet_path, processes=args.import_processes)
+
+    shard = args.shard
+    if shard is not None:
+        logger.info(f"分片 {shard}")
+    # 获取程序启动时间并格式化为指定格式
+    SUCCESS_PATH, FAIL_PATH = outcome_paths(datetime.now().strftime('%m%d_%H%M'))
+
+    if args.daemon:
+        try:
+            run_daemon(args, wallet_path)
+        except KeyboardInterrupt:
+            logger.info("守护进程已停止")
+    elif args.refresh_tokens:
+        start_services()
+        try:
+            refresh_tokens(args.refresh_within)
+        finally:
+            stop_services()
+    else:
+        # 只有到了 next_claim_at 的账号才会进入本次运行的任务队列
+        start_run(args.resume)
+        if args.processes > 1:
+            run_processes(args.processes, args.use_async, args.concurrency)
+        else:
+            wallet_deque = claimable_accounts()
+            start_services()
+            try:
+                run_claims(args.use_async, args.concurrency)
+            finally:
+                # 中断时也要释放租约，--resume 才能立即重新领取这些账号
+                stop_services()
+        pending = finish_run().get('pending')
+        if pending:
+            db.shutdown()
+            print(f"还有 {pending} 个账号未完成，请稍后使用 --resume 继续")
+            sys.exit(1)
+    db.shutdown()
     print("全部任务已完成!")
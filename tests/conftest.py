@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 与 utils/captcha.py 相同：把项目根目录加入路径，测试中可以直接 import config / utils
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
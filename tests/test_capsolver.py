@@ -0,0 +1,80 @@
+"""CapsolverClient 对本地替身服务（utils.capsolver_stub）的 createTask / getTaskResult 流程"""
+import time
+
+import pytest
+
+from utils.captcha import CapsolverClient
+from utils.capsolver_stub import CapsolverStubServer
+
+
+@pytest.fixture
+def stub():
+    server = CapsolverStubServer(solve_delay=0.2).start()
+    yield server
+    server.stop()
+
+
+def make_client(stub, **kwargs):
+    return CapsolverClient(api_key='test', base_url=stub.url, first_poll_delay=0.05,
+                           min_interval=0.05, max_interval=0.1, **kwargs)
+
+
+def test_solve_returns_token(stub):
+    client = make_client(stub)
+    try:
+        futures = [client.submit() for _ in range(5)]
+        results = [future.result(timeout=10) for future in futures]
+    finally:
+        client.close()
+
+    assert all(result and result.startswith('stub-') for result in results)
+    assert len(set(results)) == 5
+    assert client.create_requests == stub.create_count == 5
+    assert client.poll_requests == stub.poll_count
+    assert client.pending() == 0
+
+
+def test_failed_task_resolves_to_none(stub):
+    stub.fail_every = 2
+    client = make_client(stub)
+    try:
+        results = [client.solve(timeout=10) for _ in range(2)]
+    finally:
+        client.close()
+
+    assert results[0].startswith('stub-')
+    assert results[1] is None
+    assert client.pending() == 0
+
+
+def test_task_timeout_resolves_to_none(stub):
+    stub.solve_delay = 60
+    client = make_client(stub, task_timeout=0.3)
+    try:
+        assert client.solve(timeout=10) is None
+    finally:
+        client.close()
+    assert client.pending() == 0
+
+
+def test_unreachable_server_resolves_to_none():
+    client = CapsolverClient(api_key='test', base_url='http://127.0.0.1:9', request_timeout=2)
+    try:
+        assert client.solve(timeout=10) is None
+    finally:
+        client.close()
+    assert client.create_requests == 1
+
+
+def test_close_resolves_outstanding_tasks(stub):
+    stub.solve_delay = 60
+    client = make_client(stub)
+    futures = [client.submit() for _ in range(3)]
+    deadline = time.time() + 5
+    while client.pending() < 3 and time.time() < deadline:
+        time.sleep(0.05)
+    client.close()
+
+    assert [future.result(timeout=5) for future in futures] == [None, None, None]
+    assert not client._poller.is_alive()
+    assert client.submit().result(timeout=5) is None
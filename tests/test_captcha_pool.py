@@ -0,0 +1,60 @@
+"""CaptchaPool 的等待队列和预打码上限，打码由本地替身服务（utils.capsolver_stub）完成"""
+import time
+
+import pytest
+
+from utils.captcha import CapsolverClient
+from utils.captcha_pool import CaptchaPool
+from utils.capsolver_stub import CapsolverStubServer
+
+
+@pytest.fixture
+def client():
+    stub = CapsolverStubServer(solve_delay=0.3).start()
+    client = CapsolverClient(api_key='test', base_url=stub.url, first_poll_delay=0.05,
+                             min_interval=0.05, max_interval=0.1)
+    yield client
+    client.close()
+    stub.stop()
+
+
+def test_timed_out_waiter_leaves_queue(client):
+    pool = CaptchaPool(client, min_size=0)
+    assert pool.get(timeout=0.01) is None
+    assert pool.stats()['waiting'] == 0
+    pool.close()
+
+
+def test_waiter_gets_token(client):
+    pool = CaptchaPool(client, min_size=0).start()
+    try:
+        assert pool.get(timeout=10).startswith('stub-')
+    finally:
+        pool.close()
+
+
+def test_no_presolving_once_remaining_is_exhausted(client):
+    pool = CaptchaPool(client, min_size=2).start()
+    try:
+        pool.set_remaining(1)
+        assert pool.get(timeout=10).startswith('stub-')
+        time.sleep(0.5)
+        stats = pool.stats()
+        assert stats['target'] == 0
+        assert stats['ready'] + stats['solving'] == 0
+    finally:
+        pool.close()
+
+
+def test_abandoned_token_returns_to_pool(client):
+    pool = CaptchaPool(client, min_size=0)
+    future = pool.acquire()
+    with pool._cond:
+        pool._put_locked(time.time(), 'late-token')
+    assert future.result(timeout=0) == 'late-token'
+
+    # 取用方已经放弃（例如 wait_for 超时），token 留给下一个取用方
+    pool.abandon(future)
+    assert pool.stats()['ready'] == 1
+    assert pool.get(timeout=0) == 'late-token'
+    pool.close()
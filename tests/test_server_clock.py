@@ -0,0 +1,53 @@
+"""ServerClock 按 Date 头估计服务端时钟偏差"""
+import time
+from email.utils import formatdate
+
+from utils.server_clock import ServerClock
+
+
+def date(timestamp):
+    return formatdate(int(timestamp), usegmt=True)
+
+
+def calibrated_clock():
+    clock = ServerClock()
+    for t in (1000.2, 1000.7, 1001.05):
+        assert clock.observe(date(t), t - 0.02, t)
+    return clock
+
+
+def test_samples_narrow_offset():
+    clock = calibrated_clock()
+    assert clock.uncertainty < 0.5
+    assert abs(clock.offset) <= clock.uncertainty
+
+
+def test_single_outlier_is_discarded():
+    clock = calibrated_clock()
+    offset, uncertainty = clock.offset, clock.uncertainty
+    # 缓存返回的旧 Date
+    assert not clock.observe(date(900), 1002.0, 1002.05)
+    assert (clock.offset, clock.uncertainty) == (offset, uncertainty)
+    assert clock.outliers == 1
+
+
+def test_consecutive_conflicts_restart_estimate():
+    clock = calibrated_clock()
+    # 本地时钟被往回调了 500 秒
+    results = [clock.observe(date(1503 + i), 1003.0 + i, 1003.05 + i) for i in range(3)]
+    assert results == [False, False, True]
+    assert 499 < clock.offset < 501
+
+
+def test_passive_samples_ignored_while_calibrating():
+    clock = ServerClock()
+
+    def probe():
+        # 校准过程中其他请求带回的旧 Date 不应影响结果
+        now = time.time()
+        assert not clock.observe(date(now - 600), now - 0.01, now)
+        return date(time.time() + 5)
+
+    clock.calibrate(probe, samples=1)
+    assert clock.samples == 1
+    assert 4 < clock.offset < 6
@@ -49,12 +49,84 @@ def is_token_expired(token: str, wallet_address: Optional[str] = None) -> bool:
         return True
 
 
+def get_token_exp(token: Optional[str]) -> Optional[int]:
+    """
+    读取 JWT token 的过期时间
+
+    Args:
+        token (str): JWT token 字符串
+
+    Returns:
+        Optional[int]: exp 时间戳（秒）；不是 JWT 或没有 exp 字段时返回 None
+    """
+    if not token:
+        return None
+    try:
+        decoded = jwt.decode(token, options={"verify_signature": False})
+        exp = decoded.get('exp')
+        return int(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+# 每日领取在上海时间9点重置
+CLAIM_RESET_HOUR = 9
+
+
+def parse_claim_time(last_claim_time: str) -> datetime:
+    """将数据库中的上次领取时间（上海时间字符串）转换为带时区的datetime"""
+    last_claim = datetime.strptime(last_claim_time, '%Y-%m-%d %H:%M:%S')
+    return SHANGHAI_TZ.localize(last_claim)
+
+
+def next_claim_timestamp(last_claim: datetime) -> int:
+    """
+    计算下一次可以领取的时间：上次领取之后的第一个上海时间9点
+
+    Args:
+        last_claim (datetime): 上次领取时间（带时区）
+
+    Returns:
+        int: 下一次可领取时间的时间戳（秒）
+    """
+    last_claim = last_claim.astimezone(SHANGHAI_TZ)
+    reset = SHANGHAI_TZ.localize(
+        last_claim.replace(tzinfo=None, hour=CLAIM_RESET_HOUR, minute=0, second=0, microsecond=0)
+    )
+    if reset <= last_claim:
+        reset = SHANGHAI_TZ.localize(reset.replace(tzinfo=None) + timedelta(days=1))
+    return int(reset.timestamp())
+
+
+def parse_next_daily_award(value: Any) -> Optional[int]:
+    """
+    解析 check()/claim() 返回的 next_daily_award
+
+    支持秒/毫秒时间戳和 ISO 格式时间字符串，无法解析时返回 None
+    """
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, (int, float)) or str(value).isdigit():
+            ts = float(value)
+            # 毫秒时间戳
+            if ts > 1e12:
+                ts /= 1000
+            return int(ts)
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = pytz.utc.localize(parsed)
+        return int(parsed.timestamp())
+    except (ValueError, OverflowError):
+        return None
+
+
 def can_claim(last_claim_time: Optional[str], wallet_address: Optional[str] = None) -> bool:
     """
     判断是否可以领取奖励（每天9点后可以领取一次）
 
     Args:
-        last_claim_time (str): 上次领取时间的字符串，格式为 SQLite 的 TIMESTAMP
+        last_claim_time (str): 上次领取时间的字符串，update_claim_time 写入的上海时间
         wallet_address (str, optional): 钱包地址，用于日志记录
 
     Returns:
@@ -66,47 +138,21 @@ def can_claim(last_claim_time: Optional[str], wallet_address: Optional[str] = No
                 logging.info(f'[{wallet_address}] 首次领取')
             return True
 
-        # 将字符串转换为datetime对象（默认UTC）
-        last_claim = datetime.strptime(last_claim_time, '%Y-%m-%d %H:%M:%S')
-        last_claim = pytz.utc.localize(last_claim)  # 设置为UTC时间
-        last_claim = last_claim.astimezone(SHANGHAI_TZ)  # 转换为上海时间
-
-        # 获取当前上海时间
-        now = datetime.now(SHANGHAI_TZ)
-
-        # 获取今天的早上9点（上海时间）
-        today_9am = now.replace(hour=9, minute=0, second=0, microsecond=0)
+        last_claim = parse_claim_time(last_claim_time)
+        next_claim = next_claim_timestamp(last_claim)
+        now = int(time.time())
 
-        # 添加调试日志
         if wallet_address:
-            logging.info(f'[{wallet_address}] 时间信息:')
-            logging.info(f'当前时间（上海）: {now}')
-            logging.info(f'今天9点（上海）: {today_9am}')
-            logging.info(f'上次领取（原始）: {last_claim_time}')
-            logging.info(f'上次领取（上海）: {last_claim}')
-
-        # 新的判断逻辑：
-        # 1. 如果现在还没到9点，不能领取
-        if now < today_9am:
-            if wallet_address:
-                logging.info(f'[{wallet_address}] 还未到领取时间（北京时间早上9点）')
-            return False
-
-        # 2. 如果上次领取是在今天之前，可以领取
-        if last_claim.date() < now.date():
-            if wallet_address:
-                logging.info(f'[{wallet_address}] 可以领取奖励（上次领取是在今天之前）')
-            return True
+            logging.info(f'[{wallet_address}] 上次领取（上海）: {last_claim}, '
+                         f'下次可领取（上海）: {datetime.fromtimestamp(next_claim, SHANGHAI_TZ)}')
 
-        # 3. 如果上次领取是今天，且现在已经过了9点，就可以领取
-        if now >= today_9am:
+        if now >= next_claim:
             if wallet_address:
-                logging.info(f'[{wallet_address}] 可以领取奖励（今天9点后可领取）')
+                logging.info(f'[{wallet_address}] 可以领取奖励')
             return True
 
-        # 4. 其他情况不能领取
         if wallet_address:
-            logging.info(f'[{wallet_address}] 暂时不能领取')
+            logging.info(f'[{wallet_address}] 还未到领取时间（北京时间早上9点）')
         return False
 
     except Exception as e:
@@ -0,0 +1,109 @@
+"""
+本地 Capsolver 替身服务，用于在不消耗打码费用的情况下测试打码客户端和预打码池
+
+    python -m utils.capsolver_stub --port 8765 --solve-delay 5
+
+然后将 config.py 中的 CAPSOLVER_API_URL 改为 http://127.0.0.1:8765
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CapsolverStubServer:
+    """
+    模拟 createTask / getTaskResult 接口
+
+    Args:
+        solve_delay: 任务从创建到 ready 的秒数
+        fail_every: 每 N 个任务失败一次，0 表示不失败
+        port: 监听端口，0 表示随机端口
+    """
+
+    def __init__(self, solve_delay: float = 3.0, fail_every: int = 0, host: str = '127.0.0.1', port: int = 0):
+        self.solve_delay = solve_delay
+        self.fail_every = fail_every
+        self.tasks = {}
+        self.create_count = 0
+        self.poll_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='capsolver-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, path: str, body: dict) -> dict:
+        with self._lock:
+            if path == '/createTask':
+                self.create_count += 1
+                task_id = uuid.uuid4().hex
+                failed = bool(self.fail_every) and self.create_count % self.fail_every == 0
+                self.tasks[task_id] = (time.time(), failed)
+                return {'errorId': 0, 'taskId': task_id}
+
+            if path == '/getTaskResult':
+                self.poll_count += 1
+                task = self.tasks.get(body.get('taskId'))
+                if task is None:
+                    return {'errorId': 1, 'errorCode': 'ERROR_TASKID_INVALID'}
+                created_at, failed = task
+                if time.time() - created_at < self.solve_delay:
+                    return {'errorId': 0, 'status': 'processing'}
+                if failed:
+                    return {'errorId': 0, 'status': 'failed'}
+                return {'errorId': 0, 'status': 'ready',
+                        'solution': {'gRecaptchaResponse': f'stub-{body["taskId"]}'}}
+
+        return {'errorId': 1, 'errorCode': 'ERROR_METHOD_NOT_FOUND'}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except json.JSONDecodeError:
+                    body = {}
+                payload = json.dumps(stub._handle(self.path, body)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地 Capsolver 替身服务')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--solve-delay', type=float, default=3.0)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+
+    server = CapsolverStubServer(solve_delay=args.solve_delay, fail_every=args.fail_every, port=args.port)
+    print(f'Capsolver stub listening on {server.url}')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
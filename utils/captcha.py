@@ -1,62 +1,271 @@
 import requests
+import threading
 import time
 import sys
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any
+
+from requests.adapters import HTTPAdapter
 
 # 添加父目录到Python路径，确保可以导入config模块
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
-from config import CAPTCHA_SOLVER_API_KEY
+from config import (
+    CAPTCHA_SOLVER_API_KEY, CAPSOLVER_API_URL, HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_MAX_RATIO, BREAKER_ENABLED
+)
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, get_breakers
+from utils.hedging import HedgePolicy, hedged_call
+from utils.logger_utils import logger
 
-def capsolver() -> str | None:
+# 登录页使用的 reCAPTCHA v3 任务
+RECAPTCHA_TASK = {
+    'type': 'ReCaptchaV3TaskProxyLess',
+    'websiteKey': '6LenESAqAAAAAL9ZymIB_A4Y03U3s3cPhBYKfcnU',
+    'websiteURL': 'https://testnet.humanity.org',
+    'pageAction': 'LOGIN'
+}
+
+
+class _PendingTask:
+    __slots__ = ('task_id', 'future', 'created_at', 'next_poll', 'polling')
+
+    def __init__(self, task_id: str, future: Future, created_at: float, next_poll: float):
+        self.task_id = task_id
+        self.future = future
+        self.created_at = created_at
+        self.next_poll = next_poll
+        self.polling = False
+
+
+class CapsolverClient:
     """
-    使用 Capsolver API 解决 reCAPTCHA v3 验证码
-    
-    Returns:
-        str | None: 成功时返回验证码响应字符串，失败时返回 None
+    多路复用的 Capsolver 客户端
+
+    - createTask / getTaskResult 共用一个 keep-alive 连接池
+    - 所有未完成的 taskId 由同一个轮询线程统一调度，轮询间隔随任务存活时间退避
+    - submit() 立即返回 Future，打码期间不占用调用方线程
+    - 传入 hedge_policy 时，getTaskResult 轮询过慢会经连接池中的另一个连接再发一份（createTask 不对冲）
+    - 传入 breaker 时，打码服务熔断期间不再创建任务，submit() 的结果直接为 None
     """
-    api_key = CAPTCHA_SOLVER_API_KEY
-    payload = {
-        'clientKey': api_key,
-        'task': {
-            'type': 'ReCaptchaV3TaskProxyLess',
-            'websiteKey': '6LenESAqAAAAAL9ZymIB_A4Y03U3s3cPhBYKfcnU',
-            'websiteURL': 'https://testnet.humanity.org',
-            'pageAction': 'LOGIN'
-        }
-    }
 
-    try:
-        res = requests.post('https://api.capsolver.com/createTask', json=payload)
-        res_data = res.json()
+    def __init__(
+        self,
+        api_key: str = CAPTCHA_SOLVER_API_KEY,
+        base_url: str = CAPSOLVER_API_URL,
+        pool_size: int = 8,
+        first_poll_delay: float = 2.0,
+        min_interval: float = 1.0,
+        max_interval: float = 5.0,
+        task_timeout: float = 120,
+        request_timeout: float = 30,
+        hedge_policy: Optional[HedgePolicy] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.first_poll_delay = first_poll_delay
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.task_timeout = task_timeout
+        self.request_timeout = request_timeout
+        self.hedge_policy = hedge_policy
+        self.breaker = breaker
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='capsolver-io')
+
+        # 请求计数，便于观察对打码接口的请求量（各 IO 线程并发累加，读写都在 _cond 内）
+        self.create_requests = 0
+        self.poll_requests = 0
+
+        self._tasks: Dict[str, _PendingTask] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._poller = threading.Thread(target=self._poll_loop, name='capsolver-poller', daemon=True)
+        self._poller.start()
+
+    def submit(self, task: Optional[Dict[str, Any]] = None) -> Future:
+        """
+        提交打码任务
+
+        Args:
+            task: Capsolver 任务参数，默认为登录页的 reCAPTCHA v3
+
+        Returns:
+            Future: 结果为 gRecaptchaResponse，失败时为 None
+        """
+        future = Future()
+        try:
+            self._executor.submit(self._create_task, task or RECAPTCHA_TASK, future)
+        except RuntimeError:
+            # 已经 close()，线程池不再接受任务
+            future.set_result(None)
+        return future
+
+    def solve(self, task: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Optional[str]:
+        """阻塞等待打码结果"""
+        return self.submit(task).result(timeout=timeout)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._tasks)
+
+    def close(self):
+        """
+        停止客户端：先停止并等待轮询线程（之后不会再向线程池提交任务），
+        再让未完成的任务结果为 None，最后关闭线程池；排队中的 createTask 发现已停止后直接返回 None
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._poller is not threading.current_thread():
+            self._poller.join()
+        with self._cond:
+            outstanding = list(self._tasks.values())
+            self._tasks.clear()
+        for pending in outstanding:
+            pending.future.set_result(None)
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _post(self, path: str, payload: dict) -> dict:
+        if self.breaker is None:
+            return self.session.post(f'{self.base_url}/{path}', json=payload, timeout=self.request_timeout).json()
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+        try:
+            res = self.session.post(f'{self.base_url}/{path}', json=payload, timeout=self.request_timeout)
+        except requests.RequestException:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(res.status_code < 500)
+        return res.json()
+
+    def _create_task(self, task: dict, future: Future):
+        with self._cond:
+            if self._stopped:
+                future.set_result(None)
+                return
+            self.create_requests += 1
+        try:
+            res_data = self._post('createTask', {'clientKey': self.api_key, 'task': task})
+        except Exception as error:
+            logger.error(f'Capsolver createTask 出错: {str(error)}')
+            future.set_result(None)
+            return
+
+        # 部分任务类型会在 createTask 中直接返回结果
+        if res_data.get('status') == 'ready' and res_data.get('solution'):
+            future.set_result(res_data['solution'].get('gRecaptchaResponse'))
+            return
+
         task_id = res_data.get('taskId')
-        
         if not task_id:
-            print('Failed to create task:', res_data)
-            return None
+            logger.error(f'Failed to create task: {res_data}')
+            future.set_result(None)
+            return
+
+        now = time.time()
+        with self._cond:
+            if self._stopped:
+                future.set_result(None)
+                return
+            self._tasks[task_id] = _PendingTask(task_id, future, now, now + self.first_poll_delay)
+            self._cond.notify()
 
+    def _poll_interval(self, age: float) -> float:
+        """任务越老轮询越稀疏：每多等10秒，间隔增加一个 min_interval"""
+        return min(self.max_interval, self.min_interval * (1 + age / 10))
+
+    def _poll_loop(self):
         while True:
-            time.sleep(1)  # 延迟1秒
-
-            get_result_payload = {
-                'clientKey': api_key,
-                'taskId': task_id
-            }
-            
-            resp = requests.post('https://api.capsolver.com/getTaskResult', 
-                               json=get_result_payload)
-            resp_data = resp.json()
-            status = resp_data.get('status')
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.time()
+                due = []
+                next_wakeup = now + self.max_interval
+                for pending in list(self._tasks.values()):
+                    if pending.polling:
+                        continue
+                    if now - pending.created_at > self.task_timeout:
+                        logger.error(f'Capsolver 任务超时: {pending.task_id}')
+                        del self._tasks[pending.task_id]
+                        pending.future.set_result(None)
+                    elif pending.next_poll <= now:
+                        pending.polling = True
+                        due.append(pending)
+                    else:
+                        next_wakeup = min(next_wakeup, pending.next_poll)
+                if not due:
+                    self._cond.wait(timeout=max(0.0, next_wakeup - now))
+                    continue
+
+            for pending in due:
+                self._executor.submit(self._poll_task, pending)
 
+    def _poll_task(self, pending: _PendingTask):
+        with self._cond:
+            self.poll_requests += 1
+        try:
+            payload = {'clientKey': self.api_key, 'taskId': pending.task_id}
+            post = lambda: self._post('getTaskResult', payload)
+            resp_data = hedged_call(self.hedge_policy, post, post)
+            status = resp_data.get('status')
             if status == 'ready':
-                return resp_data['solution']['gRecaptchaResponse']
-            
+                self._finish(pending, resp_data['solution']['gRecaptchaResponse'])
+                return
             if status == 'failed' or resp_data.get('errorId'):
-                print('Solve failed! response:', resp_data)
-                return None
+                logger.error(f'Solve failed! response: {resp_data}')
+                self._finish(pending, None)
+                return
+        except Exception as error:
+            logger.error(f'Capsolver getTaskResult 出错: {str(error)}')
+
+        now = time.time()
+        with self._cond:
+            pending.polling = False
+            pending.next_poll = now + self._poll_interval(now - pending.created_at)
+            self._cond.notify()
+
+    def _finish(self, pending: _PendingTask, result: Optional[str]):
+        # 谁把任务移出 _tasks 谁负责设置结果，避免与 close() 或超时清理重复设置
+        with self._cond:
+            owned = self._tasks.pop(pending.task_id, None) is not None
+        if owned:
+            pending.future.set_result(result)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
 
+
+def get_capsolver_client() -> CapsolverClient:
+    """获取进程内共享的 CapsolverClient"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            hedge_policy = HedgePolicy(HEDGE_PERCENTILE, HEDGE_MAX_RATIO) if HEDGE_ENABLED else None
+            breaker = get_breakers().get(CAPSOLVER_API_URL) if BREAKER_ENABLED else None
+            _default_client = CapsolverClient(hedge_policy=hedge_policy, breaker=breaker)
+        return _default_client
+
+
+def capsolver() -> str | None:
+    """
+    使用 Capsolver API 解决 reCAPTCHA v3 验证码
+
+    Returns:
+        str | None: 成功时返回验证码响应字符串，失败时返回 None
+    """
+    try:
+        return get_capsolver_client().solve()
     except Exception as error:
         print('Error:', str(error))
-        return None 
\ No newline at end of file
+        return None
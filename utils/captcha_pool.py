@@ -0,0 +1,248 @@
+import concurrent.futures
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+from utils.captcha import CapsolverClient, get_capsolver_client
+from utils.circuit_breaker import CircuitBreaker
+from utils.logger_utils import logger
+
+
+class _TokenFuture(Future):
+    """acquire() 返回的 Future，记录 token 的打码完成时间，被放弃时按原时间放回池中"""
+
+    def __init__(self):
+        super().__init__()
+        self.solved_at = None
+
+
+class CaptchaPool:
+    """
+    后台预打码池：提前准备好 ReCaptchaV3 token，collect() 取用时为 O(1)
+
+    - 每个 token 记录打码完成时间，超过 ttl 即视为过期丢弃（v3 token 约2分钟有效）
+    - 池的目标大小根据最近的取用速率和平均打码耗时动态调整（Little 定律），空闲时不预打码
+    - 池空时取用方以 Future 的形式排队，新 token 到达后按先来先得分配；取消或超时的取用方立即移出队列，
+      不再读取结果的取用方调用 abandon()，已经分到的 token 放回池中
+    - 调用方通过 set_remaining() 告知还有多少账号可能取用，预打码数量不超过该值，账号用完后不再预打码
+    - 打码任务通过 CapsolverClient 异步提交，补充 token 不占用线程
+    - 传入 breaker（token 使用方 terminal3 的熔断器）时，熔断期间暂停预打码，避免 token 白白过期
+    """
+
+    def __init__(
+        self,
+        client: Optional[CapsolverClient] = None,
+        min_size: int = 2,
+        max_size: int = 50,
+        ttl: float = 110,
+        max_solving: int = 20,
+        rate_window: float = 60,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.client = client or get_capsolver_client()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_solving = max_solving
+        self.rate_window = rate_window
+        self.breaker = breaker
+
+        self._tokens = deque()  # (solved_at, token)，左侧最旧
+        self._waiters = deque()  # 等待 token 的 Future
+        self._takes = deque()  # 最近的取用时间，用于估算登录速率
+        self._remaining = None  # 还可能取用的次数上限，None 表示未知
+        self._solving = 0
+        self._solve_time = 15.0  # 打码耗时的EWMA，初始按经验值
+        self._backoff_until = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """启动后台补充线程"""
+        self._thread = threading.Thread(target=self._refill_loop, name='captcha-pool', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """停止后台打码，并让仍在等待的取用方拿到 None"""
+        with self._cond:
+            self._stopped = True
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._cond.notify_all()
+
+    def target_size(self) -> int:
+        """根据最近 rate_window 秒内的取用速率计算池的目标大小"""
+        with self._cond:
+            return self._target_size_locked(time.time())
+
+    def set_remaining(self, remaining: Optional[int]):
+        """
+        告知池还有多少账号可能需要打码，之后每次取用减一
+
+        Args:
+            remaining: 取用次数上限，0 表示只为已经在等待的取用方打码；None 表示未知，按取用速率预打码
+        """
+        with self._cond:
+            self._remaining = None if remaining is None else max(0, remaining)
+            self._cond.notify_all()
+
+    def _target_size_locked(self, now: float) -> int:
+        while self._takes and now - self._takes[0] > self.rate_window:
+            self._takes.popleft()
+        if not self._takes or self._remaining == 0:
+            # 没有登录需求时不预打码，避免空耗打码费用
+            return 0
+        rate = len(self._takes) / self.rate_window
+        # 打码期间预计会被取走的数量 + 最小余量；超过 ttl 内能用掉的数量没有意义
+        target = math.ceil(rate * self._solve_time) + self.min_size
+        target = min(target, math.ceil(rate * self.ttl) + self.min_size)
+        target = max(self.min_size, min(self.max_size, target))
+        if self._remaining is not None:
+            # 剩余的账号用不完的 token 只会过期
+            target = min(target, self._remaining)
+        return target
+
+    def _drop_expired_locked(self, now: float):
+        while self._tokens and now - self._tokens[0][0] >= self.ttl:
+            self._tokens.popleft()
+
+    def acquire(self) -> Future:
+        """
+        申请一个 token
+
+        Returns:
+            Future: 结果为 token 字符串；池关闭时为 None
+        """
+        future = _TokenFuture()
+        with self._cond:
+            now = time.time()
+            self._takes.append(now)
+            if self._remaining:
+                self._remaining -= 1
+            self._drop_expired_locked(now)
+            if self._tokens:
+                # 先用最旧的 token，减少过期浪费
+                future.solved_at, token = self._tokens.popleft()
+                future.set_result(token)
+            elif self._stopped:
+                future.set_result(None)
+            else:
+                self._waiters.append(future)
+                future.add_done_callback(self._discard_waiter)
+            self._cond.notify_all()
+        return future
+
+    def _discard_waiter(self, future: Future):
+        """取用方超时或被取消（asyncio 的 wait_for 超时会取消 Future）时移出等待队列，不再计入需求"""
+        if not future.cancelled():
+            return
+        with self._cond:
+            try:
+                self._waiters.remove(future)
+            except ValueError:
+                pass
+
+    def abandon(self, future: Future):
+        """
+        取用方不再读取 acquire() 的结果（如 asyncio 的 wait_for 超时）：还在排队时取消，已经分到 token 时放回池中
+
+        wait_for 超时只会取消 asyncio 一侧的包装，token 恰好在这时送达的话没有人会读取，需要调用方显式放弃
+        """
+        with self._cond:
+            if future.cancel():
+                return
+            # token 在锁内设置，取消失败说明结果已经设置好
+            token = future.result()
+            if token and not self._stopped:
+                self._put_locked(future.solved_at, token)
+                self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        阻塞获取一个 token
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            token 字符串，超时或池已关闭时返回 None
+        """
+        future = self.acquire()
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # 取消后分配 token 时会跳过该 Future
+            if future.cancel():
+                return None
+            return future.result()
+
+    def _refill_loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._need_more_locked():
+                    self._cond.wait(timeout=1)
+                if self._stopped:
+                    return
+                self._solving += 1
+
+            started = time.time()
+            try:
+                future = self.client.submit()
+            except Exception as e:
+                logger.error(f"提交预打码任务失败: {str(e)}")
+                self._on_solved(started, None)
+                continue
+            future.add_done_callback(lambda f, started=started: self._on_solved(started, f))
+
+    def _on_solved(self, started: float, future: Optional[Future]):
+        token = None
+        if future is not None and not future.cancelled() and future.exception() is None:
+            token = future.result()
+        finished = time.time()
+        with self._cond:
+            self._solving -= 1
+            if token:
+                self._solve_time = 0.8 * self._solve_time + 0.2 * (finished - started)
+                self._put_locked(finished, token)
+            elif not self._stopped:
+                # 打码失败时延后下一次补充，避免在打码服务异常时空转
+                self._backoff_until = finished + 1
+            self._cond.notify_all()
+
+    def _need_more_locked(self) -> bool:
+        now = time.time()
+        if self._solving >= self.max_solving or now < self._backoff_until:
+            return False
+        if self.breaker is not None and not self.breaker.available():
+            return False
+        self._drop_expired_locked(now)
+        demand = self._target_size_locked(now) + len(self._waiters)
+        return len(self._tokens) + self._solving < demand
+
+    def _put_locked(self, solved_at: float, token: str):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter.set_running_or_notify_cancel():
+                waiter.solved_at = solved_at
+                waiter.set_result(token)
+                return
+        self._tokens.append((solved_at, token))
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.time()
+            self._drop_expired_locked(now)
+            return {
+                'ready': len(self._tokens),
+                'solving': self._solving,
+                'waiting': len(self._waiters),
+                'target': self._target_size_locked(now),
+                'solve_time': round(self._solve_time, 2),
+            }
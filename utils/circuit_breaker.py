@@ -0,0 +1,210 @@
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from utils.logger_utils import logger
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """依赖处于熔断状态，请求未发出"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} 熔断中，{retry_after:.1f} 秒后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    单个上游依赖的熔断器
+
+    - closed：正常放行，连续失败 failure_threshold 次后进入 open
+    - open：直接拒绝，reset_timeout 秒后进入 half_open
+    - half_open：只放行 half_open_probes 个探测请求，成功则恢复 closed，失败则重新 open 并把等待时间翻倍
+
+    Args:
+        name: 依赖名称，用于日志
+        failure_threshold: 连续失败多少次后熔断
+        reset_timeout: 熔断后首次探测前的等待时间（秒）
+        max_reset_timeout: 连续探测失败时等待时间的上限（秒）
+        half_open_probes: 半开状态同时放行的探测请求数
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        max_reset_timeout: float = 300,
+        half_open_probes: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self._timeout = reset_timeout
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        # 状态变化（探测有了结果）时唤醒 wait_allow() 中等待的线程
+        self._changed = threading.Condition(self._lock)
+
+    def _refresh_locked(self, now: float):
+        if self.state == OPEN and now - self._opened_at >= self._timeout:
+            self.state = HALF_OPEN
+            self._probes = 0
+        elif self.state == HALF_OPEN and self._probes and now - self._probe_started >= self._timeout:
+            # 探测请求迟迟没有结果（调用方异常退出等），允许重新探测
+            self._probes = 0
+
+    def available(self) -> bool:
+        """依赖当前是否可能可用（不占用探测名额），用于进入打码等昂贵阶段前的预检"""
+        with self._lock:
+            self._refresh_locked(time.time())
+            return self.state == CLOSED or (self.state == HALF_OPEN and self._probes < self.half_open_probes)
+
+    def allow(self) -> bool:
+        """请求发出前调用；半开状态下放行的请求即为探测请求，结果必须通过 record() 回报"""
+        with self._lock:
+            now = time.time()
+            self._refresh_locked(now)
+            return self._allow_locked(now)
+
+    def _allow_locked(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            self._probe_started = now
+            return True
+        return False
+
+    def wait_allow(self):
+        """
+        阻塞到 allow() 放行为止：open 时睡到可以探测的时间，探测进行中时等到 record() 回报结果，不轮询
+
+        放行后的请求与 allow() 相同，半开状态下必须通过 record() 回报结果
+        """
+        with self._lock:
+            while True:
+                now = time.time()
+                self._refresh_locked(now)
+                if self._allow_locked(now):
+                    return
+                if self.state == OPEN:
+                    deadline = self._opened_at + self._timeout
+                else:
+                    # 探测请求迟迟没有结果时 _refresh_locked() 会重新放行探测
+                    deadline = self._probe_started + self._timeout
+                self._changed.wait(max(0.0, deadline - now))
+
+    def record(self, ok: bool):
+        with self._lock:
+            now = time.time()
+            if ok:
+                if self.state != CLOSED:
+                    logger.info(f"{self.name} 已恢复，解除熔断")
+                    self._changed.notify_all()
+                self.state = CLOSED
+                self.failures = 0
+                self._timeout = self.reset_timeout
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._timeout = min(self.max_reset_timeout, self._timeout * 2)
+                self._open_locked(now)
+                self._changed.notify_all()
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open_locked(now)
+
+    def _open_locked(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._probes = 0
+        logger.info(f"{self.name} 连续失败 {self.failures} 次，熔断 {self._timeout:.0f} 秒")
+
+    def retry_after(self) -> float:
+        """距离下一次可以探测的秒数"""
+        with self._lock:
+            now = time.time()
+            self._refresh_locked(now)
+            if self.state == OPEN:
+                return max(0.0, self._opened_at + self._timeout - now)
+            if self.state == HALF_OPEN and self._probes >= self.half_open_probes:
+                # 探测请求进行中，稍后再看结果
+                return 1.0
+            return 0.0
+
+    def ensure_available(self):
+        """依赖不可用时抛出 CircuitOpenError"""
+        if not self.available():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+
+class BreakerRegistry:
+    """
+    按 host 划分的熔断器集合（terminal3、testnet 接口、RPC 节点、Capsolver 各一个）
+
+    Args:
+        **kwargs: 传给每个 CircuitBreaker 的参数
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        """url 对应 host 的熔断器"""
+        host = urlsplit(url).netloc or url
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, **self._kwargs)
+            return breaker
+
+    def guard(self, url: str):
+        """请求发出前调用，依赖熔断时抛出 CircuitOpenError"""
+        breaker = self.get(url)
+        if not breaker.allow():
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+
+    def record(self, url: str, ok: bool):
+        self.get(url).record(ok)
+
+    def ensure_available(self, *urls: str):
+        """预检多个依赖，任一不可用时抛出 CircuitOpenError"""
+        for url in urls:
+            self.get(url).ensure_available()
+
+    def stats(self) -> Dict[str, str]:
+        with self._lock:
+            return {host: breaker.state for host, breaker in self._breakers.items()}
+
+
+_default_registry: Optional[BreakerRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_breakers() -> BreakerRegistry:
+    """获取进程内共享的熔断器集合（参数取自 config.py）"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_MAX_RESET_TIMEOUT
+
+            _default_registry = BreakerRegistry(
+                failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=BREAKER_RESET_TIMEOUT,
+                max_reset_timeout=BREAKER_MAX_RESET_TIMEOUT
+            )
+        return _default_registry
@@ -0,0 +1,159 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from utils.logger_utils import logger
+
+
+class GradientLimiter:
+    """
+    自适应并发上限（gradient 算法）
+
+    用接口请求的延迟衡量服务端负载：样本按窗口汇总，窗口平均延迟接近长期基线时并发上限逐步增加，
+    明显升高或出现限流/网络错误时按比例下降。max_limit（config.concurrent_number）只是上限
+
+    Args:
+        max_limit: 并发上限的最大值
+        initial_limit: 初始并发上限
+        min_limit: 并发上限的最小值
+        smoothing: 每个窗口对上限的影响程度
+        tolerance: 允许短期延迟高于基线的倍数
+        long_window: 长期基线上升的时间常数（秒），下降则立即跟随
+        window_size: 每个窗口的样本数
+        window_time: 样本不足时窗口的最长时间（秒）
+        max_error_rate: 窗口内错误率超过该值时下调上限
+        report_interval: 上限变化时最多每隔多少秒输出一次日志
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: Optional[int] = None,
+        min_limit: int = 1,
+        smoothing: float = 0.2,
+        tolerance: float = 1.5,
+        long_window: float = 600,
+        window_size: int = 20,
+        window_time: float = 1.0,
+        max_error_rate: float = 0.1,
+        report_interval: float = 1.0
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = min(min_limit, self.max_limit)
+        self.limit = float(initial_limit or min(self.max_limit, 10))
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.long_window = long_window
+        self.window_size = window_size
+        self.window_time = window_time
+        self.max_error_rate = max_error_rate
+        self.in_flight = 0
+        self._long_rtt = None
+        # 当前窗口的样本
+        self._window_start = time.time()
+        self._window_rtt = 0.0
+        self._window_count = 0
+        self._window_errors = 0
+        self._cond = threading.Condition()
+        # asyncio 模式下等待名额的 (事件循环, Future)，按先后顺序分配
+        self._async_waiters = deque()
+        self.report_interval = report_interval
+        self._reported = int(self.limit)
+        self._reported_at = 0.0
+
+    def acquire(self):
+        """占用一个并发名额，已达上限时等待"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """acquire()的异步版本，等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.in_flight < int(self.limit) and not self._async_waiters:
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self._async_waiters.append((loop, future))
+        # 名额由 release() 直接转交，醒来时 in_flight 已计入
+        await future
+
+    def _grant(self, future):
+        if future.cancelled():
+            # 等待方已取消，名额退回
+            self.release()
+        else:
+            future.set_result(None)
+
+    def _wake(self):
+        """在锁内把空出的名额分给等待者"""
+        while self._async_waiters and self.in_flight < int(self.limit):
+            loop, future = self._async_waiters.popleft()
+            self.in_flight += 1
+            loop.call_soon_threadsafe(self._grant, future)
+        self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._wake()
+
+    def sample(self, rtt: float, ok: bool = True):
+        """
+        记录一次接口请求
+
+        Args:
+            rtt: 请求耗时（秒）
+            ok: 为 False 表示限流/服务端错误/网络错误
+        """
+        with self._cond:
+            now = time.time()
+            self._window_count += 1
+            if ok:
+                self._window_rtt += rtt
+            else:
+                self._window_errors += 1
+            if self._window_count < self.window_size and now - self._window_start < self.window_time:
+                return
+            self._update(now)
+
+    def _update(self, now: float):
+        """在锁内根据一个窗口的样本调整上限"""
+        ok_count = self._window_count - self._window_errors
+        error_rate = self._window_errors / self._window_count
+        rtt = self._window_rtt / ok_count if ok_count else None
+        elapsed = now - self._window_start
+        self._window_start = now
+        self._window_rtt = 0.0
+        self._window_count = self._window_errors = 0
+
+        if rtt is not None:
+            if self._long_rtt is None or rtt < self._long_rtt:
+                self._long_rtt = rtt
+            else:
+                # 基线代表无排队时的延迟，只随时间缓慢上升，不会被一阵拥塞拉高
+                self._long_rtt += (rtt - self._long_rtt) * min(1.0, elapsed / self.long_window)
+        if error_rate > self.max_error_rate or rtt is None:
+            gradient = 0.5
+        elif self.in_flight < self.limit / 2:
+            # 并发远未用满时延迟不反映上限是否合适，不增长
+            return
+        else:
+            gradient = max(0.5, min(1.0, self.tolerance * self._long_rtt / rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+        if int(self.limit) > previous:
+            self._wake()
+        if int(self.limit) != self._reported and now - self._reported_at >= self.report_interval:
+            logger.info(f"并发上限调整: {self._reported} -> {int(self.limit)}"
+                        f"（在途 {self.in_flight}，基线延迟 {self._long_rtt * 1000 if self._long_rtt else 0:.0f}ms，"
+                        f"窗口延迟 {rtt * 1000 if rtt else 0:.0f}ms，错误率 {error_rate:.0%}）")
+            self._reported = int(self.limit)
+            self._reported_at = now
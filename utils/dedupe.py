@@ -0,0 +1,103 @@
+"""
+大文件去重
+
+逐行读取账号文件时用布隆过滤器判断是否重复，内存只与位数组大小有关（百万行、1% 误判约 1.2MB），
+不再把所有行装进 set。布隆过滤器只会误判“已存在”，exact=True 时先扫描一遍文件找出所有疑似重复的行，
+只对这一小部分做精确比较，保证不会误丢账号
+"""
+import hashlib
+import math
+import os
+from typing import Iterator, Optional
+
+
+class BloomFilter:
+    """
+    布隆过滤器
+
+    Args:
+        capacity: 预计元素数
+        error_rate: 元素数达到 capacity 时的误判率
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: bytes) -> Iterator[int]:
+        # 双重哈希：用一次 blake2b 的两段结果组合出 k 个位置
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item: bytes) -> bool:
+        """
+        加入一个元素
+
+        Returns:
+            加入前是否可能已存在（False 表示一定是新元素）
+        """
+        present = True
+        for p in self._positions(item):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                present = False
+                self.bits[p >> 3] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+
+def estimate_lines(path: str, line_size: int = 64) -> int:
+    """按文件大小估算行数（私钥一行约 64-67 字节）"""
+    return max(1024, os.path.getsize(path) // line_size)
+
+
+def iter_unique_lines(path: str, exact: bool = True, error_rate: float = 0.01,
+                      capacity: Optional[int] = None) -> Iterator[str]:
+    """
+    按文件顺序逐行产出去重后的非空行
+
+    Args:
+        path: 文件路径
+        exact: 为 True 时多读一遍文件，对布隆过滤器判为重复的行做精确确认；
+            为 False 时只读一遍，约 error_rate 比例的行可能被误判为重复而跳过
+        error_rate: 布隆过滤器的误判率
+        capacity: 预计行数，默认按文件大小估算
+    """
+    capacity = capacity or estimate_lines(path)
+    suspects = None
+    if exact:
+        # 第一遍：找出所有可能重复的行（真正的重复 + 少量误判）
+        bloom = BloomFilter(capacity, error_rate)
+        suspects = set()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and bloom.add(line.encode()):
+                    suspects.add(line)
+
+    bloom = BloomFilter(capacity, error_rate) if suspects is None else None
+    seen_suspects = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if suspects is None:
+                if bloom.add(line.encode()):
+                    continue
+            elif line in suspects:
+                # 只有疑似重复的行需要精确记录
+                if line in seen_suspects:
+                    continue
+                seen_suspects.add(line)
+            yield line
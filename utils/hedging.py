@@ -0,0 +1,177 @@
+"""
+对冲请求（只用于幂等操作）
+
+请求在延迟分布的高分位数之后仍未返回时，通过另一个连接/代理再发一份，首选请求出错或超时时使用这一份的结果。
+claim()、send_raw_transaction 等非幂等操作绝不能使用
+"""
+import bisect
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar('T')
+
+# 对冲请求使用的线程池（首选请求在调用线程中执行，不占用该线程池）
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='hedge')
+
+
+class _Scheduler:
+    """在到期时间调用函数的单线程定时器，所有对冲请求共用，不为每次请求创建线程"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> list:
+        entry = [time.monotonic() + delay, next(self._seq), fn]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='hedge-timer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def cancel(self, entry: list):
+        with self._cond:
+            entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline = self._heap[0][0]
+                now = time.monotonic()
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+                fn = heapq.heappop(self._heap)[2]
+            if fn is not None:
+                fn()
+
+
+_scheduler = _Scheduler()
+
+
+class HedgePolicy:
+    """
+    对冲策略：记录某类请求的延迟，给出发起对冲前的等待时间，并限制对冲比例
+
+    Args:
+        percentile: 超过该分位数的延迟后发起对冲
+        max_ratio: 对冲请求数最多占请求总数的比例
+        min_delay: 对冲等待时间下限（秒）
+        window: 参与计算分位数的最近样本数
+        min_samples: 样本不足时不对冲
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_ratio: float = 0.1,
+        min_delay: float = 0.05,
+        window: int = 500,
+        min_samples: int = 20
+    ):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._sorted = []
+        # 对冲额度：每个请求增加 max_ratio，每次对冲消耗 1
+        self._budget = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+
+    def record(self, latency: float):
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                old = self._samples[0]
+                del self._sorted[bisect.bisect_left(self._sorted, old)]
+            self._samples.append(latency)
+            bisect.insort(self._sorted, latency)
+
+    def delay(self) -> Optional[float]:
+        """发起对冲前的等待时间，样本不足时返回 None（不对冲）"""
+        with self._lock:
+            self.requests += 1
+            self._budget = min(self._budget + self.max_ratio, 10.0)
+            if len(self._sorted) < self.min_samples:
+                return None
+            index = min(len(self._sorted) - 1, int(len(self._sorted) * self.percentile))
+            return max(self.min_delay, self._sorted[index])
+
+    def try_hedge(self) -> bool:
+        """消耗一次对冲额度，额度不足时返回 False"""
+        with self._lock:
+            if self._budget < 1.0:
+                return False
+            self._budget -= 1.0
+            self.hedges += 1
+            return True
+
+
+def hedged_call(policy: Optional[HedgePolicy], primary: Callable[[], T], backup: Callable[[], T]) -> T:
+    """
+    执行幂等请求，超过对冲等待时间后在线程池中用 backup 再发一份
+
+    primary 在调用线程中执行，线程池只承载对冲请求；primary 无法中途打断，
+    因此对冲请求的作用是在 primary 卡到超时或出错时直接顶上，不必再从头重试
+
+    Args:
+        policy: 对冲策略，为 None 时直接执行 primary
+        primary: 首选请求
+        backup: 对冲请求（应走另一个连接或代理）
+    """
+    if policy is None:
+        return primary()
+    start = time.time()
+    delay = policy.delay()
+    if delay is None:
+        result = primary()
+        policy.record(time.time() - start)
+        return result
+
+    lock = threading.Lock()
+    state = {'done': False, 'hedge': None}
+
+    def launch():
+        with lock:
+            if state['done'] or not policy.try_hedge():
+                return
+            try:
+                state['hedge'] = _executor.submit(backup)
+            except RuntimeError:
+                # 解释器退出时线程池已关闭
+                pass
+
+    timer = _scheduler.call_later(delay, launch)
+    try:
+        result = primary()
+    except Exception as error:
+        with lock:
+            state['done'] = True
+            hedge = state['hedge']
+        _scheduler.cancel(timer)
+        if hedge is None:
+            raise
+        try:
+            result = hedge.result()
+        except Exception:
+            raise error
+        policy.record(time.time() - start)
+        return result
+    with lock:
+        state['done'] = True
+    _scheduler.cancel(timer)
+    policy.record(time.time() - start)
+    return result
@@ -0,0 +1,174 @@
+"""
+私钥批量导入
+
+    python -m utils.key_importer data/private_keys.txt --processes 8
+
+- 流式读取私钥文件，地址推导在进程池中并行完成，按大事务 executemany 写入
+- 记录已处理的字节数和这部分内容的哈希：文件只是追加了新私钥时，从上次的位置继续；
+  文件被修改过时重新扫描，但已在数据库中的私钥通过私钥索引直接跳过，不再推导地址
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from database import AccountDatabase, private_key_to_bytes
+from utils.logger_utils import logger
+from utils.secp256k1 import derive_address, BACKEND
+
+# 计算文件前缀哈希时每次读取的字节数
+READ_BLOCK = 1 << 20
+
+# 新私钥少于该数量时在当前进程中推导地址：启动 spawn 进程池要重新导入模块，比推导几千个地址还慢
+IN_PROCESS_BELOW = 5000
+
+
+def derive_accounts(private_keys: list) -> list:
+    """进程池任务：为一批 32 字节私钥推导地址"""
+    return [(derive_address(private_key), private_key) for private_key in private_keys]
+
+
+def _resume_offset(f, state: Optional[dict], hasher) -> int:
+    """校验上次导入的前缀是否未变，未变返回可继续的位置，否则返回 0"""
+    if not state:
+        return 0
+    offset = state['offset']
+    remaining = offset
+    while remaining > 0:
+        block = f.read(min(READ_BLOCK, remaining))
+        if not block:
+            break
+        hasher.update(block)
+        remaining -= len(block)
+    if remaining == 0 and hasher.digest() == state['prefix_hash']:
+        return offset
+    return 0
+
+
+def _iter_chunks(f, offset: int, hasher, chunk_size: int, stats: Dict[str, int]):
+    """逐行读取私钥，每 chunk_size 个产出一次 (私钥列表, 结束位置, 前缀哈希)"""
+    chunk = []
+    seen = set()
+    for line in f:
+        offset += len(line)
+        hasher.update(line)
+        text = line.strip()
+        if not text:
+            continue
+        stats['scanned'] += 1
+        try:
+            private_key = private_key_to_bytes(text.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            stats['invalid'] += 1
+            continue
+        if private_key in seen:
+            continue
+        seen.add(private_key)
+        chunk.append(private_key)
+        if len(chunk) >= chunk_size:
+            yield chunk, offset, hasher.digest()
+            chunk = []
+            seen = set()
+    yield chunk, offset, hasher.digest()
+
+
+def import_keys(
+    db: AccountDatabase,
+    path: str,
+    processes: Optional[int] = None,
+    chunk_size: int = 5000,
+    commit_every: int = 50000,
+    in_process_below: int = IN_PROCESS_BELOW
+) -> Dict[str, int]:
+    """
+    导入私钥文件中的新私钥
+
+    Args:
+        db: AccountDatabase 实例
+        path: 私钥文件路径，每行一个私钥
+        processes: 推导地址的进程数，默认 CPU 核数；1 表示在当前进程中推导
+        chunk_size: 每个进程池任务包含的私钥数
+        commit_every: 每个事务最多写入的账号数
+        in_process_below: 累计的新私钥达到该数量后才启动进程池，之前在当前进程中推导
+
+    Returns:
+        导入统计：scanned 读取的私钥数，new 新增账号数，invalid 格式错误数，resumed_from 起始字节
+    """
+    path_key = os.path.abspath(path)
+    processes = processes or os.cpu_count() or 1
+    stats = {'scanned': 0, 'new': 0, 'invalid': 0, 'resumed_from': 0}
+    hasher = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        start = _resume_offset(f, db.get_import_state(path_key), hasher)
+        if start == 0:
+            f.seek(0)
+            hasher = hashlib.sha256()
+        stats['resumed_from'] = start
+        if start == os.path.getsize(path):
+            return stats
+
+        executor = None
+        new_total = 0
+        in_flight = deque()
+        buffer = []
+        committed = (start, hasher.digest())
+
+        def commit(offset, prefix_hash):
+            nonlocal buffer
+            stats['new'] += db.import_accounts(buffer, path_key, offset, prefix_hash)
+            buffer = []
+
+        def collect(block: bool):
+            # 按提交顺序取结果，保证记录的导入位置单调递增
+            while in_flight and (block or in_flight[0][0].done()):
+                future, offset, prefix_hash = in_flight.popleft()
+                buffer.extend(future.result())
+                if len(buffer) >= commit_every:
+                    commit(offset, prefix_hash)
+                nonlocal committed
+                committed = (offset, prefix_hash)
+
+        try:
+            for chunk, offset, prefix_hash in _iter_chunks(f, start, hasher, chunk_size, stats):
+                new_keys = db.filter_new_private_keys(chunk) if chunk else []
+                new_total += len(new_keys)
+                if executor is None and processes > 1 and new_total >= in_process_below:
+                    # 调用方（main_thread）此时已启动写线程、日志线程，fork 会把它们持有的锁带进子进程，改用 spawn
+                    executor = ProcessPoolExecutor(max_workers=processes,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+                if executor is None:
+                    buffer.extend(derive_accounts(new_keys))
+                    committed = (offset, prefix_hash)
+                    if len(buffer) >= commit_every:
+                        commit(offset, prefix_hash)
+                    continue
+                future = executor.submit(derive_accounts, new_keys)
+                in_flight.append((future, offset, prefix_hash))
+                # 限制在途任务数，内存占用不随文件大小增长
+                collect(block=len(in_flight) >= processes * 2)
+            collect(block=True)
+            commit(*committed)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    logger.info(f"私钥导入完成: 读取 {stats['scanned']}, 新增 {stats['new']}, 格式错误 {stats['invalid']}"
+                f"（地址推导: {BACKEND}）")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量导入私钥到账号数据库')
+    parser.add_argument('path', nargs='?', default=os.path.join('data', 'private_keys.txt'))
+    parser.add_argument('--db', default='accounts.db', help='数据库文件路径')
+    parser.add_argument('--processes', type=int, default=None, help='推导地址的进程数，默认CPU核数')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    database = AccountDatabase(args.db)
+    print(import_keys(database, args.path, processes=args.processes, chunk_size=args.chunk_size))
+    database.close()
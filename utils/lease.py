@@ -0,0 +1,101 @@
+import atexit
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils.logger_utils import logger
+
+
+class LeaseManager:
+    """
+    基于数据库租约的动态取号
+
+    多个工作进程指向同一个 accounts.db 时，各自按批领取账号并持有租约，后台线程定期续约；
+    账号处理结束后释放租约。进程崩溃后不再续约，租约过期后账号由其他进程重新领取
+
+    Args:
+        db: AccountDatabase 实例
+        lease_seconds: 租约有效期（秒）
+        batch_size: 每次领取的账号数
+        heartbeat_interval: 续约间隔（秒），默认为有效期的 1/3
+        failure_hold: 最终失败的账号保留租约的秒数，期间其他进程不再领取
+        address_range: 只领取该地址段内的账号
+        run_id: 指定时从该次运行未完成的账号（run_items）中领取
+    """
+
+    def __init__(
+        self,
+        db,
+        lease_seconds: int = 300,
+        batch_size: int = 100,
+        heartbeat_interval: Optional[float] = None,
+        failure_hold: int = 600,
+        address_range: Optional[Tuple[bytes, Optional[bytes]]] = None,
+        run_id: Optional[int] = None
+    ):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3
+        self.failure_hold = failure_hold
+        self.address_range = address_range
+        self.run_id = run_id
+        self.owner = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.leased = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+        # 调用方没有走到 close()（未捕获的异常、Ctrl-C）时，进程退出前仍释放租约
+        atexit.register(self.close)
+        return self
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.db.renew_leases(self.owner, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"租约续约失败: {str(e)}")
+
+    def iter_accounts(self) -> Iterator[Dict[str, Any]]:
+        """
+        按需领取账号：调用方取完一批才领取下一批，队列满时不会提前占住账号
+
+        游标走到末尾后再从头扫描一次，接手其他进程过期或释放的租约，仍然没有账号时结束
+        """
+        after = None
+        rescanned = False
+        while not self._stop.is_set():
+            batch = self.db.lease_accounts(self.owner, batch_size=self.batch_size, lease_seconds=self.lease_seconds,
+                                           after=after, address_range=self.address_range, run_id=self.run_id)
+            self.leased += len(batch)
+            yield from batch
+            if len(batch) == self.batch_size:
+                after = (batch[-1]['next_claim_at'], batch[-1]['address'])
+                continue
+            if rescanned and not batch:
+                return
+            rescanned = not batch
+            after = None
+
+    def release(self, address: str, failed: bool = False):
+        """账号处理结束（成功或不再重试）"""
+        self.db.release_lease(address, self.owner, hold=self.failure_hold if failed else 0)
+
+    def close(self):
+        """停止续约并释放仍持有的租约，未处理完的账号立即回到队列"""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        released = self.db.release_leases(self.owner)
+        if released:
+            logger.info(f"已释放 {released} 个未处理完的账号租约")
@@ -0,0 +1,198 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from utils.logger_utils import logger
+from utils.retry import RetryQueue
+
+_STOP = object()
+
+
+class Stage:
+    """
+    流水线的一个阶段：有界队列 + 独立线程池
+
+    Args:
+        name: 阶段名称
+        handler: 处理函数，返回下一个阶段的名称，返回 None 表示流程结束
+        workers: 线程数
+        queue_size: 队列长度上限，队列满时上游阻塞（背压）
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Optional[str]], workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.done = 0
+        self.failed = 0
+        # 单次处理耗时的EWMA（秒）
+        self.service_time = None
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def record(self, elapsed: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.service_time = elapsed if self.service_time is None else 0.8 * self.service_time + 0.2 * elapsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'queued': self.queue.qsize(),
+                'busy': self.busy,
+                'workers': self.workers,
+                'done': self.done,
+                'failed': self.failed,
+                'service_time': round(self.service_time, 3) if self.service_time is not None else None,
+            }
+
+
+class Pipeline:
+    """
+    分阶段流水线（SEDA）
+
+    每个阶段有自己的有界队列和线程池，慢阶段只会堆积自己的队列，不会占用其他阶段的线程。
+    阶段抛出异常时交给 on_error 决定是否重试：需要重试的项进入 RetryQueue，到期后由 entry 重新选择起始阶段
+
+    Args:
+        entry: 根据项的当前状态返回起始阶段名称（首次提交和重试时调用）
+        on_error: (项, 阶段名称, 异常) -> 重试前的等待秒数，返回 None 表示放弃
+        report_interval: 输出各阶段统计日志的间隔（秒），0 表示不输出
+    """
+
+    def __init__(
+        self,
+        entry: Callable[[Any], str],
+        on_error: Callable[[Any, str, BaseException], Optional[float]],
+        report_interval: float = 30
+    ):
+        self.entry = entry
+        self.on_error = on_error
+        self.report_interval = report_interval
+        self.stages: Dict[str, Stage] = {}
+        self._order: Dict[str, int] = {}
+        self._retry_queue = RetryQueue()
+        self._retry_wakeup = threading.Event()
+        self._outstanding = 0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def add_stage(self, name: str, handler: Callable[[Any], Optional[str]], workers: int, queue_size: int = 100):
+        """按流程顺序添加阶段"""
+        self._order[name] = len(self.stages)
+        self.stages[name] = Stage(name, handler, workers, queue_size)
+        return self
+
+    def start(self):
+        for stage in self.stages.values():
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage,), name=f'{stage.name}-{i}', daemon=True)
+                thread.start()
+                stage._threads.append(thread)
+        self._spawn(self._retry_loop, 'pipeline-retry')
+        if self.report_interval:
+            self._spawn(self._report_loop, 'pipeline-report')
+        return self
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, item: Any):
+        """提交一项，入口阶段队列已满时阻塞"""
+        with self._cond:
+            self._outstanding += 1
+        self.stages[self.entry(item)].queue.put(item)
+
+    def run(self, items: Iterable[Any]):
+        """提交全部项并等待流程结束"""
+        for item in items:
+            self.submit(item)
+        self.join()
+
+    def join(self):
+        with self._cond:
+            while self._outstanding:
+                self._cond.wait()
+
+    def close(self):
+        self._stopped.set()
+        self._retry_wakeup.set()
+        for stage in self.stages.values():
+            for _ in stage._threads:
+                stage.queue.put(_STOP)
+
+    def _finish(self):
+        with self._cond:
+            self._outstanding -= 1
+            if not self._outstanding:
+                self._cond.notify_all()
+
+    def _worker(self, stage: Stage):
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                return
+            with stage._lock:
+                stage.busy += 1
+            started = time.time()
+            try:
+                next_stage = stage.handler(item)
+            except Exception as e:
+                stage.record(time.time() - started, False)
+                self._fail(item, stage.name, e)
+            else:
+                stage.record(time.time() - started, True)
+                self._forward(item, stage.name, next_stage)
+            finally:
+                with stage._lock:
+                    stage.busy -= 1
+
+    def _forward(self, item: Any, current: str, next_stage: Optional[str]):
+        if next_stage is None:
+            self._finish()
+        elif self._order[next_stage] <= self._order[current]:
+            # 回退到前面的阶段时经重试队列转交，工作线程不会因互相等待对方的队列而卡死
+            self._retry_queue.schedule((item, next_stage), 0)
+            self._retry_wakeup.set()
+        else:
+            self.stages[next_stage].queue.put(item)
+
+    def _fail(self, item: Any, stage: str, error: BaseException):
+        try:
+            delay = self.on_error(item, stage, error)
+        except Exception as e:
+            logger.error(f"处理 {stage} 阶段失败时出错: {str(e)}")
+            delay = None
+        if delay is None:
+            self._finish()
+            return
+        self._retry_queue.schedule((item, None), delay)
+        self._retry_wakeup.set()
+
+    def _retry_loop(self):
+        while not self._stopped.is_set():
+            self._retry_wakeup.clear()
+            for item, stage in self._retry_queue.pop_due():
+                self.stages[stage or self.entry(item)].queue.put(item)
+            timeout = self._retry_queue.wait_time()
+            self._retry_wakeup.wait(1.0 if timeout is None else min(timeout, 1.0))
+
+    def _report_loop(self):
+        while not self._stopped.wait(self.report_interval):
+            logger.info("流水线: " + ", ".join(
+                f"{name}[排队 {s['queued']} 处理中 {s['busy']}/{s['workers']} 完成 {s['done']} 失败 {s['failed']}"
+                f" 耗时 {s['service_time'] or 0:.2f}s]"
+                for name, s in self.stats().items()
+            ) + f", 重试等待 {len(self._retry_queue)}")
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from utils.logger_utils import logger
+
+
+def normalize_proxy(proxy: str) -> Optional[str]:
+    """把 proxy.txt 中的一行转换为代理 URL，未写协议时按 http 处理"""
+    proxy = (proxy or '').strip()
+    if not proxy:
+        return None
+    if '://' not in proxy:
+        proxy = f'http://{proxy}'
+    return proxy
+
+
+class _ProxyState:
+    __slots__ = ('url', 'latency', 'error_rate', 'in_flight', 'failures', 'quarantined_until', 'requests')
+
+    def __init__(self, url: str):
+        self.url = url
+        # 延迟（秒）和错误率的指数加权移动平均
+        self.latency = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        # 连续失败次数
+        self.failures = 0
+        self.quarantined_until = 0.0
+        self.requests = 0
+
+
+class ProxyPool:
+    """
+    带健康评分的代理池
+
+    - 每次请求的延迟和成败按 EWMA 计入代理的评分，探测线程定期检查全部代理
+    - 连续失败的代理隔离一段时间，到期后重新参与分配，再失败则继续隔离
+    - 每个代理同时服务的账号数有上限
+    - 账号按 rendezvous hashing 排出代理的优先顺序：正常情况下同一账号总是分到同一个代理，
+      首选代理被隔离、已满或明显偏慢时依次换到下一个，其他账号的分配不受影响
+
+    Args:
+        proxies: 代理列表
+        max_concurrency: 每个代理同时服务的账号数上限
+        alpha: EWMA 平滑系数
+        quarantine_after: 连续失败多少次后隔离
+        quarantine_seconds: 隔离时长（秒）
+        slow_factor: 延迟超过健康代理中位数的多少倍视为偏慢
+        probe_url: 探测地址
+        probe_timeout: 探测超时（秒）
+    """
+
+    def __init__(
+        self,
+        proxies: Iterable[str],
+        max_concurrency: int = 8,
+        alpha: float = 0.2,
+        quarantine_after: int = 3,
+        quarantine_seconds: float = 300,
+        slow_factor: float = 3.0,
+        probe_url: str = 'https://testnet.humanity.org',
+        probe_timeout: float = 10
+    ):
+        urls = []
+        for proxy in proxies:
+            url = normalize_proxy(proxy)
+            if url and url not in urls:
+                urls.append(url)
+        self._states: Dict[str, _ProxyState] = {url: _ProxyState(url) for url in urls}
+        self.max_concurrency = max_concurrency
+        self.alpha = alpha
+        self.quarantine_after = quarantine_after
+        self.quarantine_seconds = quarantine_seconds
+        self.slow_factor = slow_factor
+        self.probe_url = probe_url
+        self.probe_timeout = probe_timeout
+        self._cond = threading.Condition()
+        self._slow_threshold = None
+        self._threshold_at = 0.0
+        self._stop = threading.Event()
+        self._prober = None
+
+    @classmethod
+    def from_file(cls, path: str = 'proxy.txt', **kwargs) -> Optional['ProxyPool']:
+        """从代理文件加载，文件不存在或为空时返回 None（直连）"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            pool = cls(f, **kwargs)
+        return pool if len(pool) else None
+
+    def __len__(self):
+        return len(self._states)
+
+    @staticmethod
+    def _rank(key: str, url: str) -> bytes:
+        return hashlib.blake2b(f'{key}|{url}'.encode(), digest_size=8).digest()
+
+    def candidates(self, key: str) -> List[str]:
+        """账号 key 对应的代理优先顺序（rendezvous hashing，与代理的增删顺序无关）"""
+        return sorted(self._states, key=lambda url: self._rank(key, url), reverse=True)
+
+    def _update_slow_threshold(self, now: float):
+        # 最多每秒重算一次健康代理延迟的中位数
+        if now - self._threshold_at < 1:
+            return
+        self._threshold_at = now
+        latencies = [s.latency for s in self._states.values()
+                     if s.latency is not None and s.quarantined_until <= now]
+        self._slow_threshold = statistics.median(latencies) * self.slow_factor if latencies else None
+
+    def _pick(self, key: str) -> Optional[str]:
+        """在锁内选择代理；全部已满时返回 None"""
+        now = time.time()
+        self._update_slow_threshold(now)
+        usable = []
+        for url in self.candidates(key):
+            state = self._states[url]
+            if state.quarantined_until > now or state.in_flight >= self.max_concurrency:
+                continue
+            if self._slow_threshold is None or state.latency is None or state.latency <= self._slow_threshold:
+                return url
+            usable.append(url)
+        if usable:
+            # 只剩偏慢的代理时仍然使用，保证不会因此卡住
+            return usable[0]
+        if all(s.quarantined_until > now for s in self._states.values()):
+            # 全部被隔离时使用最早解除隔离的代理
+            return min(self._states.values(), key=lambda s: s.quarantined_until).url
+        return None
+
+    def try_acquire(self, key: str) -> Optional[str]:
+        """不等待地为账号分配代理，全部已满时返回 None"""
+        with self._cond:
+            url = self._pick(key)
+            if url is not None:
+                self._states[url].in_flight += 1
+            return url
+
+    def acquire(self, key: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        为账号分配代理，所有可用代理都已满时等待
+
+        Args:
+            key: 账号标识（地址）
+            timeout: 最长等待时间，超时抛出 TimeoutError
+
+        Returns:
+            代理 URL；代理池为空时返回 None（直连）
+        """
+        if not self._states:
+            return None
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                url = self._pick(key)
+                if url is not None:
+                    self._states[url].in_flight += 1
+                    return url
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("等待可用代理超时")
+                self._cond.wait(remaining if remaining is not None else 1)
+
+    async def acquire_async(self, key: str, poll_interval: float = 0.05) -> Optional[str]:
+        """acquire()的异步版本，等待期间不阻塞事件循环"""
+        if not self._states:
+            return None
+        while True:
+            url = self.try_acquire(key)
+            if url is not None:
+                return url
+            await asyncio.sleep(poll_interval)
+
+    def release(self, url: Optional[str]):
+        """账号流程结束后归还代理"""
+        if url is None or url not in self._states:
+            return
+        with self._cond:
+            state = self._states[url]
+            state.in_flight = max(0, state.in_flight - 1)
+            self._cond.notify()
+
+    def record(self, url: Optional[str], ok: bool, latency: Optional[float] = None):
+        """
+        记录一次经过该代理的请求结果
+
+        Args:
+            url: 代理 URL
+            ok: 是否成功（网络层面）
+            latency: 耗时（秒）
+        """
+        state = self._states.get(url) if url else None
+        if state is None:
+            return
+        with self._cond:
+            state.requests += 1
+            state.error_rate += self.alpha * ((0.0 if ok else 1.0) - state.error_rate)
+            if latency is not None and ok:
+                state.latency = latency if state.latency is None else state.latency + self.alpha * (latency - state.latency)
+            if ok:
+                state.failures = 0
+                state.quarantined_until = 0.0
+                return
+            state.failures += 1
+            if state.failures >= self.quarantine_after:
+                state.quarantined_until = time.time() + self.quarantine_seconds
+                logger.info(f"代理 {url} 连续失败 {state.failures} 次，隔离 {self.quarantine_seconds} 秒")
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, key: str, timeout: Optional[float] = None):
+        """with pool.lease(address) as proxy: ... 结束时自动归还"""
+        url = self.acquire(key, timeout=timeout)
+        try:
+            yield url
+        finally:
+            self.release(url)
+
+    def probe(self):
+        """探测全部代理一次（包括隔离中的代理，恢复后即可解除隔离）"""
+        from curl_cffi import requests
+
+        for url in list(self._states):
+            if self._stop.is_set():
+                return
+            start = time.time()
+            try:
+                requests.head(self.probe_url, proxy=url, timeout=self.probe_timeout)
+                self.record(url, True, time.time() - start)
+            except Exception:
+                self.record(url, False)
+
+    def start_probing(self, interval: float = 60):
+        """后台定期探测代理"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.probe()
+                except Exception as e:
+                    logger.error(f"代理探测出错: {str(e)}")
+                self._stop.wait(interval)
+
+        self._prober = threading.Thread(target=loop, name='proxy-prober', daemon=True)
+        self._prober.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._prober is not None:
+            self._prober.join(timeout=5)
+
+    def stats(self) -> List[dict]:
+        now = time.time()
+        with self._cond:
+            return [{
+                'proxy': s.url,
+                'latency': round(s.latency, 3) if s.latency is not None else None,
+                'error_rate': round(s.error_rate, 3),
+                'in_flight': s.in_flight,
+                'quarantined': s.quarantined_until > now,
+                'requests': s.requests
+            } for s in self._states.values()]
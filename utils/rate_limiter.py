@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from utils.logger_utils import logger
+
+# 视为服务端限流/过载的状态码
+THROTTLE_STATUS = (429, 502, 503, 504)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Bucket:
+    __slots__ = ('rate', 'tokens', 'updated', 'blocked_until', 'last_decrease', 'latency', 'base_latency')
+
+    def __init__(self, rate: float, now: float):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = now
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        # 延迟 EWMA 以及其历史最小值（作为基线）
+        self.latency = None
+        self.base_latency = None
+
+
+class AdaptiveRateLimiter:
+    """
+    按 host + 路径划分的自适应令牌桶
+
+    速率按 AIMD 调整：首次受阻前像 TCP 慢启动一样快速增长，之后请求正常时加性增长，遇到 429/5xx、网络错误或延迟明显高于基线时乘性下降；
+    响应带 Retry-After 时该接口暂停到指定时间。同一时刻在途的多个失败响应只触发一次下降
+
+    Args:
+        initial_rate: 每个接口的初始速率（请求/秒）
+        min_rate: 速率下限
+        max_rate: 速率上限
+        increase: 加性增长量，每秒流量约增加该值
+        decrease: 乘性下降系数
+        burst: 令牌桶容量（秒），允许的突发量为 rate * burst
+        latency_factor: 延迟超过基线多少倍视为过载
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = 5.0,
+        min_rate: float = 0.5,
+        max_rate: float = 200.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        burst: float = 1.0,
+        latency_factor: float = 3.0
+    ):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.latency_factor = latency_factor
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(url: str) -> Tuple[str, str]:
+        parts = urlsplit(url)
+        return parts.netloc, parts.path
+
+    def _bucket(self, key: Tuple[str, str], now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.initial_rate, now)
+        return bucket
+
+    def _reserve(self, url: str) -> float:
+        """预留一个令牌，返回需要等待的秒数"""
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(self.endpoint(url), now)
+            capacity = max(1.0, bucket.rate * self.burst)
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            bucket.tokens -= 1
+            wait = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0.0
+            return max(wait, bucket.blocked_until - now)
+
+    def acquire(self, url: str):
+        """等待直到可以向该接口发送请求"""
+        wait = self._reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, url: str):
+        """acquire()的异步版本"""
+        wait = self._reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def feedback(
+        self,
+        url: str,
+        status_code: Optional[int] = None,
+        latency: Optional[float] = None,
+        retry_after: Optional[str] = None,
+        error: bool = False
+    ):
+        """
+        根据响应调整该接口的速率
+
+        Args:
+            url: 请求地址
+            status_code: 响应状态码，网络错误时为空
+            latency: 请求耗时（秒）
+            retry_after: 响应的 Retry-After 头
+            error: 是否为网络错误/超时
+        """
+        now = time.time()
+        key = self.endpoint(url)
+        with self._lock:
+            bucket = self._bucket(key, now)
+            overloaded = error or status_code in THROTTLE_STATUS
+            if latency is not None and not overloaded:
+                bucket.latency = latency if bucket.latency is None else 0.8 * bucket.latency + 0.2 * latency
+                # 基线取平滑后延迟的最小值，单次偶然的快速响应不会拉低基线
+                bucket.base_latency = bucket.latency if bucket.base_latency is None else min(bucket.base_latency, bucket.latency)
+                overloaded = bucket.latency > bucket.base_latency * self.latency_factor
+
+            delay = parse_retry_after(retry_after) if status_code in THROTTLE_STATUS else None
+            if delay:
+                bucket.blocked_until = max(bucket.blocked_until, now + delay)
+                bucket.tokens = min(bucket.tokens, 0.0)
+
+            if overloaded:
+                # 每个令牌间隔内最多下降一次，避免同一批在途请求的失败把速率压到底
+                if now - bucket.last_decrease >= 1.0 / bucket.rate:
+                    bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                    bucket.last_decrease = now
+                    logger.info(f"接口 {key[0]}{key[1]} 限速降至 {bucket.rate:.2f}/s"
+                                f"{f'，暂停 {delay:.1f}s' if delay else ''}")
+            elif bucket.last_decrease == 0:
+                # 慢启动：首次受阻前每个成功请求增加 increase，速率约每秒翻倍
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+            else:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase / bucket.rate)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {f'{host}{path}': round(bucket.rate, 2) for (host, path), bucket in self._buckets.items()}
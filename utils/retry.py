@@ -0,0 +1,150 @@
+"""
+失败分类与延迟重试
+
+账号流程失败后按异常分为五类，每类有各自的重试策略；需要重试的账号带着到期时间放入 RetryQueue，
+由调度方到期后重新提交，等待期间不占用工作线程和并发名额
+"""
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from curl_cffi import requests as curl_requests
+import requests
+
+from utils.circuit_breaker import CircuitOpenError
+from utils.rate_limiter import parse_retry_after
+
+# 失败分类
+TRANSIENT_NETWORK = 'transient_network'
+RATE_LIMITED = 'rate_limited'
+AUTH_EXPIRED = 'auth_expired'
+CAPTCHA = 'captcha'
+PERMANENT = 'permanent'
+
+
+class HumanityAPIError(Exception):
+    """接口返回了错误状态码或不符合预期的内容"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AuthExpiredError(HumanityAPIError):
+    """hp_token 或授权码已失效，需要重新登录"""
+
+
+class CaptchaError(HumanityAPIError):
+    """打码失败，或验证码 token 被拒绝"""
+
+
+class RetryPolicy(NamedTuple):
+    max_attempts: int  # 含首次执行的总次数
+    base_delay: float  # 首次重试前的等待时间（秒），之后按指数增长
+    max_delay: float
+
+
+DEFAULT_POLICIES: Dict[str, RetryPolicy] = {
+    TRANSIENT_NETWORK: RetryPolicy(4, 5, 120),
+    RATE_LIMITED: RetryPolicy(6, 10, 300),
+    # 清除 hp_token 后立即重新登录，只重试一次
+    AUTH_EXPIRED: RetryPolicy(2, 0, 0),
+    CAPTCHA: RetryPolicy(3, 2, 30),
+    PERMANENT: RetryPolicy(1, 0, 0),
+}
+
+NETWORK_ERRORS = (curl_requests.RequestsError, requests.RequestException, ConnectionError, TimeoutError)
+
+
+def classify(error: BaseException) -> Tuple[str, Optional[float]]:
+    """
+    对失败进行分类
+
+    Args:
+        error: 账号流程抛出的异常，会沿 __cause__ 查找被包装的原始异常
+
+    Returns:
+        (分类, 服务端要求的等待秒数)
+    """
+    seen = error
+    while seen is not None:
+        if isinstance(seen, CircuitOpenError):
+            return TRANSIENT_NETWORK, seen.retry_after
+        if isinstance(seen, AuthExpiredError):
+            return AUTH_EXPIRED, None
+        if isinstance(seen, CaptchaError):
+            return CAPTCHA, None
+        if isinstance(seen, HumanityAPIError):
+            retry_after = parse_retry_after(seen.retry_after)
+            if seen.status_code == 429 or retry_after is not None:
+                return RATE_LIMITED, retry_after
+            if seen.status_code is None or seen.status_code >= 500:
+                return TRANSIENT_NETWORK, None
+            return PERMANENT, None
+        if isinstance(seen, NETWORK_ERRORS):
+            return TRANSIENT_NETWORK, None
+        if isinstance(seen, json.JSONDecodeError):
+            # 代理或网关返回的错误页
+            return TRANSIENT_NETWORK, None
+        seen = seen.__cause__
+    return PERMANENT, None
+
+
+def retry_delay(
+    kind: str,
+    attempt: int,
+    retry_after: Optional[float] = None,
+    policies: Dict[str, RetryPolicy] = DEFAULT_POLICIES
+) -> Optional[float]:
+    """
+    第 attempt 次执行失败后的等待时间
+
+    Returns:
+        等待秒数；不再重试时返回 None
+    """
+    policy = policies[kind]
+    if attempt >= policy.max_attempts:
+        return None
+    delay = min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1))
+    # 加入抖动，避免同一批失败的账号同时重试
+    delay *= random.uniform(0.8, 1.2)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class RetryQueue:
+    """按到期时间排序的延迟重试队列"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, item: Any, delay: float):
+        with self._lock:
+            heapq.heappush(self._heap, (time.time() + delay, next(self._seq), item))
+
+    def pop_due(self, now: Optional[float] = None) -> List[Any]:
+        """取出所有已到期的项"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def wait_time(self) -> Optional[float]:
+        """距离最早一项到期的秒数，队列为空时返回 None"""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.time())
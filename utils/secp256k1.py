@@ -0,0 +1,56 @@
+"""
+secp256k1 相关的底层运算
+
+安装了 coincurve（libsecp256k1 绑定）时使用原生实现，否则退回 eth_keys 的纯 Python 实现
+"""
+from eth_hash.auto import keccak
+from eth_keys import keys
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+# 当前使用的实现，便于日志和基准测试输出
+BACKEND = 'coincurve' if coincurve is not None else 'eth_keys'
+
+
+def derive_address(private_key: bytes) -> bytes:
+    """
+    由 32 字节私钥推导 20 字节地址
+
+    Args:
+        private_key: 32 字节私钥
+
+    Returns:
+        bytes: 20 字节地址
+    """
+    if coincurve is not None:
+        public_key = coincurve.PublicKey.from_secret(private_key).format(compressed=False)[1:]
+        return keccak(public_key)[-20:]
+    return keys.PrivateKey(private_key).public_key.to_canonical_address()
+
+
+def hash_personal_message(message: str) -> bytes:
+    """EIP-191 personal_sign 消息哈希（与 eth_account 的 encode_defunct 一致）"""
+    data = message.encode('utf-8')
+    return keccak(b'\x19Ethereum Signed Message:\n' + str(len(data)).encode() + data)
+
+
+def sign_message(private_key: bytes, message: str) -> str:
+    """
+    personal_sign 签名，结果与 LocalAccount.sign_message(encode_defunct(text=message)) 相同
+
+    Args:
+        private_key: 32 字节私钥
+        message: 待签名的文本
+
+    Returns:
+        str: 0x 开头的 65 字节签名（r || s || v，v 为 27/28）
+    """
+    message_hash = hash_personal_message(message)
+    if coincurve is not None:
+        signature = coincurve.PrivateKey(private_key).sign_recoverable(message_hash, hasher=None)
+    else:
+        signature = keys.PrivateKey(private_key).sign_msg_hash(message_hash).to_bytes()
+    return '0x' + signature[:64].hex() + format(signature[64] + 27, '02x')
@@ -0,0 +1,167 @@
+"""
+按服务端 Date 响应头校准本地时钟
+
+Date 只有秒级精度：响应在服务端时刻 [D, D+1) 内生成，而这一时刻又在本地的 [发送, 收到] 之间，
+因此每个样本给出时钟偏差的一个区间 [D - 收到, D + 1 - 发送]。多个样本的区间取交集，
+样本的发送时刻分布在秒内不同位置时，区间会收窄到往返时间量级
+
+与当前区间矛盾的单个样本（缓存代理返回的旧 Date、对冲请求的耗时属于另一份请求等）直接丢弃，
+连续多个样本都矛盾时才认为本地时钟被调整过，从最新的样本重新开始
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from utils.logger_utils import logger
+
+
+class ServerClock:
+    """
+    服务端时钟估计
+
+    Args:
+        host: 只采用该 host 的响应（不同服务器的时钟可能不一致），为空时不限
+        max_offset: 偏差超过该值（秒）的样本视为异常丢弃
+        reset_after: 连续多少个样本与当前区间矛盾时重新开始
+    """
+
+    def __init__(self, host: Optional[str] = None, max_offset: float = 3600, reset_after: int = 3):
+        self.host = host
+        self.max_offset = max_offset
+        self.reset_after = reset_after
+        self.samples = 0
+        self.outliers = 0
+        self._lo = None
+        self._hi = None
+        self._conflicts = 0
+        # 主动校准期间只采用校准请求自己的样本
+        self._calibrating = False
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        date_header: Optional[str],
+        sent_at: float,
+        received_at: float,
+        url: Optional[str] = None,
+        probe: bool = False
+    ) -> bool:
+        """
+        记录一个响应的 Date 头
+
+        Args:
+            date_header: 响应头 Date 的值
+            sent_at: 请求发出时的本地时间
+            received_at: 收到响应时的本地时间
+            url: 请求地址，指定了 host 时用于过滤
+            probe: 是否为 calibrate() 的校准请求；校准期间其他请求的样本不采用
+
+        Returns:
+            样本是否被采用
+        """
+        if not date_header or (self._calibrating and not probe):
+            return False
+        if self.host and url and urlsplit(url).netloc != self.host:
+            return False
+        try:
+            server_time = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            return False
+        lo, hi = server_time - received_at, server_time + 1 - sent_at
+        if abs(lo) > self.max_offset:
+            return False
+        with self._lock:
+            if self._lo is not None and max(self._lo, lo) > min(self._hi, hi):
+                self._conflicts += 1
+                if self._conflicts < self.reset_after:
+                    # 与已有区间矛盾的个别样本视为异常，不影响已校准的结果
+                    self.outliers += 1
+                    return False
+                # 连续多个样本都矛盾：本地时钟被调整过，从这个样本重新开始
+                logger.info(f"连续 {self._conflicts} 个 Date 样本与校准结果不一致，重新校准服务端时钟")
+                self._lo = None
+            self._conflicts = 0
+            self.samples += 1
+            if self._lo is None:
+                self._lo, self._hi = lo, hi
+            else:
+                self._lo, self._hi = max(self._lo, lo), min(self._hi, hi)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self.samples = 0
+            self.outliers = 0
+            self._conflicts = 0
+            self._lo = self._hi = None
+
+    @property
+    def offset(self) -> float:
+        """服务端时间 - 本地时间（秒），没有样本时为 0"""
+        with self._lock:
+            return 0.0 if self._lo is None else (self._lo + self._hi) / 2
+
+    @property
+    def uncertainty(self) -> Optional[float]:
+        """偏差估计的误差上限（秒），没有样本时为 None"""
+        with self._lock:
+            return None if self._lo is None else (self._hi - self._lo) / 2
+
+    def now(self) -> float:
+        """估计的服务端当前时间"""
+        return time.time() + self.offset
+
+    def to_local(self, server_timestamp: float) -> float:
+        """服务端时刻对应的本地时间"""
+        return server_timestamp - self.offset
+
+    def calibrate(
+        self,
+        probe: Callable[[], Optional[str]],
+        samples: int = 8,
+        target: float = 0.05
+    ) -> Tuple[float, Optional[float]]:
+        """
+        主动校准：多次请求服务端，每次在估计的服务端整秒时刻发送（二分）
+
+        Args:
+            probe: 发出一个请求并返回响应的 Date 头
+            samples: 最多请求次数
+            target: 误差达到该值（秒）后提前结束
+
+        Returns:
+            (偏差, 误差上限)
+        """
+        self._calibrating = True
+        try:
+            for _ in range(samples):
+                # 在估计的服务端整秒时刻发送：返回的 Date 落在哪一秒，都能把区间大约减半
+                time.sleep(-self.now() % 1.0)
+                sent_at = time.time()
+                try:
+                    date_header = probe()
+                except Exception as e:
+                    logger.error(f"时钟校准请求失败: {str(e)}")
+                    continue
+                self.observe(date_header, sent_at, time.time(), probe=True)
+                uncertainty = self.uncertainty
+                if uncertainty is not None and uncertainty <= target:
+                    break
+        finally:
+            self._calibrating = False
+        return self.offset, self.uncertainty
+
+
+_default_clock: Optional[ServerClock] = None
+_default_clock_lock = threading.Lock()
+
+
+def get_server_clock(url: Optional[str] = None) -> ServerClock:
+    """获取进程内共享的服务端时钟，首次调用时的 url 决定采用哪个 host 的 Date 头"""
+    global _default_clock
+    with _default_clock_lock:
+        if _default_clock is None:
+            _default_clock = ServerClock(urlsplit(url).netloc if url else None)
+        return _default_clock
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+
+from curl_cffi import requests
+from curl_cffi.const import CurlHttpVersion
+
+
+class SessionPool:
+    """
+    按代理分组复用 curl_cffi 会话
+
+    每个会话同一时间只借给一个账号使用，归还时清空 cookie，账号之间互不影响；
+    会话内的 curl 句柄保留已建立的连接，下一个账号不必重新进行 TCP/TLS 握手。
+    请求头由 API 客户端按请求传入，会话本身不保存账号相关的请求头
+
+    Args:
+        session_class: requests.Session 或 requests.AsyncSession
+        max_idle_per_proxy: 每个代理最多保留的空闲会话数
+        max_uses: 单个会话最多服务的账号数，超过后关闭重建
+        timeout: 默认请求超时（秒）
+        http_version: 默认协商 HTTP/2（TLS ALPN），服务端不支持时自动回落 HTTP/1.1
+    """
+
+    def __init__(
+        self,
+        session_class=requests.Session,
+        max_idle_per_proxy: int = 64,
+        max_uses: int = 1000,
+        timeout: float = 30,
+        http_version: CurlHttpVersion = CurlHttpVersion.V2TLS
+    ):
+        self.session_class = session_class
+        self.max_idle_per_proxy = max_idle_per_proxy
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self.http_version = http_version
+        self._idle: Dict[str, list] = defaultdict(list)
+        self._uses: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # 统计：新建会话数 / 复用次数
+        self.created = 0
+        self.reused = 0
+
+    def _new_session(self, proxy: Optional[str]):
+        kwargs = {'timeout': self.timeout, 'http_version': self.http_version}
+        if proxy:
+            kwargs['proxy'] = proxy
+        if self.session_class is requests.Session:
+            # 会话被不同线程轮流借用，使用单个 curl 句柄才能让连接跨线程复用
+            kwargs['use_thread_local_curl'] = False
+        return self.session_class(**kwargs)
+
+    def acquire(self, proxy: Optional[str] = None):
+        """借出一个会话（优先复用同一代理下的空闲会话）"""
+        key = proxy or ''
+        with self._lock:
+            idle = self._idle[key]
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.created += 1
+        session = self._new_session(proxy)
+        with self._lock:
+            self._uses[id(session)] = 0
+        return session
+
+    def release(self, session, proxy: Optional[str] = None, discard: bool = False):
+        """
+        归还会话
+
+        Args:
+            session: acquire() 借出的会话
+            proxy: 借出时使用的代理
+            discard: 会话出现网络错误等情况时丢弃，不再复用
+        """
+        # 清空上一个账号留下的 cookie
+        session.cookies.clear()
+        key = proxy or ''
+        with self._lock:
+            uses = self._uses.get(id(session), 0) + 1
+            keep = (not discard and not self._closed and uses < self.max_uses
+                    and len(self._idle[key]) < self.max_idle_per_proxy)
+            if keep:
+                self._uses[id(session)] = uses
+                self._idle[key].append(session)
+            else:
+                self._uses.pop(id(session), None)
+        if not keep:
+            self._close_session(session)
+
+    @staticmethod
+    def _close_session(session):
+        result = session.close()
+        if asyncio.iscoroutine(result):
+            # AsyncSession 需要在事件循环中关闭
+            try:
+                asyncio.get_running_loop().create_task(result)
+            except RuntimeError:
+                result.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': sum(len(sessions) for sessions in self._idle.values())
+            }
+
+    def _drain(self) -> list:
+        with self._lock:
+            self._closed = True
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+            self._uses.clear()
+        return sessions
+
+    def close(self):
+        for session in self._drain():
+            self._close_session(session)
+
+    async def aclose(self):
+        """关闭 AsyncSession 会话池"""
+        for session in self._drain():
+            await session.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """获取进程内共享的同步会话池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SessionPool()
+        return _default_pool
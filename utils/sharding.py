@@ -0,0 +1,133 @@
+"""
+多节点分片
+
+每个账号按地址的稳定哈希分配到 N 个分片之一，各节点用同一份 private_keys.txt 运行 --shard i/N，
+互不重复领取。分配采用最高随机权重（rendezvous）哈希：新增私钥不影响已有账号的分配，
+分片数从 N 调整为 N+1 时只有约 1/(N+1) 的账号换到新分片
+
+合并各分片的结果文件：
+    python -m utils.sharding merge data/success_0501_1200_shard*.txt -o data/success_0501_1200.txt
+"""
+import argparse
+import glob
+import hashlib
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+class Shard:
+    """
+    分片编号
+
+    Args:
+        index: 分片序号，从 1 开始
+        count: 分片总数
+    """
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"分片参数错误: {index}/{count}")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, value: str) -> 'Shard':
+        """解析命令行的 i/N"""
+        try:
+            index, count = (int(part) for part in value.split('/'))
+        except ValueError:
+            raise ValueError(f"分片格式应为 i/N，例如 1/3: {value}")
+        return cls(index, count)
+
+    @property
+    def suffix(self) -> str:
+        """结果文件名后缀"""
+        return f'shard{self.index}of{self.count}'
+
+    def owns(self, address: str) -> bool:
+        return shard_of(address, self.count) == self.index
+
+    def __str__(self):
+        return f'{self.index}/{self.count}'
+
+
+def shard_of(address: str, count: int) -> int:
+    """地址所属的分片序号（从 1 开始），与地址大小写无关"""
+    raw = address.lower().removeprefix('0x').encode()
+    return max(
+        range(1, count + 1),
+        key=lambda i: hashlib.blake2b(raw + i.to_bytes(2, 'big'), digest_size=8).digest()
+    )
+
+
+def merge_outcomes(paths: List[str], output: Optional[str] = None) -> Dict[str, object]:
+    """
+    合并各分片的结果文件
+
+    每行以 ---- 分隔，第一列（地址或私钥）作为账号标识；同一账号出现在多个文件中说明分片配置不一致，
+    会被计入 duplicates。失败文件第三列为失败分类，按分类汇总
+
+    Args:
+        paths: 结果文件路径，支持通配符
+        output: 合并后的文件路径，每个账号只保留第一次出现的行
+
+    Returns:
+        各文件行数、合并后账号数、重复账号、失败分类统计
+    """
+    files = sorted({path for pattern in paths for path in (glob.glob(pattern) or [pattern])})
+    seen: Dict[str, str] = {}
+    per_file = {}
+    duplicates = []
+    kinds = Counter()
+    lines = []
+    for path in files:
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                count += 1
+                columns = line.split('----')
+                key = columns[0]
+                if key in seen:
+                    if seen[key] != path:
+                        duplicates.append(key)
+                    continue
+                seen[key] = path
+                lines.append(line)
+                if len(columns) >= 4:
+                    kinds[columns[2]] += 1
+        per_file[path] = count
+
+    if output:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in lines)
+    return {
+        'files': per_file,
+        'accounts': len(lines),
+        'duplicates': duplicates,
+        'kinds': dict(kinds),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='多节点分片工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge_parser = subparsers.add_parser('merge', help='合并各分片的 success/fail 结果文件并输出汇总')
+    merge_parser.add_argument('paths', nargs='+', help='各分片的结果文件，支持通配符')
+    merge_parser.add_argument('-o', '--output', default=None, help='合并后的文件路径，不指定时只输出汇总')
+    args = parser.parse_args()
+
+    summary = merge_outcomes(args.paths, args.output)
+    for path, count in summary['files'].items():
+        print(f'{path}: {count}')
+    print(f"合并后账号数: {summary['accounts']}")
+    if summary['kinds']:
+        print(f"失败分类: {summary['kinds']}")
+    if summary['duplicates']:
+        print(f"警告: {len(summary['duplicates'])} 个账号出现在多个分片中，请检查各节点的分片参数")
+    if args.output:
+        print(f'已写入 {args.output}')
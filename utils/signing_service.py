@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+import concurrent.futures
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from database import address_to_bytes
+from utils.logger_utils import logger
+from utils.secp256k1 import sign_message, BACKEND
+
+# 工作进程内缓存的私钥数上限
+KEY_CACHE_SIZE = 100000
+
+# 工作进程状态：只读数据库连接和 地址 -> 私钥 缓存
+_worker_conn = None
+_worker_keys = {}
+
+
+def _init_worker(db_uri: str):
+    global _worker_conn
+    _worker_conn = sqlite3.connect(db_uri, uri=True, timeout=30)
+
+
+def _lookup_key(address: str) -> bytes:
+    private_key = _worker_keys.get(address)
+    if private_key is None:
+        row = _worker_conn.execute(
+            "SELECT private_key FROM accounts WHERE address = ?", (address_to_bytes(address),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"数据库中没有账号 {address}")
+        if len(_worker_keys) >= KEY_CACHE_SIZE:
+            _worker_keys.clear()
+        private_key = _worker_keys[address] = row[0]
+    return private_key
+
+
+def sign_batch(jobs: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+    """
+    工作进程任务：签名一批 (地址, 消息)
+
+    Returns:
+        与 jobs 一一对应的 (是否成功, 签名或错误信息)
+    """
+    results = []
+    for address, message in jobs:
+        try:
+            results.append((True, sign_message(_lookup_key(address), message)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class SigningService:
+    """
+    SIWE 消息签名服务
+
+    ECDSA 签名是纯 CPU 运算，放在 I/O 线程里执行会占着 GIL 拖慢网络请求。
+    签名任务提交后由分发线程攒成批次交给进程池，调用方拿到 Future；
+    私钥由工作进程按地址从数据库读取，不经过进程间管道传递
+
+    Args:
+        db_path: 账号数据库路径
+        processes: 签名进程数，默认 CPU 核数
+        batch_size: 每批最多的签名数
+        linger: 攒批等待的最长时间（秒）
+    """
+
+    def __init__(
+        self,
+        db_path: str = "accounts.db",
+        processes: Optional[int] = None,
+        batch_size: int = 32,
+        linger: float = 0.002
+    ):
+        self.db_uri = pathlib.Path(db_path).resolve().as_uri() + '?mode=ro'
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.linger = linger
+        self._jobs = queue.Queue()
+        self._executor = None
+        self._dispatcher = None
+        self._closed = False
+
+    def start(self):
+        # 工作进程按需启动，此时写线程、租约续约、代理探测等线程已在运行，fork 会把它们持有的锁带进子进程
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes, initializer=_init_worker, initargs=(self.db_uri,),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='signing-dispatcher', daemon=True)
+        self._dispatcher.start()
+        logger.info(f"签名服务已启动: {self.processes} 个进程（{BACKEND}）")
+        return self
+
+    def submit(self, address: str, message: str) -> Future:
+        """提交一个签名任务，Future 的结果为 0x 开头的签名"""
+        if self._closed:
+            raise RuntimeError("签名服务已关闭")
+        future = Future()
+        self._jobs.put((address, message, future))
+        return future
+
+    def sign_many(self, jobs: Iterable[Tuple[str, str]]) -> List[Future]:
+        """批量提交 (地址, 消息)，返回对应的 Future 列表"""
+        return [self.submit(address, message) for address, message in jobs]
+
+    def _dispatch_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            # 短暂等待，把同时发起的签名攒成一批，减少进程间往返
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._jobs.get(timeout=self.linger)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._send(batch)
+            if stop:
+                break
+
+    def _send(self, batch: list):
+        # 调用方已取消的任务不再签名
+        pending = [job for job in batch if job[2].set_running_or_notify_cancel()]
+        if not pending:
+            return
+        jobs = [(address, message) for address, message, _ in pending]
+        futures = [future for _, _, future in pending]
+        try:
+            batch_future = self._executor.submit(sign_batch, jobs)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def distribute(done: concurrent.futures.Future):
+            try:
+                results = done.result()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, (ok, value) in zip(futures, results):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(Exception(f"签名失败: {value}"))
+
+        batch_future.add_done_callback(distribute)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._dispatcher is not None:
+            self._jobs.put(None)
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown()
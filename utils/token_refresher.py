@@ -0,0 +1,128 @@
+import threading
+import time
+import concurrent.futures
+from typing import Callable, ContextManager, Dict, Optional, Tuple
+
+from utils.logger_utils import logger
+
+
+class TokenRefreshPlanner:
+    """
+    hp_token 提前续期
+
+    按数据库中带索引的 hp_token_exp 列查询“未来 horizon 秒内过期”的账号，
+    在领取窗口开启前后台重新登录，领取高峰时每个账号只需调用一次 claim()
+
+    Args:
+        db: AccountDatabase 实例
+        client_factory: 传入账号返回上下文管理器的函数，进入时得到 API 客户端（需提供 login(stored_token=...)），
+            退出时归还客户端占用的会话和代理
+        horizon: 续期提前量（秒）
+        batch_size: 每轮最多续期的账号数
+        workers: 并发登录数
+        retry_after: 续期失败的账号在多少秒内不再重试
+        account_filter: 只续期返回 True 的账号（多节点分片时只续期本节点的账号）
+    """
+
+    def __init__(
+        self,
+        db,
+        client_factory: Callable[[dict], ContextManager],
+        horizon: int = 12 * 3600,
+        batch_size: int = 100,
+        workers: int = 4,
+        retry_after: int = 600,
+        account_filter: Optional[Callable[[dict], bool]] = None
+    ):
+        self.db = db
+        self.client_factory = client_factory
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self.workers = workers
+        self.retry_after = retry_after
+        self.account_filter = account_filter
+        self._failed_until: Dict[str, float] = {}
+        # 当前一轮 drain 中已续期的账号；token 有效期短于 horizon 时避免重复续期
+        self._refreshed = set()
+        # 当前一轮 drain 的分页游标 (hp_token_exp, address)，每个账号只读一次
+        self._cursor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def plan(self) -> list:
+        """从游标处继续，返回本轮需要续期的账号（跳过仍在失败冷却期、已续期和不属于本节点的账号）"""
+        now = time.time()
+        self._failed_until = {k: v for k, v in self._failed_until.items() if v > now}
+        planned = []
+        while len(planned) < self.batch_size:
+            accounts = self.db.get_expiring_accounts(int(now) + self.horizon, batch_size=self.batch_size,
+                                                     after=self._cursor)
+            if not accounts:
+                break
+            self._cursor = (accounts[-1]['hp_token_exp'], accounts[-1]['address'])
+            planned.extend(
+                a for a in accounts
+                if a['address'] not in self._failed_until and a['address'] not in self._refreshed
+                and (self.account_filter is None or self.account_filter(a))
+            )
+        return planned
+
+    def _refresh_account(self, account: dict) -> bool:
+        try:
+            with self.client_factory(account) as client:
+                client.login(stored_token=account.get('token'))
+            self._refreshed.add(account['address'])
+            return True
+        except Exception as e:
+            logger.error(f"[{account['address']}] token续期失败: {str(e)}")
+            self._failed_until[account['address']] = time.time() + self.retry_after
+            return False
+
+    def refresh_once(self) -> Tuple[int, int]:
+        """
+        执行一轮续期
+
+        Returns:
+            (成功数, 失败数)
+        """
+        accounts = self.plan()
+        if not accounts:
+            return 0, 0
+        success = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for ok in executor.map(self._refresh_account, accounts):
+                success += int(ok)
+        logger.info(f"token续期完成: 成功 {success}, 失败 {len(accounts) - success}")
+        return success, len(accounts) - success
+
+    def drain(self) -> Tuple[int, int]:
+        """反复续期，直到没有需要续期的账号（失败的账号本次不再重试）"""
+        total_success = total_fail = 0
+        self._refreshed = set()
+        self._cursor = None
+        while not self._stop.is_set():
+            success, fail = self.refresh_once()
+            if success + fail == 0:
+                break
+            total_success += success
+            total_fail += fail
+        return total_success, total_fail
+
+    def start(self, interval: float = 300):
+        """后台定期续期"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.drain()
+                except Exception as e:
+                    logger.error(f"token续期出错: {str(e)}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name='token-refresher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
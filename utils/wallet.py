@@ -1,30 +1,65 @@
+from functools import lru_cache
+
 from eth_account.messages import encode_defunct
 from eth_account.account import LocalAccount
 from eth_typing import HexStr
-from mnemonic import Mnemonic
 from eth_account import Account
-from web3 import Web3
-import secrets
 
 # 启用HD钱包功能
 Account.enable_unaudited_hdwallet_features()
 
+
+@lru_cache(maxsize=None)
+def get_mnemonic():
+    """英文助记词对象在所有实例间共享，且只在需要生成助记词时才加载词表"""
+    from mnemonic import Mnemonic
+    return Mnemonic("english")
+
+
+class Signer:
+    """
+    批量签到热路径使用的轻量签名器
+
+    只持有一个解析好的 LocalAccount，签名时不再重复解析私钥；
+    使用 __slots__，大量账号同时在内存中时每个实例只占几个指针
+    """
+    __slots__ = ('_account', 'address', 'private_key')
+
+    def __init__(self, private_key: str):
+        self._account = Account.from_key(private_key)
+        self.address = self._account.address
+        self.private_key = private_key
+
+    def sign_message(self, message: str) -> HexStr:
+        signed_message = self._account.sign_message(encode_defunct(text=message))
+        return HexStr(signed_message.signature.hex())
+
+    def to_account(self) -> LocalAccount:
+        return self._account
+
+
 class EthereumAccountManager:
     def __init__(self, private_key=None):
-        self.mnemo = Mnemonic("english")
         self.address = None
         self.private_key = None
         self.words = None
+        self._account = None
 
         if private_key:
             # 如果提供了私钥，直接用私钥生成账户
             self.private_key = private_key
-            self.address = self.to_account(private_key).address
+            self._account = self.to_account(private_key)
+            self.address = self._account.address
         else:
             # 如果没有私钥，生成助记词、私钥和地址
             self.create_account()
 
+    @property
+    def mnemo(self):
+        return get_mnemonic()
+
     def check_address(self):
+        from web3 import Web3
         checksum_address = Web3.to_checksum_address(self.address)
         return checksum_address
 
@@ -32,23 +67,57 @@ class EthereumAccountManager:
         # 生成助记词
         self.words = self.mnemo.generate(strength=128)
 
-        # 通过助记词生成种子
-        seed = self.mnemo.to_seed(self.words)
-
-        # 使用种子生成以太坊账户
+        # 使用助记词生成以太坊账户
         account = Account.from_mnemonic(self.words)
 
+        self._account = account
         self.address = account.address
         self.private_key = account.key.hex()
 
     def sign_message(self, message: str) -> HexStr:
         if not self.private_key:
             raise ValueError("No account found. Please create an account first.")
-        account = self.to_account(self.private_key)
         message = encode_defunct(text=message)
-        signed_message = account.sign_message(message)
+        signed_message = self._account.sign_message(message)
         return HexStr(signed_message.signature.hex())
 
     def to_account(self, private_key: str) -> LocalAccount:
         # 创建本地账户对象
         return Account.from_key(private_key)
+
+
+if __name__ == '__main__':
+    # 微基准：每个账号的构造和签名开销（旧实现每次构造都加载助记词词表，每次签名都重新解析私钥）
+    import os
+    import sys
+    import time
+    from mnemonic import Mnemonic
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    private_keys = ['0x' + os.urandom(32).hex() for _ in range(n)]
+    message = 'testnet.humanity.org wants you to sign in with your Ethereum account'
+
+    def bench(label, func):
+        start = time.perf_counter()
+        result = func()
+        print(f'{label:<16} {(time.perf_counter() - start) / n * 1e6:10.1f} us/账号')
+        return result
+
+    def legacy_construct():
+        accounts = []
+        for pk in private_keys:
+            Mnemonic("english")
+            accounts.append((Account.from_key(pk).address, pk))
+        return accounts
+
+    def legacy_sign():
+        return [Account.from_key(pk).sign_message(encode_defunct(text=message)).signature.hex()
+                for _, pk in legacy]
+
+    legacy = bench('旧-构造', legacy_construct)
+    before = bench('旧-签名', legacy_sign)
+    signers = bench('Signer-构造', lambda: [Signer(pk) for pk in private_keys])
+    after = bench('Signer-签名', lambda: [s.sign_message(message) for s in signers])
+    assert before == after
+    print(f'Signer 实例大小: {sys.getsizeof(signers[0])} 字节, '
+          f'EthereumAccountManager: {sys.getsizeof(EthereumAccountManager(private_keys[0]).__dict__)} 字节(__dict__)')